@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class BackendConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'backend'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from backend import signals  # noqa: F401
+        from backend.query_inspector import install_query_recorder
+
+        connection_created.connect(install_query_recorder)
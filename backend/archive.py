@@ -0,0 +1,121 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from backend.models import Appointment, AppointmentRollup, ArchivedAppointment
+
+# Columns copied as-is into the archive, including the id
+ARCHIVED_COLUMNS = [field.attname for field in ArchivedAppointment._meta.concrete_fields if field.name != 'archived_at']
+
+
+def archive_cutoff():
+    """
+    Appointments dated before this day are due for archiving.
+    """
+    return timezone.localtime(timezone.now()).date() - timedelta(days=settings.APPOINTMENT_ARCHIVE_AFTER_DAYS)
+
+
+def archive_appointments(cutoff=None, batch_size=None, max_batches=None):
+    """
+    Moves appointments dated before the cutoff into ArchivedAppointment, one transaction per
+    batch, and adds them to AppointmentRollup. Returns the number of appointments archived.
+    """
+    cutoff = cutoff or archive_cutoff()
+    batch_size = batch_size or settings.APPOINTMENT_ARCHIVE_BATCH_SIZE
+
+    archived = batches = 0
+    while max_batches is None or batches < max_batches:
+        with transaction.atomic():
+            batch = list(Appointment.objects
+                         .filter(date__lt=cutoff)
+                         .order_by('pk')
+                         .select_for_update()[:batch_size])
+            if not batch:
+                break
+            ArchivedAppointment.objects.bulk_create(
+                ArchivedAppointment(**{column: getattr(appointment, column) for column in ARCHIVED_COLUMNS})
+                for appointment in batch
+            )
+            _add_to_rollups(batch)
+            Appointment.objects.filter(pk__in=[appointment.pk for appointment in batch]).delete()
+        archived += len(batch)
+        batches += 1
+    return archived
+
+
+def _add_to_rollups(appointments):
+    counts = Counter((appointment.date, appointment.status, appointment.attended) for appointment in appointments)
+    existing = AppointmentRollup.objects.select_for_update().filter(date__in={date for date, _, _ in counts})
+    rollups = {(rollup.date, rollup.status, rollup.attended): rollup for rollup in existing}
+
+    new_rollups = []
+    for key, count in counts.items():
+        if key in rollups:
+            rollups[key].count += count
+        else:
+            date, status, attended = key
+            new_rollups.append(AppointmentRollup(date=date, status=status, attended=attended, count=count))
+    AppointmentRollup.objects.bulk_update(rollups.values(), ['count'])
+    AppointmentRollup.objects.bulk_create(new_rollups)
+
+
+def remove_from_rollups(archived_appointments):
+    """
+    Takes archived appointments that are about to be deleted, e.g. with their user or service,
+    out of AppointmentRollup, so the dashboard totals keep matching the archive.
+    """
+    counts = archived_appointments.order_by().values('date', 'status', 'attended').annotate(total=Count('pk'))
+    dates = set()
+    for row in counts:
+        AppointmentRollup.objects.filter(date=row['date'], status=row['status'], attended=row['attended']).update(
+            count=F('count') - row['total'])
+        dates.add(row['date'])
+    if dates:
+        AppointmentRollup.objects.filter(date__in=dates, count=0).delete()
+
+
+def archived_totals():
+    """
+    Totals of archived appointments, under the keys of the dashboard's appointment stats.
+    """
+    totals = AppointmentRollup.objects.aggregate(
+        all_appointments=Sum('count'),
+        pending_appointments=Sum('count', filter=Q(status='Pending')),
+        approved_appointments=Sum('count', filter=Q(status='Approved')),
+        cancelled_appointments=Sum('count', filter=Q(status='Cancelled')),
+        done_appointments=Sum('count', filter=Q(status='Approved', attended=True)),
+    )
+    return {key: total or 0 for key, total in totals.items()}
+
+
+def approved_totals(trunc, start_date, end_date):
+    """
+    Returns [(period, total)] of approved appointments between the two dates, grouped by
+    trunc (e.g. TruncMonth) and counting archived appointments through their rollups.
+    """
+    totals = Counter()
+    for model, total in ((Appointment, Count('id')), (AppointmentRollup, Sum('count'))):
+        rows = (model.objects
+                .filter(date__range=(start_date, end_date), status='Approved')
+                .annotate(period=trunc('date'))
+                .values('period')
+                .annotate(total=total))
+        for row in rows:
+            totals[row['period']] += row['total']
+    return sorted(totals.items())
+
+
+def appointment_history(user, include_archived=False):
+    """
+    Returns the user's appointments in booking order, with their archived ones first when asked.
+    Archived rows have is_archived set and must not be offered for editing.
+    """
+    appointments = list(Appointment.objects.filter(user=user).select_related('user', 'service').order_by('pk'))
+    if include_archived:
+        archived = ArchivedAppointment.objects.filter(user=user).select_related('user', 'service').order_by('pk')
+        appointments = list(archived) + appointments
+    return appointments
@@ -0,0 +1,33 @@
+from django.contrib.auth.backends import ModelBackend
+
+from backend.models import User
+
+# Columns needed on request.user by the middleware, decorators, views and base templates.
+# Profile fields and token columns are left out and loaded explicitly where they are needed.
+AUTH_USER_FIELDS = [
+    'id',
+    'password',
+    'email',
+    'first_name',
+    'last_name',
+    'is_active',
+    'is_staff',
+    'is_superuser',
+    'email_verified',
+    'consecutive_missed_appointments',
+    'restriction_end_time',
+    'has_agreed_privacy_policy',
+]
+
+
+class DeferredUserBackend(ModelBackend):
+    """
+    Authenticates like ModelBackend, but loads only the auth-relevant columns for each request.
+    """
+
+    def get_user(self, user_id):
+        try:
+            user = User._default_manager.only(*AUTH_USER_FIELDS).get(pk=user_id)
+        except User.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
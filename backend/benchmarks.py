@@ -0,0 +1,162 @@
+import itertools
+import os
+import random
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from django.core.management.base import CommandError
+from django.db import connection, connections, transaction
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from backend.models import MEDICAL_QUESTION_BITS, Appointment, MedicalQuestionnaire, Service, User, medical_yes_mask
+
+# Rows per INSERT when seeding
+SEED_BATCH_SIZE = 10_000
+
+# Database hosts on this machine; anything else may be shared or production data
+LOCAL_DATABASE_HOSTS = ('', 'localhost', '127.0.0.1', '::1')
+
+
+def is_throwaway_database(alias='default'):
+    """
+    True if the database is SQLite or a Postgres on this machine, which commands that write
+    synthetic data may fill. The committed settings point at the production database.
+    """
+    settings_dict = connections[alias].settings_dict
+    return connections[alias].vendor == 'sqlite' or settings_dict.get('HOST', '') in LOCAL_DATABASE_HOSTS
+
+
+@contextmanager
+def benchmark_database():
+    """
+    Runs the block against a throwaway test database, so benchmarks never touch real data.
+    Raises CommandError unless the configured server is itself a throwaway one: the test
+    database is created next to the real one, and an existing one is dropped without asking.
+    """
+    if not is_throwaway_database():
+        raise CommandError('Refusing to create a benchmark database outside a local database server; '
+                           'point DATABASE_HOST at a local Postgres, or use SQLite.')
+
+    # SQLite's default in-memory test database locks whole tables under concurrent writers,
+    # so concurrent benchmarks get a file-backed one instead
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    if connection.vendor == 'sqlite' and not test_settings.get('NAME'):
+        test_settings['NAME'] = os.path.join(tempfile.gettempdir(), 'benchmark_db.sqlite3')
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+class QueryCounter:
+    """
+    Database execute wrapper that counts queries, independent of DEBUG and the queries log.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile of already sorted values, e.g. fraction=0.95 for p95.
+    """
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+# How busy each weekday is, Monday first; Sunday is a half day
+WEEKDAY_WEIGHTS = [1.0, 0.9, 0.9, 1.0, 1.2, 1.4, 0.5]
+
+
+def slot_start_times(date, duration):
+    """
+    Start times of the slots a patient can pick on an empty day, from the clinic's real
+    opening hours and lunch break.
+    """
+    # Imported here: the views import modules the commands using this module do not need
+    from backend.views import compute_available_slots
+
+    return [datetime.strptime(slot['start'], '%I:%M %p').time()
+            for slot in compute_available_slots(date, duration, [])]
+
+
+def seed_synthetic_data(patients=500, services=8, appointments=50_000, years=3, seed=0):
+    """
+    Bulk-inserts a realistic clinic: patients (a tenth never verified their email, a few
+    restricted, most with a questionnaire), services, and appointments spread over `years`
+    of history plus a month of bookings ahead. Past bookings are mostly approved and attended;
+    a few patients book far more often than the rest. Returns the list of patients.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    today = timezone.localtime(now).date()
+    # Continue the numbering so seeding an already seeded database adds new patients
+    first = User.objects.count()
+
+    service_rows = Service.objects.bulk_create(
+        Service(title=f'Service {i + 1}', description='Synthetic service', duration=rng.choice([30, 30, 60, 90]),
+                image='services/synthetic.jpg')
+        for i in range(services)
+    )
+
+    patient_rows = User.objects.bulk_create(
+        User(email=f'patient{i}@example.com', first_name='Patient', last_name=str(i),
+             sex=rng.choice(['Male', 'Female']), email_verified=rng.random() > 0.1,
+             has_agreed_privacy_policy=True, date_joined=now - timedelta(days=rng.randint(0, 365 * years)),
+             restriction_end_time=now + timedelta(hours=12) if rng.random() < 0.01 else None)
+        for i in range(first, first + patients)
+    )
+    question_keys = list(MEDICAL_QUESTION_BITS)
+    MedicalQuestionnaire.objects.bulk_create(
+        MedicalQuestionnaire(user=patient, answers=medical_yes_mask(rng.sample(question_keys, rng.randint(1, 2)))
+                             if rng.random() < 0.2 else 0)
+        for patient in patient_rows if rng.random() < 0.7
+    )
+
+    # Days weighted by weekday, and patients by a long-tailed booking frequency
+    days = [today + timedelta(days=offset) for offset in range(-365 * years, 31)]
+    day_weights = list(itertools.accumulate(WEEKDAY_WEIGHTS[day.weekday()] for day in days))
+    patient_weights = list(itertools.accumulate(rng.paretovariate(1.5) for _ in patient_rows))
+
+    # Opening hours only differ between Sundays and other days
+    slot_times = {}
+
+    with transaction.atomic():
+        batch = []
+        for _ in range(appointments):
+            date = rng.choices(days, cum_weights=day_weights)[0]
+            service = rng.choice(service_rows)
+            key = (date.weekday() == 6, service.duration)
+            if key not in slot_times:
+                slot_times[key] = slot_start_times(date, service.duration)
+            start_time = rng.choice(slot_times[key])
+            if date < today:
+                status = rng.choices(['Approved', 'Cancelled', 'Pending'], weights=[70, 25, 5])[0]
+                attended = status == 'Approved' and rng.random() < 0.9
+                missed_counted = status == 'Approved' and not attended
+            else:
+                status = rng.choices(['Approved', 'Pending', 'Cancelled'], weights=[45, 45, 10])[0]
+                attended = missed_counted = False
+            batch.append(Appointment(
+                user=rng.choices(patient_rows, cum_weights=patient_weights)[0], service=service, date=date,
+                start_time=start_time,
+                end_time=(datetime.combine(date, start_time) + timedelta(minutes=service.duration)).time(),
+                status=status, attended=attended, missed_counted=missed_counted,
+                reminder_sent=date < today and status == 'Approved',
+            ))
+            if len(batch) == SEED_BATCH_SIZE:
+                Appointment.objects.bulk_create(batch)
+                batch = []
+        Appointment.objects.bulk_create(batch)
+
+    return patient_rows
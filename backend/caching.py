@@ -0,0 +1,64 @@
+import re
+import time
+
+from django.core.cache import cache
+from django.middleware.csrf import get_token
+
+# How long cached landing page content lives. Versions invalidate it within a process at once;
+# the timeout bounds how stale another process's local cache can get.
+CONTENT_CACHE_TIMEOUT = 60 * 5
+
+# Content sections whose version is bumped whenever their rows change
+SERVICES = 'services'
+GALLERY = 'gallery'
+
+CSRF_INPUT = re.compile(r'(<input type="hidden" name="csrfmiddlewaretoken" value=")[^"]*(">)')
+CSRF_PLACEHOLDER = '__csrf_token__'
+
+
+def _version_key(section):
+    return f'content-version:{section}'
+
+
+def get_content_versions(*sections):
+    """
+    Returns {section: version} for the given sections, starting any missing version.
+    """
+    keys = {_version_key(section): section for section in sections}
+    versions = {keys[key]: version for key, version in cache.get_many(keys).items()}
+    for key, section in keys.items():
+        if section not in versions:
+            # Start from the current time so a version lost to eviction never reuses old keys
+            cache.add(key, time.time_ns(), None)
+            versions[section] = cache.get(key)
+    return versions
+
+
+def bump_content_version(section):
+    """
+    Invalidates every cache entry built from the section's content.
+    """
+    key = _version_key(section)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def landing_page_cache_key():
+    versions = get_content_versions(SERVICES, GALLERY)
+    return f'landing-page:{versions[SERVICES]}:{versions[GALLERY]}'
+
+
+def strip_csrf_tokens(html):
+    """
+    Replaces the per-visitor CSRF tokens in rendered HTML so it can be shared between visitors.
+    """
+    return CSRF_INPUT.sub(rf'\g<1>{CSRF_PLACEHOLDER}\g<2>', html)
+
+
+def insert_csrf_token(request, html):
+    """
+    Fills the placeholders left by strip_csrf_tokens with a token for this visitor.
+    """
+    return html.replace(CSRF_PLACEHOLDER, get_token(request))
@@ -0,0 +1,70 @@
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.db import DEFAULT_DB_ALIAS
+
+from backend.caching import CONTENT_CACHE_TIMEOUT, SERVICES, get_content_versions
+from backend.models import Service
+
+
+class ServiceCatalogue:
+    """
+    In-process copy of every Service, reloaded only when the services content version
+    changes. Checking the version is a cache lookup, so steady-state reads run no query.
+
+    The instances are shared between requests and must be treated as read-only; load a
+    fresh Service from the database before editing one.
+    """
+
+    def __init__(self, max_age=CONTENT_CACHE_TIMEOUT):
+        # Versions only reach this process through the cache; with a per-process cache,
+        # max_age bounds how long a change made by another process goes unseen
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._version = None
+        self._loaded_at = 0.0
+        self._services = {}
+
+    def _is_stale(self, version):
+        return version != self._version or time.monotonic() - self._loaded_at > self.max_age
+
+    def _current(self):
+        version = get_content_versions(SERVICES)[SERVICES]
+        if self._is_stale(version):
+            self._refresh(version)
+        return self._services
+
+    def _refresh(self, version):
+        with self._lock:
+            if self._is_stale(version):
+                # Read before the version is recorded, so a change made meanwhile triggers another reload.
+                # Always from the primary: a lagging replica would pin stale rows to the new version.
+                self._services = {service.pk: service for service in Service.objects.using(DEFAULT_DB_ALIAS)}
+                self._version = version
+                self._loaded_at = time.monotonic()
+
+    def all(self):
+        return list(self._current().values())
+
+    def get(self, pk):
+        """
+        Returns the service with the given primary key. Raises Service.DoesNotExist.
+        """
+        return self._lookup(self._current(), pk)
+
+    async def aget(self, pk):
+        version = get_content_versions(SERVICES)[SERVICES]
+        if self._is_stale(version):
+            await sync_to_async(self._refresh)(version)
+        return self._lookup(self._services, pk)
+
+    @staticmethod
+    def _lookup(services, pk):
+        try:
+            return services[int(pk)]
+        except (KeyError, TypeError, ValueError):
+            raise Service.DoesNotExist(f'Service matching pk={pk!r} does not exist.') from None
+
+
+service_catalogue = ServiceCatalogue()
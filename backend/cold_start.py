@@ -0,0 +1,83 @@
+import logging
+import re
+import time
+from collections import Counter
+
+from django.db import connections
+from django.template.loader import get_template
+from django.urls import get_resolver, reverse
+
+logger = logging.getLogger(__name__)
+
+# Templates of the pages a new visitor lands on, and the bases they extend
+WARM_UP_TEMPLATES = [
+    'frontend_base.html',
+    'client_dashboard.html',
+    'client_login.html',
+    'backend_base.html',
+    'login.html',
+    'dashboard.html',
+]
+
+# A line of `python -X importtime` output: self time and cumulative time in microseconds, then the module
+IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+\d+ \| *(\S+)$')
+
+
+def warm_up():
+    """
+    Does the one-off work a new process would otherwise do during its first request: loads
+    the URLconf and every view module, compiles the common templates, opens the database
+    connection and loads the service catalogue. It never raises: a failed step is logged and
+    skipped, so the process always starts. Returns {step: seconds}.
+    """
+    timings = {}
+    try:
+        for name, step in (('urls', _load_urls), ('templates', _load_templates), ('database', _connect),
+                           ('catalogue', _load_catalogue)):
+            start = time.perf_counter()
+            try:
+                step()
+            except Exception:
+                logger.exception('Warm-up step %r failed.', name)
+            timings[name] = time.perf_counter() - start
+        logger.info('Warmed up in %.1f ms (%s)', sum(timings.values()) * 1000,
+                    ', '.join(f'{name} {seconds * 1000:.1f} ms' for name, seconds in timings.items()))
+    except Exception:
+        # Called while main_system.wsgi is imported, where an exception would stop the process serving
+        logger.exception('Warm-up failed.')
+    return timings
+
+
+def _load_urls():
+    get_resolver().url_patterns
+    # Builds the reverse lookup tables every {% url %} needs
+    reverse('client_dashboard')
+
+
+def _load_templates():
+    for name in WARM_UP_TEMPLATES:
+        get_template(name)
+
+
+def _connect():
+    # Only useful with a CONN_MAX_AGE that lets the first request reuse the connection
+    connections['default'].ensure_connection()
+
+
+def _load_catalogue():
+    # Imported here: the catalogue imports the models
+    from backend.catalogue import service_catalogue
+    service_catalogue.all()
+
+
+def import_times_by_package(importtime_output):
+    """
+    Sums the self time in seconds of every module in `python -X importtime` output by
+    top-level package, e.g. all of cloudinary.* under 'cloudinary'. Returns a Counter.
+    """
+    totals = Counter()
+    for line in importtime_output.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            totals[match.group(2).split('.')[0]] += int(match.group(1)) / 1_000_000
+    return totals
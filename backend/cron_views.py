@@ -1,17 +1,35 @@
+from functools import wraps
+
+from django.conf import settings
 from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.utils import timezone
 from datetime import timedelta
-from .models import Appointment
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
-from django.conf import settings
+from .archive import archive_appointments
+from .models import Appointment, User
+from .emails import send_email
+from django.core.mail import get_connection
+
+
+def cron_secret_required(view):
+    """
+    Lets a request through only with the `Authorization: Bearer <CRON_SECRET>` header Vercel
+    sends with its cron requests. Refuses every request while CRON_SECRET is unset.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        authorization = request.headers.get('Authorization', '')
+        if not settings.CRON_SECRET or not constant_time_compare(authorization, f'Bearer {settings.CRON_SECRET}'):
+            return HttpResponse("Unauthorized.", status=401)
+        return view(request, *args, **kwargs)
+    return wrapper
 
 
 @csrf_exempt
 @require_http_methods(["GET", "POST", "HEAD"])
+@cron_secret_required
 def cancel_unattended_appointments(request):
     if request.method in ['POST', 'GET', 'HEAD']:
         today = timezone.localtime(timezone.now())
@@ -24,26 +42,34 @@ def cancel_unattended_appointments(request):
         )
 
         cancelled_count = 0
-        for appointment in unattended_appointments:
-            appointment.status = 'Cancelled'
-            appointment.save()
-            cancelled_count += 1
-
-            # Send an email notification
-            html_message = render_to_string('appointment_cancellation_email_template.html', {
-                'appointment': appointment
-            })
-            plain_message = strip_tags(html_message)
-
-            send_mail(
-                subject='Appointment Cancellation - Jaylon Dental Clinic',
-                message=plain_message,
-                from_email=settings.EMAIL_HOST_USER,
-                recipient_list=[appointment.user.email],
-                html_message=html_message,
-                fail_silently=False,
-            )
-
-        return HttpResponse(f"Cancelled {cancelled_count} unattended appointments.")
+        # Reuse one SMTP connection for every notification in this run
+        with get_connection() as connection:
+            for appointment in unattended_appointments:
+                appointment.status = 'Cancelled'
+                appointment.save()
+                cancelled_count += 1
+
+                # Send an email notification
+                send_email('appointment_cancellation', {
+                    'appointment': appointment
+                }, [appointment.user.email], connection=connection)
+
+        # Housekeeping: restrictions are evaluated lazily, this only clears stale rows
+        cleared_count = User.objects.clear_expired_restrictions()
+
+        # Bounded, so a large backlog is worked off over several runs
+        archived_count = archive_appointments(max_batches=settings.APPOINTMENT_ARCHIVE_CRON_BATCHES)
+
+        return HttpResponse(f"Cancelled {cancelled_count} unattended appointments. "
+                            f"Cleared {cleared_count} expired restrictions. "
+                            f"Archived {archived_count} old appointments.")
     else:
-        return HttpResponse("This endpoint only accepts GET, POST, and HEAD requests.", status=405)
\ No newline at end of file
+        return HttpResponse("This endpoint only accepts GET, POST, and HEAD requests.", status=405)
+
+
+@csrf_exempt
+@require_http_methods(["GET", "POST", "HEAD"])
+@cron_secret_required
+def purge_expired_tokens(request):
+    cleared_tokens, deleted_users = User.objects.purge_expired_tokens()
+    return HttpResponse(f"Cleared {cleared_tokens} expired tokens and deleted {deleted_users} unverified accounts.")
@@ -0,0 +1,105 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+REPLICA = 'replica'
+
+# Session key holding the time until which the visitor's reports read from the primary
+PINNED_UNTIL_SESSION_KEY = '_replica_pinned_until'
+
+_reporting = ContextVar('replica_reporting', default=False)
+_request_state = ContextVar('replica_request_state', default=None)
+
+
+class _RequestState:
+    # Mutated in place, so writes made in a copied context (e.g. sync_to_async) are still seen
+    def __init__(self, pinned):
+        self.pinned = pinned
+        self.wrote = False
+
+
+@contextmanager
+def replica_reads():
+    """
+    Sends the reads made inside the block to the replica, unless the current visitor wrote
+    recently. Only wrap read-only reporting code: the replica may lag behind the primary.
+    """
+    token = _reporting.set(True)
+    try:
+        yield
+    finally:
+        _reporting.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """
+    Routes reads made inside replica_reads() to the 'replica' database when one is configured.
+    Everything else, and every write, uses 'default'.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not _reporting.get() or REPLICA not in settings.DATABASES:
+            return None
+        state = _request_state.get()
+        if state is not None and (state.pinned or state.wrote):
+            return None
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state.wrote = True
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same data as the primary
+        return True
+
+
+class ReplicaPinningMiddleware:
+    """
+    Gives read-your-writes on top of PrimaryReplicaRouter: after a request writes, the same
+    visitor's reporting reads use the primary for settings.REPLICA_LAG_WINDOW seconds.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if REPLICA not in settings.DATABASES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = self._start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            self._finish(request, token)
+        return response
+
+    async def __acall__(self, request):
+        token = self._start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            self._finish(request, token)
+        return response
+
+    def _start(self, request):
+        pinned_until = request.session.get(PINNED_UNTIL_SESSION_KEY, 0)
+        return _request_state.set(_RequestState(pinned=pinned_until > time.time()))
+
+    def _finish(self, request, token):
+        state = _request_state.get()
+        _request_state.reset(token)
+        if state.wrote:
+            request.session[PINNED_UNTIL_SESSION_KEY] = time.time() + settings.REPLICA_LAG_WINDOW
@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.template.loader import get_template
+
+from backend.metrics import external_call
+
+# Every notification the clinic sends: subject, HTML template and plain text template.
+# Subjects may reference context values with str.format placeholders.
+EMAILS = {
+    'appointment_approval': (
+        'Your Appointment is Approved - Jaylon Dental Clinic',
+        'appointment_approval_email_template.html',
+        'appointment_approval_email_template.txt',
+    ),
+    'appointment_cancellation': (
+        'Appointment Cancellation - Jaylon Dental Clinic',
+        'appointment_cancellation_email_template.html',
+        'appointment_cancellation_email_template.txt',
+    ),
+    'appointment_reminder': (
+        'Appointment Reminder - Jaylon Dental Clinic',
+        'appointment_reminder_email_template.html',
+        'appointment_reminder_email_template.txt',
+    ),
+    'admin_password_reset': (
+        'Reset Your Password - Jaylon Dental Clinic',
+        'admin_password_reset_email_template.html',
+        'admin_password_reset_email_template.txt',
+    ),
+    'password_reset': (
+        'Reset Your Password - Jaylon Dental Clinic',
+        'password_reset_email_template.html',
+        'password_reset_email_template.txt',
+    ),
+    'email_verification': (
+        'Verify Your Email - Jaylon Dental Clinic',
+        'email_verification_template.html',
+        'email_verification_template.txt',
+    ),
+    'contact_form': (
+        'New Contact Form Submission from {name}',
+        'contact_form_email_template.html',
+        'contact_form_email_template.txt',
+    ),
+}
+
+def render_email(email_name, context):
+    """
+    Renders an email and returns its (subject, plain_message, html_message).
+    """
+    subject, html_template_name, text_template_name = EMAILS[email_name]
+    html_message = get_template(html_template_name).render(context)
+    plain_message = get_template(text_template_name).render(context)
+    return subject.format(**context), plain_message, html_message
+
+
+def send_email(email_name, context, recipient_list, connection=None, fail_silently=False):
+    """
+    Renders and sends an email. Pass a shared connection when sending in bulk.
+    """
+    subject, plain_message, html_message = render_email(email_name, context)
+    message = EmailMultiAlternatives(
+        subject=subject,
+        body=plain_message,
+        from_email=settings.EMAIL_HOST_USER,
+        to=recipient_list,
+        connection=connection,
+    )
+    message.attach_alternative(html_message, 'text/html')
+    with external_call('smtp'):
+        return message.send(fail_silently=fail_silently)
@@ -0,0 +1,85 @@
+import os
+from io import BytesIO
+from uuid import uuid4
+
+from django.core.files.base import ContentFile
+
+from backend.metrics import external_call
+
+# Widths of the derivatives generated for every uploaded image
+VARIANT_WIDTHS = (320, 640, 1280)
+VARIANT_FORMAT = 'WEBP'
+VARIANT_QUALITY = 80
+
+
+def build_image_variants(image_file, upload_to, storage):
+    """
+    Decodes an image once and stores a WebP derivative per width in VARIANT_WIDTHS that
+    is smaller than the original. Returns (width, height, variants) where each variant
+    holds the width, height, storage name and URL needed to render a srcset.
+    """
+    # Imported here: Pillow is only needed for uploads, so it stays off the cold start path
+    from PIL import Image, ImageOps
+
+    image_file.seek(0)
+    with Image.open(image_file) as source:
+        image = ImageOps.exif_transpose(source)
+        image.load()
+    image_file.seek(0)
+
+    width, height = image.size
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+    # Always produce at least one derivative, even for images narrower than every target
+    targets = [target for target in VARIANT_WIDTHS if target < width] or [width]
+
+    stem = uuid4().hex
+    variants = []
+    for target in targets:
+        variant = image.resize((target, max(1, round(height * target / width))), Image.LANCZOS)
+        buffer = BytesIO()
+        variant.save(buffer, VARIANT_FORMAT, quality=VARIANT_QUALITY, method=4)
+
+        with external_call('storage'):
+            name = storage.save(os.path.join(upload_to, 'variants', f'{stem}-{target}w.webp'),
+                                ContentFile(buffer.getvalue()))
+        variants.append({
+            'width': variant.width,
+            'height': variant.height,
+            'name': name,
+            'url': storage.url(name),
+        })
+
+    return width, height, variants
+
+
+def delete_image_variants(variants, storage):
+    for variant in variants:
+        storage.delete(variant['name'])
+
+
+def process_image_upload(upload, field):
+    """
+    Checks that an uploaded file decodes as an image, builds its derivatives and stores the
+    original through the field's storage. Returns the field values for a new row, ready for
+    bulk_create. Raises ValueError if the file is not a usable image.
+    """
+    from PIL import Image
+
+    try:
+        with Image.open(upload) as image:
+            image.verify()
+    except Exception as e:
+        raise ValueError('The file is not a valid image.') from e
+
+    width, height, variants = build_image_variants(upload, field.upload_to, field.storage)
+    upload.seek(0)
+    with external_call('storage'):
+        name = field.storage.save(field.generate_filename(None, upload.name), upload, max_length=field.max_length)
+    return {
+        field.name: name,
+        f'{field.name}_width': width,
+        f'{field.name}_height': height,
+        f'{field.name}_variants': variants,
+    }
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from backend.archive import archive_appointments, archive_cutoff
+
+
+class Command(BaseCommand):
+    help = 'Moves appointments older than APPOINTMENT_ARCHIVE_AFTER_DAYS into the archive table, in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Appointments moved per transaction.')
+        parser.add_argument('--max-batches', type=int, help='Stop after this many batches.')
+
+    def handle(self, *args, **options):
+        cutoff = archive_cutoff()
+        archived = archive_appointments(cutoff, batch_size=options['batch_size'], max_batches=options['max_batches'])
+        self.stdout.write(f'Archived {archived} appointments dated before {cutoff}.')
@@ -0,0 +1,299 @@
+import json
+import random
+import secrets
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from itertools import groupby
+from urllib.parse import urljoin, urlparse
+
+import requests
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+
+from backend.benchmarks import is_throwaway_database, percentile
+from backend.models import Appointment, Service, User
+from backend.recaptcha_stub import make_stub_server
+
+PATIENT_EMAIL = 'loadtest-patient-{}@example.com'
+ADMIN_EMAIL = 'loadtest-admin-{}@example.com'
+
+# Backends that never deliver mail; approvals send an email per booking
+SAFE_EMAIL_BACKENDS = (
+    'django.core.mail.backends.console.EmailBackend',
+    'django.core.mail.backends.locmem.EmailBackend',
+    'django.core.mail.backends.dummy.EmailBackend',
+    'django.core.mail.backends.filebased.EmailBackend',
+)
+
+STEPS = ['client_dashboard', 'availability', 'book', 'admin_dashboard', 'approve']
+PERCENTILES = [('p50', 0.5), ('p95', 0.95), ('p99', 0.99)]
+
+
+class Command(BaseCommand):
+    help = 'Load tests the booking flow against a running local server: patients load the client dashboard, ' \
+           'look up availability and book a free slot while admins approve pending bookings. Reports ' \
+           'throughput, latency percentiles and error and double-booking rates per step. Start the server ' \
+           'with the same settings and environment as this command, a local database, an email backend that ' \
+           'delivers nothing and RECAPTCHA_VERIFY_URL=http://127.0.0.1:<--stub-port>/, e.g. ' \
+           '`DATABASE_HOST=localhost EMAIL_BACKEND=django.core.mail.backends.console.EmailBackend ' \
+           'RECAPTCHA_VERIFY_URL=http://127.0.0.1:8765/ python manage.py runserver --noreload`.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000/', help='Address of the local server.')
+        parser.add_argument('--patients', type=int, default=20, help='Concurrent patients.')
+        parser.add_argument('--admins', type=int, default=1, help='Concurrent admins approving bookings.')
+        parser.add_argument('--iterations', type=int, default=10, help='Bookings each patient attempts.')
+        parser.add_argument('--days', type=int, default=7, help='Book within this many days from tomorrow.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; the same seed repeats the same run.')
+        parser.add_argument('--stub-port', type=int, default=8765,
+                            help='Port of the reCAPTCHA stub this command starts; 0 to use one already running.')
+        parser.add_argument('--verify-delay', type=float, default=0, help='Seconds the reCAPTCHA stub takes.')
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+        parser.add_argument('--max-error-rate', type=float,
+                            help='Fail when the share of failed requests is above this, e.g. 0.01 in CI.')
+
+    def handle(self, *args, **options):
+        if not is_throwaway_database():
+            raise CommandError('Refusing to create load test accounts outside a local database; '
+                               'point DATABASE_HOST at a local Postgres, or use SQLite.')
+        if settings.EMAIL_BACKEND not in SAFE_EMAIL_BACKENDS:
+            raise CommandError('Refusing to run with an email backend that delivers mail; set EMAIL_BACKEND to '
+                               'the console or locmem backend here and for the server under test.')
+        if urlparse(options['base_url']).hostname not in ('127.0.0.1', 'localhost'):
+            raise CommandError('Only run load tests against a local server.')
+
+        self.base_url = options['base_url']
+        self.days = options['days']
+        services = list(Service.objects.values_list('pk', flat=True))
+        if not services:
+            raise CommandError('There are no services to book; seed some with `manage.py seed_data`.')
+
+        # A fresh password every run, so the accounts are never left with a known one
+        self.password = secrets.token_urlsafe(16)
+        patients, admins = self.prepare_accounts(options['patients'], options['admins'])
+
+        stub = None
+        if options['stub_port']:
+            stub = make_stub_server(options['stub_port'], options['verify_delay'])
+            threading.Thread(target=stub.serve_forever, daemon=True).start()
+        try:
+            patient_sessions = [self.log_in(reverse('client_login'), user.email) for user in patients]
+            admin_sessions = [self.log_in(reverse('login'), user.email) for user in admins]
+            results, elapsed = self.run(patient_sessions, admin_sessions, services, options)
+        finally:
+            if stub is not None:
+                stub.shutdown()
+                stub.server_close()
+
+        report = self.summarize(results, elapsed, patients)
+        self.print_report(report)
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2)
+            self.stdout.write(f'\nResults written to {options["output"]}.')
+
+        if options['max_error_rate'] is not None and report['error_rate'] > options['max_error_rate']:
+            raise CommandError(f'Error rate {report["error_rate"]:.2%} is above {options["max_error_rate"]:.2%}.')
+
+    def prepare_accounts(self, patient_count, admin_count):
+        # Every run starts from the same state: the accounts exist, unrestricted and without bookings
+        patients = [self.account(PATIENT_EMAIL.format(i), superuser=False) for i in range(patient_count)]
+        admins = [self.account(ADMIN_EMAIL.format(i), superuser=True) for i in range(admin_count)]
+        # Hash once for every account; hashing per account would dominate the setup
+        User.objects.filter(pk__in=[user.pk for user in patients + admins]).update(
+            password=make_password(self.password))
+        Appointment.objects.filter(user__in=patients).delete()
+        User.objects.filter(pk__in=[user.pk for user in patients]).update(
+            restriction_end_time=None, consecutive_missed_appointments=0)
+        return patients, admins
+
+    @staticmethod
+    def account(email, superuser):
+        user = User.objects.filter(email=email).first()
+        if user is not None:
+            return user
+        # The password is set for every account afterwards
+        if superuser:
+            return User.objects.create_superuser(email=email, password=None)
+        return User.objects.create_user(email=email, password=None, email_verified=True,
+                                        has_agreed_privacy_policy=True)
+
+    def log_in(self, path, email):
+        session = requests.Session()
+        url = urljoin(self.base_url, path)
+        # The login page sets the CSRF cookie the form post needs
+        session.get(url).raise_for_status()
+        response = session.post(url, data={'email': email, 'password': self.password},
+                                headers=self.csrf_headers(session, url), allow_redirects=False)
+        if response.status_code != 302 or urlparse(response.headers['Location']).path == path:
+            raise CommandError(f'Could not log in as {email}; is the server using the same database?')
+        return session
+
+    @staticmethod
+    def csrf_headers(session, referer):
+        return {'X-CSRFToken': session.cookies.get('csrftoken', ''), 'Referer': referer}
+
+    def run(self, patient_sessions, admin_sessions, services, options):
+        patients_done = threading.Event()
+        # The verifier turns reused tokens down, so tokens must not repeat across runs
+        run_id = uuid.uuid4().hex[:8]
+
+        def patient(index, session):
+            rng = random.Random(options['seed'] * 1_000_003 + index)
+            results = {step: [] for step in STEPS}
+            for iteration in range(options['iterations']):
+                self.book(session, rng, services, f'load-{run_id}-{index}-{iteration}', results)
+            return results
+
+        def admin(index, session):
+            rng = random.Random(options['seed'] * 1_000_003 - index - 1)
+            results = {step: [] for step in STEPS}
+            try:
+                while not patients_done.is_set():
+                    if not self.approve(session, rng, results):
+                        time.sleep(0.05)
+            finally:
+                # Admin threads query the database directly, so close their connections
+                connection.close()
+            return results
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(patient_sessions) + len(admin_sessions)) as pool:
+            admin_futures = [pool.submit(admin, index, session)
+                             for index, session in enumerate(admin_sessions)]
+            patient_futures = [pool.submit(patient, index, session) for index, session in enumerate(patient_sessions)]
+            try:
+                results = [future.result() for future in patient_futures]
+            finally:
+                patients_done.set()
+            results += [future.result() for future in admin_futures]
+        return results, time.perf_counter() - start
+
+    def timed(self, results, step, send, ok):
+        start = time.perf_counter()
+        try:
+            response = send()
+        except requests.RequestException:
+            results[step].append((time.perf_counter() - start, False))
+            return None
+        results[step].append((time.perf_counter() - start, ok(response)))
+        return response
+
+    def book(self, session, rng, services, token, results):
+        dashboard_url = urljoin(self.base_url, reverse('client_dashboard'))
+        self.timed(results, 'client_dashboard', lambda: session.get(dashboard_url), lambda r: r.status_code == 200)
+
+        service = rng.choice(services)
+        date = (timezone.localtime(timezone.now()) + timedelta(days=rng.randint(1, self.days))).date().isoformat()
+        response = self.timed(
+            results, 'availability',
+            lambda: session.get(urljoin(self.base_url, reverse('client_get_available_time_slots')),
+                                params={'service_id': service, 'date': date}),
+            lambda r: r.status_code == 200)
+        if response is None or response.status_code != 200:
+            return
+        slots = response.json()['available_slots']
+        if not slots:
+            return
+
+        slot = rng.choice(slots)
+        data = {'service': service, 'date': date, 'time_slot': f'{slot["start"]} - {slot["end"]}',
+                'g-recaptcha-response': token}
+        # Accepted bookings redirect back to the dashboard, anything else to the login page
+        self.timed(
+            results, 'book',
+            lambda: session.post(urljoin(self.base_url, reverse('client_book_appointment')), data=data,
+                                 headers=self.csrf_headers(session, dashboard_url), allow_redirects=False),
+            lambda r: r.status_code == 302 and urlparse(r.headers['Location']).path == reverse('client_dashboard'))
+
+    def approve(self, session, rng, results):
+        dashboard_url = urljoin(self.base_url, reverse('dashboard'))
+        self.timed(results, 'admin_dashboard', lambda: session.get(dashboard_url), lambda r: r.status_code == 200)
+
+        pending = list(Appointment.objects
+                       .filter(user__email__startswith='loadtest-patient-', status='Pending')
+                       .order_by('pk')
+                       .values_list('pk', flat=True)[:20])
+        if not pending:
+            return False
+        url = urljoin(self.base_url, reverse('update_appointment_status', args=[rng.choice(pending)]))
+        self.timed(results, 'approve',
+                   lambda: session.post(url, data={'status': 'Approved'},
+                                        headers=self.csrf_headers(session, dashboard_url), allow_redirects=False),
+                   lambda r: r.status_code == 302)
+        return True
+
+    def summarize(self, results, elapsed, patients):
+        steps = {}
+        for step in STEPS:
+            samples = [sample for result in results for sample in result[step]]
+            if not samples:
+                continue
+            latencies = sorted(latency * 1000 for latency, _ in samples)
+            errors = sum(1 for _, ok in samples if not ok)
+            steps[step] = {'requests': len(samples), 'errors': errors,
+                           **{name: percentile(latencies, fraction) for name, fraction in PERCENTILES}}
+
+        total = sum(step['requests'] for step in steps.values())
+        errors = sum(step['errors'] for step in steps.values())
+        # A rejected reCAPTCHA also redirects to the dashboard, so compare accepted posts with the rows created
+        book = steps.get('book', {'requests': 0, 'errors': 0})
+        rejected = max(0, book['requests'] - book['errors'] - Appointment.objects.filter(user__in=patients).count())
+        errors += rejected
+        booked, conflicts = self.conflicts(patients)
+        return {
+            'elapsed_s': elapsed,
+            'requests': total,
+            'throughput_rps': total / elapsed,
+            'bookings': booked,
+            'bookings_per_s': booked / elapsed,
+            'rejected_bookings': rejected,
+            'error_rate': errors / total if total else 0,
+            'conflicts': conflicts,
+            'conflict_rate': conflicts / booked if booked else 0,
+            'steps': steps,
+        }
+
+    @staticmethod
+    def conflicts(patients):
+        """
+        Counts the patients' active bookings, and those overlapping another active booking on the same day.
+        """
+        dates = Appointment.objects.filter(user__in=patients).values('date')
+        active = (Appointment.objects
+                  .filter(date__in=dates, status__in=['Pending', 'Approved'])
+                  .order_by('date', 'start_time')
+                  .values_list('pk', 'user_id', 'date', 'start_time', 'end_time'))
+        patient_ids = {user.pk for user in patients}
+
+        booked = overlapping = 0
+        for _, day in groupby(active, key=lambda row: row[2]):
+            day = list(day)
+            for pk, user_id, _, start, end in day:
+                if user_id not in patient_ids:
+                    continue
+                booked += 1
+                if any(other[0] != pk and other[3] < end and start < other[4] for other in day):
+                    overlapping += 1
+        return booked, overlapping
+
+    def print_report(self, report):
+        self.stdout.write(f'{"step":<18}{"requests":>10}{"errors":>8}' +
+                          ''.join(f'{name + " (ms)":>12}' for name, _ in PERCENTILES))
+        for step, measured in report['steps'].items():
+            self.stdout.write(f'{step:<18}{measured["requests"]:>10}{measured["errors"]:>8}' +
+                              ''.join(f'{measured[name]:>12.1f}' for name, _ in PERCENTILES))
+        self.stdout.write(f'\n{report["requests"]} requests in {report["elapsed_s"]:.1f}s '
+                          f'({report["throughput_rps"]:.1f} req/s), {report["bookings"]} bookings '
+                          f'({report["bookings_per_s"]:.1f}/s)')
+        self.stdout.write(f'Error rate {report["error_rate"]:.2%} ({report["rejected_bookings"]} bookings rejected), '
+                          f'double-booked {report["conflicts"]} '
+                          f'({report["conflict_rate"]:.2%} of bookings)')
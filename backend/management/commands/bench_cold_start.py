@@ -0,0 +1,126 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.cold_start import import_times_by_package
+
+# Runs in a fresh interpreter: imports the WSGI module the way the serverless runtime does,
+# then sends each URL twice and prints the timings as JSON
+CHILD = '''
+import io, json, sys, time
+
+start = time.perf_counter()
+from main_system.wsgi import application
+results = {'import_s': time.perf_counter() - start, 'requests': []}
+
+for url in sys.argv[1:]:
+    path, _, query = url.partition('?')
+    timings, statuses = [], []
+    for _ in range(2):
+        environ = {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+            'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'HTTP_HOST': 'localhost',
+            'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+            'wsgi.multithread': False, 'wsgi.multiprocess': True, 'wsgi.run_once': False,
+        }
+        started = time.perf_counter()
+        body = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+        b''.join(body)
+        body.close()
+        timings.append(time.perf_counter() - started)
+    results['requests'].append({'url': url, 'status': statuses[0], 'first_s': timings[0], 'second_s': timings[1]})
+
+print(json.dumps(results))
+'''
+
+
+class Command(BaseCommand):
+    help = 'Measures cold starts: starts fresh processes that import main_system.wsgi and serve each URL twice, ' \
+           'with and without the warm-up routine, and reports median import, first request and second request ' \
+           'times, then the packages that take longest to import.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='*', default=['/', '/login/', '/admin/login/'],
+                            help='URLs to request, in order, in every process.')
+        parser.add_argument('--repeat', type=int, default=5, help='Processes per mode.')
+        parser.add_argument('--top', type=int, default=15, help='Packages to list by import time.')
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+
+    def handle(self, *args, **options):
+        urls = options['urls']
+        modes = {'without warm-up': 'false', 'with warm-up': 'true'}
+        runs = {mode: [] for mode in modes}
+        # Alternate the modes so drift on the machine affects both alike
+        for _ in range(options['repeat']):
+            for mode, warm_up in modes.items():
+                runs[mode].append(self.run_child(urls, warm_up))
+
+        results = {mode: self.medians(mode_runs, urls) for mode, mode_runs in runs.items()}
+        self.print_table(results)
+
+        import_times = self.import_times(urls)
+        self.stdout.write(f'\n{"package":<28}{"import (ms)":>12}')
+        for package, seconds in import_times.most_common(options['top']):
+            self.stdout.write(f'{package:<28}{seconds * 1000:>12.1f}')
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump({'urls': urls, 'modes': results, 'import_times_s': dict(import_times.most_common())},
+                          file, indent=2)
+            self.stdout.write(f'\nResults written to {options["output"]}.')
+
+    def run_child(self, urls, warm_up, *python_options):
+        env = {**os.environ, 'WARM_UP_ON_START': warm_up}
+        start = time.perf_counter()
+        process = subprocess.run([sys.executable, *python_options, '-c', CHILD, *urls], cwd=settings.BASE_DIR,
+                                 env=env, capture_output=True, text=True)
+        wall = time.perf_counter() - start
+        if process.returncode:
+            raise CommandError(f'The cold start process failed:\n{process.stderr}')
+        result = json.loads(process.stdout.splitlines()[-1])
+        result['process_s'] = wall
+        result['stderr'] = process.stderr
+        return result
+
+    @staticmethod
+    def medians(runs, urls):
+        def median_ms(values):
+            return statistics.median(values) * 1000
+
+        result = {
+            'process_ms': median_ms([run['process_s'] for run in runs]),
+            'import_ms': median_ms([run['import_s'] for run in runs]),
+            # What the first visitor waits for once the interpreter is up
+            'first_response_ms': median_ms([run['import_s'] + run['requests'][0]['first_s'] for run in runs]),
+            'requests': {},
+        }
+        for i, url in enumerate(urls):
+            result['requests'][url] = {
+                'status': runs[0]['requests'][i]['status'],
+                'first_ms': median_ms([run['requests'][i]['first_s'] for run in runs]),
+                'second_ms': median_ms([run['requests'][i]['second_s'] for run in runs]),
+            }
+        return result
+
+    def print_table(self, results):
+        modes = list(results)
+        self.stdout.write(f'{"median (ms)":<40}' + ''.join(f'{mode:>18}' for mode in modes))
+        rows = [('process, including interpreter', lambda r: r['process_ms']),
+                ('import main_system.wsgi', lambda r: r['import_ms']),
+                ('import + first request', lambda r: r['first_response_ms'])]
+        for url in results[modes[0]]['requests']:
+            rows.append((f'{url} first request', lambda r, url=url: r['requests'][url]['first_ms']))
+            rows.append((f'{url} second request', lambda r, url=url: r['requests'][url]['second_ms']))
+        for label, value in rows:
+            self.stdout.write(f'{label:<40}' + ''.join(f'{value(results[mode]):>18.1f}' for mode in modes))
+
+    def import_times(self, urls):
+        # One more process with import timing on, which slows imports down, so it is kept out of the table
+        result = self.run_child(urls, 'true', '-X', 'importtime')
+        return import_times_by_package(result['stderr'])
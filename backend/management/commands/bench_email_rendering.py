@@ -0,0 +1,53 @@
+import timeit
+from datetime import date, time
+
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from django.utils.html import strip_tags
+
+from backend.emails import EMAILS, render_email
+from backend.models import Appointment, Service, User
+
+
+class Command(BaseCommand):
+    help = 'Compares render_to_string + strip_tags against the pre-compiled email rendering service.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=1000, help='Renders per email per run.')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per email; the best run is reported.')
+
+    def handle(self, *args, **options):
+        number = options['number']
+        repeat = options['repeat']
+
+        # Unsaved instances are enough for rendering, so no database is needed
+        user = User(first_name='Juan', last_name='Dela Cruz', email='juan@example.com')
+        service = Service(title='Tooth Extraction', duration=60)
+        appointment = Appointment(user=user, service=service, date=date(2024, 10, 1),
+                                  start_time=time(9, 0), end_time=time(10, 0))
+        context = {
+            'user': user,
+            'appointment': appointment,
+            'appointment_details_link': 'https://example.com/',
+            'reset_link': 'https://example.com/reset-password/token/',
+            'verification_link': 'https://example.com/verify-email/token/',
+            'name': user.first_name,
+            'email': user.email,
+            'message': 'Hello, I would like to ask about your clinic hours.',
+        }
+
+        def current_path(html_template_name):
+            html_message = render_to_string(html_template_name, context)
+            strip_tags(html_message)
+
+        self.stdout.write(f'{"email":<26}{"current (ms)":>14}{"service (ms)":>14}{"speedup":>10}')
+        for email_name, (subject, html_template_name, text_template_name) in EMAILS.items():
+            # Warm up both paths so template loading is not measured
+            current_path(html_template_name)
+            render_email(email_name, context)
+
+            current = min(timeit.repeat(lambda: current_path(html_template_name),
+                                        number=number, repeat=repeat)) / number * 1000
+            service = min(timeit.repeat(lambda: render_email(email_name, context),
+                                        number=number, repeat=repeat)) / number * 1000
+            self.stdout.write(f'{email_name:<26}{current:>14.3f}{service:>14.3f}{current / service:>9.1f}x')
@@ -0,0 +1,128 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, models
+from django.db.models import Count, Q
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from backend.benchmarks import benchmark_database, seed_synthetic_data
+from backend.models import Appointment, User
+from backend.views import SCREENING_FLAGS, get_screening_appointments
+
+# The appointment indexes this set replaced, recreated for the "before" measurements
+BASELINE_INDEXES = [
+    models.Index(fields=['date', 'start_time', 'status', 'reminder_sent'], name='backend_app_date_af5a3b_idx'),
+    models.Index(fields=['date', 'user'], condition=Q(status__in=['Pending', 'Approved']),
+                 name='appointment_active_date_idx'),
+]
+
+
+class Command(BaseCommand):
+    help = 'Seeds an appointment table in a throwaway test database on a local server and reports the query ' \
+           'plan and latency of the hot queries with the previous index set against the current one.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--appointments', type=int, default=50_000,
+                            help='Appointments to seed; try 1000000 on a local PostgreSQL for production-like plans.')
+        parser.add_argument('--users', type=int, default=1_000, help='Patients to seed.')
+        parser.add_argument('--repeat', type=int, default=20, help='Runs per query; the median latency is reported.')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            # psycopg2 inlines parameters, so PostgreSQL plans against the actual values
+            self.stderr.write('SQLite cannot match partial index conditions written as IN lists against bound '
+                              'parameters; run this against PostgreSQL for the production plans.')
+        with benchmark_database():
+            self.stdout.write(f'Seeding {options["users"]} patients and {options["appointments"]} appointments...')
+            patient = seed_synthetic_data(patients=options['users'], appointments=options['appointments'])[0]
+            self.analyze()
+            queries = self.hot_queries(patient)
+
+            current = self.measure(queries, options['repeat'])
+            self.swap_indexes(remove=self.current_indexes(), add=BASELINE_INDEXES)
+            before = self.measure(queries, options['repeat'])
+
+            self.stdout.write(f'\n{"query":<24}{"before (ms)":>14}{"after (ms)":>14}')
+            for label in queries:
+                self.stdout.write(f'{label:<24}{before[label][0]:>14.2f}{current[label][0]:>14.2f}')
+
+            for label in queries:
+                self.stdout.write(f'\n{label}')
+                for config, results in (('before', before), ('after', current)):
+                    self.stdout.write(f'  {config}:')
+                    for line in results[label][1].splitlines():
+                        self.stdout.write(f'    {line}')
+
+    def hot_queries(self, patient):
+        """
+        The filters of the hot paths, spelled as the views and crons spell them.
+        """
+        now = timezone.localtime(timezone.now())
+        today = now.date()
+        cutoff = timezone.now() - timedelta(days=1)
+        return {
+            'availability': lambda: (Appointment.objects
+                                     .filter(date=today, status__in=['Pending', 'Approved'])
+                                     .order_by('start_time')
+                                     .values_list('start_time', 'end_time')),
+            'missed check': lambda: (Appointment.objects
+                                     .filter(Q(date__lt=today) | Q(date=today, end_time__lt=now.time()),
+                                             user=patient, attended=False, status='Approved',
+                                             missed_counted=False)
+                                     .values_list('pk')),
+            'unattended cron': lambda: Appointment.objects.filter(status='Approved', attended=False,
+                                                                  date=today - timedelta(days=1)),
+            'monthly chart': lambda: (Appointment.objects
+                                      .filter(date__gte=today - timedelta(days=365), status='Approved')
+                                      .annotate(month=TruncMonth('date'))
+                                      .values('month')
+                                      .annotate(total=Count('id'))
+                                      .order_by('month')),
+            'screening': lambda: get_screening_appointments(today, today + timedelta(days=14),
+                                                            [key for key, _, _ in SCREENING_FLAGS]),
+            'unverified purge': lambda: User.objects.filter(
+                Q(verification_token_created__lt=cutoff) |
+                Q(verification_token_created__isnull=True, date_joined__lt=cutoff),
+                email_verified=False, is_superuser=False,
+            ).values_list('pk'),
+            'lapsed restrictions': lambda: User.objects.filter(restriction_end_time__lte=timezone.now())
+                                                       .values_list('pk'),
+        }
+
+    def measure(self, queries, repeat):
+        """
+        Returns {label: (median latency in ms, query plan)}.
+        """
+        results = {}
+        for label, build in queries.items():
+            plan = build().explain()
+            list(build())  # Warm the page cache before measuring
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                list(build())
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            results[label] = (timings[len(timings) // 2], plan)
+        return results
+
+    @staticmethod
+    def current_indexes():
+        return [(Appointment, index) for index in Appointment._meta.indexes] + \
+               [(User, index) for index in User._meta.indexes]
+
+    def swap_indexes(self, remove, add):
+        with connection.schema_editor() as editor:
+            for model, index in remove:
+                editor.remove_index(model, index)
+            for index in add:
+                editor.add_index(Appointment, index)
+        self.analyze()
+
+    @staticmethod
+    def analyze():
+        # Fresh statistics, so the planner judges each index set on the same data
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
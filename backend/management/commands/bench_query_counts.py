@@ -0,0 +1,76 @@
+import time
+from datetime import time as dt_time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from backend.benchmarks import QueryCounter, benchmark_database
+from backend.models import Appointment, GalleryImage, Service, User
+
+# (label, session engine, authentication backend)
+CONFIGURATIONS = [
+    ('before', 'django.contrib.sessions.backends.db', 'django.contrib.auth.backends.ModelBackend'),
+    ('after', 'django.contrib.sessions.backends.signed_cookies', 'backend.auth_backends.DeferredUserBackend'),
+]
+
+
+class Command(BaseCommand):
+    help = 'Reports query counts and latency of the main pages with DB sessions/full user rows against ' \
+           'signed-cookie sessions/deferred user loading.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20, help='Requests per page; the median latency is reported.')
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            admin, patient = self.seed()
+            pages = [
+                ('client_dashboard (anonymous)', None, reverse('client_dashboard')),
+                ('client_dashboard', patient, reverse('client_dashboard')),
+                ('client_profile', patient, reverse('client_profile')),
+                ('dashboard', admin, reverse('dashboard')),
+                ('accounts', admin, reverse('accounts')),
+                ('user_details', admin, reverse('user_details', args=[patient.pk])),
+            ]
+
+            self.stdout.write(f'{"page":<32}{"config":<8}{"queries":>9}{"median (ms)":>14}')
+            for label, user, url in pages:
+                for config, session_engine, auth_backend in CONFIGURATIONS:
+                    with override_settings(SESSION_ENGINE=session_engine, AUTHENTICATION_BACKENDS=[auth_backend]):
+                        queries, latency = self.measure(user, url, options['repeat'])
+                    self.stdout.write(f'{label:<32}{config:<8}{queries:>9}{latency:>14.2f}')
+
+    def seed(self):
+        admin = User.objects.create_superuser(email='admin@example.com', password='password')
+        patient = User.objects.create_user(email='patient@example.com', password='password', first_name='Juan',
+                                           last_name='Dela Cruz', email_verified=True, has_agreed_privacy_policy=True)
+        service = Service.objects.create(title='Cleaning', description='Cleaning', duration=60, image='services/x.jpg')
+        GalleryImage.objects.create(image='gallery/x.jpg')
+        today = timezone.localtime(timezone.now()).date()
+        Appointment.objects.create(user=patient, service=service, date=today, start_time=dt_time(9, 0),
+                                   end_time=dt_time(10, 0), status='Pending')
+        return admin, patient
+
+    def measure(self, user, url, repeat):
+        client = Client()
+        if user is not None:
+            client.force_login(user)
+
+        # Warm up template loading and URL resolving before measuring
+        client.get(url)
+
+        queries = QueryCounter()
+        with connection.execute_wrapper(queries):
+            client.get(url)
+
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            client.get(url)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        return queries.count, timings[len(timings) // 2]
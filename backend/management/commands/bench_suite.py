@@ -0,0 +1,132 @@
+import json
+import subprocess
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from backend.benchmarks import QueryCounter, benchmark_database, percentile, seed_synthetic_data
+from backend.models import Service, User
+
+PERCENTILES = [('p50', 0.5), ('p95', 0.95), ('p99', 0.99)]
+
+
+class Command(BaseCommand):
+    help = 'Times the availability lookup, both dashboards, user_details and the daily cron at several data ' \
+           'sizes and reports query counts and latency percentiles. Save the results with --output and ' \
+           'compare a later run against them with --compare.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000,100000',
+                            help='Comma-separated appointment counts to benchmark at.')
+        parser.add_argument('--repeat', type=int, default=30, help='Requests per endpoint and size.')
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+        parser.add_argument('--compare', help='JSON file of an earlier run to compare the p50 latencies against.')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        results = {'revision': self.revision(), 'sizes': {}}
+
+        for size in sizes:
+            # Per-request instrumentation would add its own overhead to every timing
+            with benchmark_database(), override_settings(QUERY_INSTRUMENTATION=False, CRON_SECRET='benchmark'):
+                # Content versions, the service catalogue and chart data must not leak between sizes
+                cache.clear()
+                self.stdout.write(f'\n{size} appointments')
+                admin, patient = self.seed(size)
+                results['sizes'][str(size)] = self.run_size(admin, patient, options['repeat'])
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(results, file, indent=2)
+            self.stdout.write(f'\nResults written to {options["output"]}.')
+
+        if options['compare']:
+            with open(options['compare']) as file:
+                self.compare(json.load(file), results)
+
+    def seed(self, size):
+        # A clinic's patient base grows with its bookings
+        seed_synthetic_data(patients=max(50, size // 20), appointments=size)
+        admin = User.objects.create_superuser(email='admin@example.com', password='password')
+        # The patient with the most history is the worst case for the per-patient pages
+        patient = (User.objects
+                   .filter(is_superuser=False, email_verified=True, restriction_end_time__isnull=True)
+                   .annotate(appointment_count=Count('appointment'))
+                   .order_by('-appointment_count')
+                   .first())
+        return admin, patient
+
+    def endpoints(self, admin, patient):
+        tomorrow = (timezone.localtime(timezone.now()) + timedelta(days=1)).date().isoformat()
+        service = Service.objects.first()
+        return [
+            ('availability', patient, reverse('client_get_available_time_slots'),
+             {'service_id': service.pk, 'date': tomorrow}),
+            ('dashboard', admin, reverse('dashboard'), {}),
+            ('client_dashboard', patient, reverse('client_dashboard'), {}),
+            ('user_details', admin, reverse('user_details', args=[patient.pk]), {}),
+            # Last: its first run archives the oldest appointments
+            ('cancel_appointments cron', None, '/api/cron/cancel_appointments', {}),
+        ]
+
+    def run_size(self, admin, patient, repeat):
+        self.stdout.write(f'{"endpoint":<28}{"queries":>9}' +
+                          ''.join(f'{name + " (ms)":>12}' for name, _ in PERCENTILES))
+        results = {}
+        for label, user, url, data in self.endpoints(admin, patient):
+            queries, timings = self.measure(user, url, data, repeat)
+            results[label] = {'queries': queries, **{name: percentile(timings, fraction)
+                                                      for name, fraction in PERCENTILES}}
+            self.stdout.write(f'{label:<28}{queries:>9}' + ''.join(f'{results[label][name]:>12.2f}'
+                                                                  for name, _ in PERCENTILES))
+        return results
+
+    def measure(self, user, url, data, repeat):
+        # The cron endpoint wants Vercel's header; the other endpoints ignore it
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {settings.CRON_SECRET}')
+        if user is not None:
+            client.force_login(user)
+
+        # Warm up template loading, URL resolving and the caches before measuring
+        client.get(url, data)
+
+        queries = QueryCounter()
+        with connection.execute_wrapper(queries):
+            client.get(url, data)
+
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            client.get(url, data)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        return queries.count, timings
+
+    def compare(self, baseline, results):
+        self.stdout.write(f'\np50 against {baseline.get("revision") or "the baseline"}')
+        self.stdout.write(f'{"size":>8}  {"endpoint":<28}{"before (ms)":>13}{"after (ms)":>12}{"change":>9}')
+        for size, endpoints in results['sizes'].items():
+            for label, measured in endpoints.items():
+                before = baseline['sizes'].get(size, {}).get(label)
+                if before is None:
+                    continue
+                change = (measured['p50'] - before['p50']) / before['p50'] * 100
+                self.stdout.write(f'{size:>8}  {label:<28}{before["p50"]:>13.2f}{measured["p50"]:>12.2f}'
+                                  f'{change:>+8.1f}%')
+
+    @staticmethod
+    def revision():
+        try:
+            return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
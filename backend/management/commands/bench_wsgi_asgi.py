@@ -0,0 +1,107 @@
+import asyncio
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from backend import recaptcha
+from backend.benchmarks import benchmark_database
+from backend.models import Service, User
+from backend.recaptcha_stub import make_stub_server
+
+
+class Command(BaseCommand):
+    help = 'Load tests the booking and availability endpoints through the WSGI and ASGI handlers, ' \
+           'with reCAPTCHA answered by a local stub that takes --verify-delay seconds.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per handler.')
+        parser.add_argument('--workers', type=int, default=4, help='WSGI worker threads.')
+        parser.add_argument('--concurrency', type=int, default=50, help='Concurrent ASGI requests.')
+        parser.add_argument('--verify-delay', type=float, default=0.2)
+        parser.add_argument('--port', type=int, default=8766)
+
+    def handle(self, *args, **options):
+        server = make_stub_server(options['port'], options['verify_delay'])
+        # The stub turns reused tokens down, so number them across both handlers
+        self.tokens = itertools.count()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        try:
+            with benchmark_database(), override_settings(RECAPTCHA_VERIFY_URL=f'http://127.0.0.1:{options["port"]}/'):
+                # Rebuild the shared client so it picks up the stub address
+                recaptcha._client = None
+
+                self.patient = User.objects.create_user(email='patient@example.com', password='password',
+                                                        email_verified=True, has_agreed_privacy_policy=True)
+                self.service = Service.objects.create(title='Cleaning', description='Cleaning', duration=30,
+                                                      image='services/x.jpg')
+                self.date = (timezone.localtime(timezone.now()) + timedelta(days=1)).date().isoformat()
+
+                self.stdout.write(f'{"handler":<8}{"requests":>10}{"errors":>8}{"req/s":>10}'
+                                  f'{"p50 (ms)":>10}{"p95 (ms)":>10}')
+                self.report('WSGI', *self.run_wsgi(options['requests'], options['workers']))
+
+                # Log in from sync code; force_login writes to the database
+                async_client = AsyncClient(raise_request_exception=False)
+                async_client.force_login(self.patient)
+                self.report('ASGI', *asyncio.run(self.run_asgi(async_client, options['requests'],
+                                                               options['concurrency'])))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def request_args(self, i):
+        # Alternate bookings with availability lookups, using a fresh token per booking
+        if i % 2:
+            return 'get', reverse('client_get_available_time_slots'), {'service_id': self.service.pk,
+                                                                       'date': self.date}
+        return 'post', reverse('client_book_appointment'), {'service': self.service.pk, 'date': self.date,
+                                                            'time_slot': '09:00 AM - 09:30 AM',
+                                                            'g-recaptcha-response': f'token-{next(self.tokens)}'}
+
+    def run_wsgi(self, total, workers):
+        local = threading.local()
+
+        def one(i):
+            if not hasattr(local, 'client'):
+                local.client = Client(raise_request_exception=False)
+                local.client.force_login(self.patient)
+            method, url, data = self.request_args(i)
+            start = time.perf_counter()
+            response = getattr(local.client, method)(url, data)
+            return time.perf_counter() - start, response.status_code >= 400
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(one, range(total)))
+        return results, time.perf_counter() - start
+
+    async def run_asgi(self, client, total, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(i):
+            async with semaphore:
+                method, url, data = self.request_args(i)
+                start = time.perf_counter()
+                response = await getattr(client, method)(url, data)
+                return time.perf_counter() - start, response.status_code >= 400
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one(i) for i in range(total)))
+        return results, time.perf_counter() - start
+
+    def report(self, handler, results, elapsed):
+        latencies = sorted(latency * 1000 for latency, _ in results)
+        errors = sum(1 for _, failed in results if failed)
+        p50 = latencies[len(latencies) // 2]
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        self.stdout.write(f'{handler:<8}{len(results):>10}{errors:>8}{len(results) / elapsed:>10.1f}'
+                          f'{p50:>10.1f}{p95:>10.1f}')
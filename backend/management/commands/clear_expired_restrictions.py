@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from backend.models import User
+
+
+class Command(BaseCommand):
+    help = 'Clears lapsed account restrictions and resets their missed appointment counters.'
+
+    def handle(self, *args, **options):
+        cleared_count = User.objects.clear_expired_restrictions()
+        self.stdout.write(f'Cleared {cleared_count} expired restrictions.')
@@ -0,0 +1,43 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.models import GalleryImage, Service
+from backend.storage import ContentAddressedStorage
+
+
+class Command(BaseCommand):
+    help = 'Deletes content-addressed media files that no gallery image or service references.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only list the files that would be deleted.')
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, ContentAddressedStorage):
+            raise CommandError('Media garbage collection only applies to MEDIA_STORAGE=local.')
+
+        referenced = set()
+        directories = set()
+        for model in (GalleryImage, Service):
+            directories.add(model._meta.get_field('image').upload_to.rstrip('/'))
+            for name, variants in model.objects.values_list('image', 'image_variants'):
+                referenced.add(name)
+                referenced.update(variant['name'] for variant in variants)
+
+        deleted = 0
+        for directory in directories:
+            for name in self.walk(directory):
+                if name not in referenced:
+                    if not options['dry_run']:
+                        default_storage.purge(name)
+                    self.stdout.write(name)
+                    deleted += 1
+        self.stdout.write(f'{"Would delete" if options["dry_run"] else "Deleted"} {deleted} unreferenced files.')
+
+    def walk(self, directory):
+        if not default_storage.exists(directory):
+            return
+        subdirectories, files = default_storage.listdir(directory)
+        for filename in files:
+            yield f'{directory}/{filename}'
+        for subdirectory in subdirectories:
+            yield from self.walk(f'{directory}/{subdirectory}')
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from backend.models import GalleryImage, Service
+
+
+class Command(BaseCommand):
+    help = 'Generates resized derivatives for gallery and service images that do not have them yet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Regenerate derivatives for every image.')
+
+    def handle(self, *args, **options):
+        for model in (GalleryImage, Service):
+            images = model.objects.exclude(image='')
+            if not options['all']:
+                images = images.filter(image_variants=[])
+
+            count = 0
+            for instance in images.iterator():
+                try:
+                    instance.refresh_image_variants()
+                except OSError as e:
+                    # Missing or undecodable originals are reported and skipped
+                    self.stderr.write(f'Skipped {instance.image.name}: {e}')
+                    continue
+                finally:
+                    instance.image.close()
+                instance.save(update_fields=['image_width', 'image_height', 'image_variants'])
+                count += 1
+            self.stdout.write(f'Generated derivatives for {count} {model._meta.verbose_name_plural}.')
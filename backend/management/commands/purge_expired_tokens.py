@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from backend.models import User
+
+
+class Command(BaseCommand):
+    help = 'Clears expired password reset tokens and deletes accounts that never verified their email.'
+
+    def handle(self, *args, **options):
+        cleared_tokens, deleted_users = User.objects.purge_expired_tokens()
+        self.stdout.write(f'Cleared {cleared_tokens} expired tokens and deleted {deleted_users} unverified accounts.')
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from backend.recaptcha_stub import make_stub_server
+
+
+class Command(BaseCommand):
+    help = 'Runs a local stand-in for the reCAPTCHA siteverify endpoint. ' \
+           'Every token verifies once, except "invalid"; "error" returns HTTP 500.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--delay', type=float, default=0, help='Seconds to wait before answering.')
+
+    def handle(self, *args, **options):
+        server = make_stub_server(options['port'], options['delay'])
+        self.stdout.write(f'reCAPTCHA stub listening on http://127.0.0.1:{options["port"]}/ '
+                          f'(set RECAPTCHA_VERIFY_URL to this address)')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.benchmarks import is_throwaway_database, seed_synthetic_data
+
+
+class Command(BaseCommand):
+    help = 'Fills the database with synthetic patients, services and years of appointments for local testing.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=500)
+        parser.add_argument('--services', type=int, default=8)
+        parser.add_argument('--appointments', type=int, default=50_000)
+        parser.add_argument('--years', type=int, default=3, help='Years of appointment history.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; the same seed gives the same data.')
+
+    def handle(self, *args, **options):
+        if not is_throwaway_database():
+            raise CommandError('Refusing to seed synthetic data outside a local database; '
+                               'point DATABASE_HOST at a local Postgres, or use SQLite.')
+
+        patients = seed_synthetic_data(patients=options['patients'], services=options['services'],
+                                       appointments=options['appointments'], years=options['years'],
+                                       seed=options['seed'])
+        self.stdout.write(f'Seeded {len(patients)} patients, {options["services"]} services and '
+                          f'{options["appointments"]} appointments.')
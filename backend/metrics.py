@@ -0,0 +1,324 @@
+import atexit
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import request_finished
+from django.db import DatabaseError, transaction
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET
+
+from backend import server_timing
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds; suits requests and external calls alike
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REGISTRY = {}
+
+# Observations not yet added to the shared totals in the database, by (metric name, labels)
+_pending = {}
+_pending_lock = threading.Lock()
+# Observations in _pending, and when _pending was last emptied
+_pending_count = 0
+_last_flush = time.monotonic()
+_exit_flush_registered = False
+
+# Request methods counted under their own label; anything else is counted as 'other'
+HTTP_METHODS = frozenset({'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'})
+
+
+def _format_labels(labelnames, labels):
+    if set(labels) != set(labelnames):
+        raise ValueError(f'Expected labels {labelnames}, got {tuple(labels)}.')
+    return ','.join(f'{name}="{_escape(labels[name])}"' for name in labelnames)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        REGISTRY[name] = self
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        global _pending_count
+        key = (self.name, _format_labels(self.labelnames, labels))
+        with _pending_lock:
+            _pending[key] = _pending.get(key, 0) + amount
+            _pending_count += 1
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        global _pending_count
+        key = (self.name, _format_labels(self.labelnames, labels))
+        # Non-cumulative counts per bucket, the last one for values above every bound
+        bucket = bisect_left(self.buckets, value)
+        with _pending_lock:
+            _pending_count += 1
+            pending = _pending.get(key)
+            if pending is None:
+                pending = _pending[key] = [0.0, 0, [0] * (len(self.buckets) + 1)]
+            pending[0] += value
+            pending[1] += 1
+            pending[2][bucket] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+
+HTTP_REQUESTS = Counter('http_requests_total', 'Requests handled, by URL name, method and status code.',
+                        ['view', 'method', 'status'])
+HTTP_REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'Time taken to respond, by URL name.', ['view'])
+EXTERNAL_CALL_SECONDS = Histogram('external_call_duration_seconds',
+                                  'Time spent in calls to SMTP, reCAPTCHA and media storage.', ['service'])
+EXTERNAL_CALL_ERRORS = Counter('external_call_errors_total', 'Calls to external services that raised.', ['service'])
+SLOT_COMPUTATION_SECONDS = Histogram('slot_computation_duration_seconds', 'Time to compute the free slots of a day.',
+                                     buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025))
+
+
+def record_external_call(service, duration, failed=False):
+    """
+    Records a call to an external service in the metrics and the request's Server-Timing header.
+    """
+    EXTERNAL_CALL_SECONDS.observe(duration, service=service)
+    if failed:
+        EXTERNAL_CALL_ERRORS.inc(service=service)
+    server_timing.record(service, duration)
+
+
+@contextmanager
+def external_call(service):
+    """
+    Times a call to an external service and counts it as an error if it raises.
+    """
+    start = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except Exception:
+        failed = True
+        raise
+    finally:
+        record_external_call(service, time.perf_counter() - start, failed)
+
+
+def flush():
+    """
+    Adds this process's pending observations to the totals in the database, which every
+    worker process shares. On failure the observations are kept for the next flush.
+    """
+    # Imported here: the models import modules that record metrics
+    from backend.models import MetricSeries
+
+    global _pending, _pending_count, _last_flush
+    with _pending_lock:
+        pending, _pending = _pending, {}
+        _pending_count = 0
+        _last_flush = time.monotonic()
+    if not pending:
+        return
+
+    try:
+        with transaction.atomic():
+            names = {name for name, _ in pending}
+            existing = {(series.name, series.labels): series
+                        for series in MetricSeries.objects.select_for_update().filter(name__in=names)}
+            updated, created = [], []
+            for key, value in pending.items():
+                series = existing.get(key)
+                if series is None:
+                    series = MetricSeries(name=key[0], labels=key[1], value=0, count=0, buckets=[])
+                    created.append(series)
+                else:
+                    updated.append(series)
+                _add_to_series(series, value)
+            MetricSeries.objects.bulk_update(updated, ['value', 'count', 'buckets'])
+            MetricSeries.objects.bulk_create(created)
+    except DatabaseError:
+        logger.exception('Could not flush metrics; keeping them for the next flush.')
+        with _pending_lock:
+            for key, value in pending.items():
+                _merge_pending(key, value)
+
+
+def _add_to_series(series, value):
+    if isinstance(value, list):
+        total, count, buckets = value
+        series.value += total
+        series.count += count
+        series.buckets = [a + b for a, b in zip(series.buckets or [0] * len(buckets), buckets)]
+    else:
+        series.value += value
+
+
+def _merge_pending(key, value):
+    current = _pending.get(key)
+    if current is None:
+        _pending[key] = value
+    elif isinstance(value, list):
+        _pending[key] = [current[0] + value[0], current[1] + value[1],
+                         [a + b for a, b in zip(current[2], value[2])]]
+    else:
+        _pending[key] = current + value
+
+
+def flush_if_due():
+    """
+    Flushes once METRICS_FLUSH_INTERVAL seconds have passed since the last flush, or once
+    METRICS_FLUSH_MAX_PENDING observations are pending, whichever comes first.
+    """
+    with _pending_lock:
+        due = _pending_count and (_pending_count >= settings.METRICS_FLUSH_MAX_PENDING or
+                                  time.monotonic() - _last_flush >= settings.METRICS_FLUSH_INTERVAL)
+    if due:
+        flush()
+
+
+def _flush_after_response(sender, **kwargs):
+    # request_finished is sent once the response has been sent, so the visitor does not wait
+    flush_if_due()
+
+
+def install_flush_hooks():
+    """
+    Flushes after every response once due. Called by MetricsMiddleware.
+    """
+    request_finished.connect(_flush_after_response, dispatch_uid='metrics_flush_after_response')
+
+
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception:
+        logger.exception('Could not flush metrics at exit.')
+
+
+def flush_at_exit():
+    """
+    Flushes whatever is left when the process exits. Only the WSGI and ASGI modules call this:
+    commands and tests that build a request handler may have swapped the database by then.
+    """
+    global _exit_flush_registered
+    if not _exit_flush_registered:
+        _exit_flush_registered = True
+        atexit.register(_flush_at_exit)
+
+
+def render_metrics():
+    """
+    Returns the shared totals in the Prometheus text exposition format.
+    """
+    from backend.models import MetricSeries
+
+    series_by_name = {}
+    for series in MetricSeries.objects.order_by('name', 'labels'):
+        series_by_name.setdefault(series.name, []).append(series)
+
+    lines = []
+    for name, metric in sorted(REGISTRY.items()):
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        for series in series_by_name.get(name, []):
+            if metric.kind == 'counter':
+                lines.append(f'{name}{_braces(series.labels)} {_number(series.value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip((*metric.buckets, '+Inf'), series.buckets):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f'{name}_bucket{_braces(series.labels, le)} {cumulative}')
+            lines.append(f'{name}_sum{_braces(series.labels)} {_number(series.value)}')
+            lines.append(f'{name}_count{_braces(series.labels)} {series.count}')
+    return '\n'.join(lines) + '\n'
+
+
+def _braces(*labels):
+    labels = ','.join(label for label in labels if label)
+    return f'{{{labels}}}' if labels else ''
+
+
+def _number(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+@require_GET
+def metrics(request):
+    # Scrapers authenticate with METRICS_TOKEN; staff can look from the browser
+    authorization = request.headers.get('Authorization', '')
+    token_ok = settings.METRICS_TOKEN and constant_time_compare(authorization, f'Bearer {settings.METRICS_TOKEN}')
+    if not token_ok and not request.user.is_superuser:
+        return HttpResponseForbidden()
+
+    flush()
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class MetricsMiddleware:
+    """
+    Counts every request and times it by URL name. The process's observations are added to
+    the shared totals after a response once they are due (see flush_if_due).
+    Put it first, so the time of every other middleware is included.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        install_flush_hooks()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        self._record(request, response, start)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self._record(request, response, start)
+        return response
+
+    def _record(self, request, response, start):
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, view=view)
+        # Arbitrary methods would each start a new series
+        method = request.method if request.method in HTTP_METHODS else 'other'
+        HTTP_REQUESTS.inc(view=view, method=method, status=str(response.status_code))
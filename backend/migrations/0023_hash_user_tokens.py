@@ -0,0 +1,49 @@
+import hashlib
+
+from django.db import migrations, models
+
+
+def hash_token(token):
+    # Blank tokens become NULL so they do not collide in the unique index
+    return hashlib.sha256(token.encode()).hexdigest() if token else None
+
+
+def hash_existing_tokens(apps, schema_editor):
+    # Keep links that were already emailed working by hashing the stored raw tokens
+    User = apps.get_model('backend', 'User')
+    for user in User.objects.filter(
+            models.Q(verification_token_hash__isnull=False) | models.Q(password_reset_token_hash__isnull=False)):
+        user.verification_token_hash = hash_token(user.verification_token_hash)
+        user.password_reset_token_hash = hash_token(user.password_reset_token_hash)
+        user.save(update_fields=['verification_token_hash', 'password_reset_token_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0022_alter_medicalquestionnaire_allergic_and_more'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='user',
+            old_name='verification_token',
+            new_name='verification_token_hash',
+        ),
+        migrations.RenameField(
+            model_name='user',
+            old_name='password_reset_token',
+            new_name='password_reset_token_hash',
+        ),
+        migrations.RunPython(hash_existing_tokens, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='user',
+            name='verification_token_hash',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='password_reset_token_hash',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+    ]
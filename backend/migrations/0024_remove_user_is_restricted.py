@@ -0,0 +1,17 @@
+# Generated by Django 4.2.15 on 2026-10-19 18:20
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0023_hash_user_tokens'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='user',
+            name='is_restricted',
+        ),
+    ]
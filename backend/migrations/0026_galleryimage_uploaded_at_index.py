@@ -0,0 +1,17 @@
+# Generated by Django 4.2.15 on 2026-10-19 18:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0025_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='galleryimage',
+            index=models.Index(fields=['uploaded_at', 'id'], name='backend_gal_uploade_ff435b_idx'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+import django.db.models.expressions
+from django.db import migrations, models
+
+# The yes/no columns in the order of MEDICAL_QUESTIONS when this migration was written
+QUESTION_FIELDS = (
+    'physician_care',
+    'high_blood_pressure',
+    'heart_disease',
+    'allergic',
+    'diabetes',
+    'blood_disease',
+    'bleeder',
+    'excessive_bleeding',
+    'recent_infection',
+    'anesthetic_reactions',
+    'previous_dental_surgery',
+)
+
+
+def pack_answers(apps, schema_editor):
+    MedicalQuestionnaire = apps.get_model('backend', 'MedicalQuestionnaire')
+    questionnaires = list(MedicalQuestionnaire.objects.all())
+    for questionnaire in questionnaires:
+        answers = 0
+        for position, field in enumerate(QUESTION_FIELDS):
+            answer = getattr(questionnaire, field)
+            if answer is not None:
+                answers |= (0b01 | int(answer) << 1) << (2 * position)
+        questionnaire.answers = answers
+    MedicalQuestionnaire.objects.bulk_update(questionnaires, ['answers'], batch_size=500)
+
+
+def unpack_answers(apps, schema_editor):
+    MedicalQuestionnaire = apps.get_model('backend', 'MedicalQuestionnaire')
+    questionnaires = list(MedicalQuestionnaire.objects.all())
+    for questionnaire in questionnaires:
+        for position, field in enumerate(QUESTION_FIELDS):
+            bits = questionnaire.answers >> (2 * position) & 0b11
+            setattr(questionnaire, field, bool(bits & 0b10) if bits & 0b01 else None)
+    MedicalQuestionnaire.objects.bulk_update(questionnaires, QUESTION_FIELDS, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0026_galleryimage_uploaded_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicalquestionnaire',
+            name='answers',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(pack_answers, unpack_answers),
+    ] + [
+        migrations.RemoveField(
+            model_name='medicalquestionnaire',
+            name=field,
+        )
+        for field in QUESTION_FIELDS
+    ] + [
+        migrations.AddIndex(
+            model_name='medicalquestionnaire',
+            index=models.Index(django.db.models.expressions.CombinedExpression(models.F('answers'), '&', models.Value(699050)), name='questionnaire_risk_flags_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.15 on 2026-10-19 18:39
+
+from django.db import migrations, models
+import django.db.models.expressions
+import django.db.models.lookups
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0027_pack_questionnaire_answers'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('status__in', ['Pending', 'Approved'])), fields=['date', 'user'], name='appointment_active_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicalquestionnaire',
+            index=models.Index(condition=models.Q(django.db.models.lookups.GreaterThan(django.db.models.expressions.CombinedExpression(models.F('answers'), '&', models.Value(699050)), 0)), fields=['user'], name='questionnaire_flagged_user_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.15 on 2026-10-19 18:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0028_screening_partial_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='appointment',
+            name='backend_app_date_af5a3b_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='appointment',
+            name='appointment_active_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('status__in', ['Pending', 'Approved'])), fields=['date', 'start_time'], include=('end_time',), name='appointment_active_slot_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('status', 'Approved')), fields=['date', 'attended'], name='appointment_approved_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('attended', False), ('missed_counted', False), ('status', 'Approved')), fields=['user', 'date'], name='appointment_missed_check_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(condition=models.Q(('email_verified', False), ('is_superuser', False)), fields=['verification_token_created', 'date_joined'], name='user_unverified_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(condition=models.Q(('restriction_end_time__isnull', False)), fields=['restriction_end_time'], name='user_restricted_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.15 on 2026-10-19 18:47
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0029_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('status', models.CharField(choices=[('Pending', 'Pending'), ('Approved', 'Approved'), ('Cancelled', 'Cancelled')], max_length=20)),
+                ('attended', models.BooleanField()),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedAppointment',
+            fields=[
+                ('date', models.DateField()),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('status', models.CharField(choices=[('Pending', 'Pending'), ('Approved', 'Approved'), ('Cancelled', 'Cancelled')], default='Pending', max_length=20)),
+                ('attended', models.BooleanField(default=False)),
+                ('reminder_sent', models.BooleanField(default=False)),
+                ('missed_counted', models.BooleanField(default=False)),
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='backend.service')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='appointmentrollup',
+            constraint=models.UniqueConstraint(fields=('date', 'status', 'attended'), name='appointment_rollup_unique'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.15 on 2026-10-19 18:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0030_appointment_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricSeries',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('labels', models.CharField(blank=True, max_length=255)),
+                ('value', models.FloatField(default=0)),
+                ('count', models.BigIntegerField(default=0)),
+                ('buckets', models.JSONField(blank=True, default=list)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='metricseries',
+            constraint=models.UniqueConstraint(fields=('name', 'labels'), name='metric_series_unique'),
+        ),
+    ]
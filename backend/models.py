@@ -1,9 +1,25 @@
+import hashlib
+
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.models import BaseUserManager
+from django.db.models.lookups import GreaterThan
 from django.utils.crypto import get_random_string
 from django.utils import timezone
 
+from backend.images import build_image_variants, delete_image_variants
+from backend.metrics import external_call
+
+# How long email verification and password reset links stay valid
+TOKEN_LIFETIME = timezone.timedelta(hours=24)
+
+
+def hash_token(token):
+    """
+    Returns the fixed-length SHA-256 digest stored in place of a raw token.
+    """
+    return hashlib.sha256(token.encode()).hexdigest()
+
 
 class CustomUserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
@@ -32,6 +48,52 @@ class CustomUserManager(BaseUserManager):
 
         return self.create_user(email, password, **extra_fields)
 
+    def get_by_verification_token(self, token):
+        """
+        Return the user owning an unexpired email verification token.
+        """
+        return self.get(verification_token_hash=hash_token(token),
+                        verification_token_created__gte=timezone.now() - TOKEN_LIFETIME)
+
+    def get_by_password_reset_token(self, token, **extra_filters):
+        """
+        Return the user owning an unexpired password reset token.
+        """
+        return self.get(password_reset_token_hash=hash_token(token),
+                        password_reset_token_created__gte=timezone.now() - TOKEN_LIFETIME,
+                        **extra_filters)
+
+    def purge_expired_tokens(self):
+        """
+        Clear expired password reset tokens and delete accounts that never verified their email.
+        Returns the number of cleared tokens and deleted accounts.
+        """
+        cutoff = timezone.now() - TOKEN_LIFETIME
+
+        cleared_tokens = self.filter(password_reset_token_created__lt=cutoff).update(
+            password_reset_token_hash=None,
+            password_reset_token_created=None,
+        )
+
+        unverified_users = self.filter(
+            models.Q(verification_token_created__lt=cutoff) |
+            models.Q(verification_token_created__isnull=True, date_joined__lt=cutoff),
+            email_verified=False,
+            is_superuser=False,
+        )
+        _, deleted = unverified_users.delete()
+
+        return cleared_tokens, deleted.get('backend.User', 0)
+
+    def clear_expired_restrictions(self):
+        """
+        Clear lapsed restrictions in one statement and return the number of users updated.
+        """
+        return self.filter(restriction_end_time__lte=timezone.now()).update(
+            restriction_end_time=None,
+            consecutive_missed_appointments=0,
+        )
+
 
 class User(AbstractUser):
     username = None  # Remove the username field
@@ -42,12 +104,11 @@ class User(AbstractUser):
     birthday = models.DateField(null=True, blank=True)
     age = models.PositiveIntegerField(null=True, blank=True)
     email_verified = models.BooleanField(default=False)
-    verification_token = models.CharField(max_length=100, blank=True, null=True)
+    verification_token_hash = models.CharField(max_length=64, unique=True, blank=True, null=True)
     verification_token_created = models.DateTimeField(blank=True, null=True)
-    password_reset_token = models.CharField(max_length=100, blank=True, null=True)
+    password_reset_token_hash = models.CharField(max_length=64, unique=True, blank=True, null=True)
     password_reset_token_created = models.DateTimeField(blank=True, null=True)
     consecutive_missed_appointments = models.IntegerField(default=0)
-    is_restricted = models.BooleanField(default=False)
     restriction_end_time = models.DateTimeField(null=True, blank=True)
     has_agreed_privacy_policy = models.BooleanField(default=False)
 
@@ -57,48 +118,131 @@ class User(AbstractUser):
     objects = CustomUserManager()  # Use the custom manager
 
     def generate_verification_token(self):
-        self.verification_token = get_random_string(length=32)
+        # Only the hash is stored; the raw token goes out in the email link
+        token = get_random_string(length=32)
+        self.verification_token_hash = hash_token(token)
         self.verification_token_created = timezone.localtime(timezone.now())
-        self.save()
+        self.save(update_fields=['verification_token_hash', 'verification_token_created'])
+        return token
 
     def generate_password_reset_token(self):
-        self.password_reset_token = get_random_string(length=32)
+        token = get_random_string(length=32)
+        self.password_reset_token_hash = hash_token(token)
         self.password_reset_token_created = timezone.localtime(timezone.now())
-        self.save()
+        self.save(update_fields=['password_reset_token_hash', 'password_reset_token_created'])
+        return token
 
-    def update_restriction_status(self):
-        now = timezone.localtime(timezone.now())
-        if self.is_restricted and self.restriction_end_time and now >= self.restriction_end_time:
-            self.is_restricted = False
-            self.restriction_end_time = None
-            self.consecutive_missed_appointments = 0
-            self.save()
+    @property
+    def is_restricted(self):
+        # Derived at read time, so an expired restriction needs no write to lift it
+        return self.restriction_end_time is not None and timezone.now() < self.restriction_end_time
 
-    def increment_missed_appointments(self):
+    def increment_missed_appointments(self, count=1):
         now = timezone.localtime(timezone.now())
-        self.consecutive_missed_appointments += 1
-        if self.consecutive_missed_appointments == 3:
-            self.is_restricted = True
-            self.restriction_end_time = now + timezone.timedelta(hours=12)
-        elif self.consecutive_missed_appointments == 5:
-            self.is_restricted = True
-            self.restriction_end_time = now + timezone.timedelta(hours=24)
-        self.save()
+        users = User.objects.filter(pk=self.pk)
+
+        # One statement, so concurrent requests cannot overwrite each other's count.
+        # A lapsed restriction starts the count over
+        lapsed = models.Q(restriction_end_time__lte=now)
+        users.update(
+            consecutive_missed_appointments=models.Case(
+                models.When(lapsed, then=models.Value(count)),
+                default=models.F('consecutive_missed_appointments') + count,
+            ),
+            restriction_end_time=models.Case(
+                models.When(lapsed, then=models.Value(None)),
+                default=models.F('restriction_end_time'),
+            ),
+        )
+        self.refresh_from_db(fields=['consecutive_missed_appointments', 'restriction_end_time'])
+
+        current = self.consecutive_missed_appointments
+        previous = current - count
+        if previous < 5 <= current:
+            restriction_end_time = now + timezone.timedelta(hours=24)
+        elif previous < 3 <= current:
+            restriction_end_time = now + timezone.timedelta(hours=12)
+        else:
+            return
+        # Never shorten a longer restriction set by a concurrent request
+        if users.filter(models.Q(restriction_end_time__isnull=True) |
+                        models.Q(restriction_end_time__lt=restriction_end_time)).update(
+                restriction_end_time=restriction_end_time):
+            self.restriction_end_time = restriction_end_time
 
     def reset_missed_appointments(self):
         self.consecutive_missed_appointments = 0
-        self.save()
+        self.save(update_fields=['consecutive_missed_appointments'])
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Unverified sign-ups purged once their token expires; the patient listing
+            # (verified non-superusers) is most of the table and is better served by a scan
+            models.Index(fields=['verification_token_created', 'date_joined'],
+                         condition=models.Q(email_verified=False, is_superuser=False), name='user_unverified_idx'),
+            # Restrictions lifted by the cron once they lapse
+            models.Index(fields=['restriction_end_time'], condition=models.Q(restriction_end_time__isnull=False),
+                         name='user_restricted_idx'),
+        ]
 
     def __str__(self):
         return f'{self.first_name} {self.last_name}'
 
 
-class GalleryImage(models.Model):
+class ResponsiveImageModel(models.Model):
+    """
+    Keeps the dimensions and resized derivatives of `image` on the row, so templates can
+    emit srcset, width and height without asking the storage.
+    """
+    image_width = models.PositiveIntegerField(null=True, blank=True)
+    image_height = models.PositiveIntegerField(null=True, blank=True)
+    image_variants = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        # Build derivatives for fresh uploads while the file is still in memory
+        if self.image and not self.image._committed:
+            self.refresh_image_variants()
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'image_width', 'image_height', 'image_variants'}
+            # Store the original here rather than in pre_save, so the upload is timed
+            with external_call('storage'):
+                self.image.save(self.image.name, self.image.file, save=False)
+        super().save(*args, **kwargs)
+
+    def refresh_image_variants(self):
+        storage = self.image.storage
+        previous_variants = self.image_variants
+        self.image_width, self.image_height, self.image_variants = build_image_variants(
+            self.image, self._meta.get_field('image').upload_to, storage)
+        delete_image_variants(previous_variants, storage)
+
+    @property
+    def image_src(self):
+        # Largest derivative; rows uploaded before derivatives existed fall back to the original
+        if self.image_variants:
+            return self.image_variants[-1]['url']
+        return self.image.url
+
+    @property
+    def image_srcset(self):
+        return ', '.join(f"{variant['url']} {variant['width']}w" for variant in self.image_variants)
+
+
+class GalleryImage(ResponsiveImageModel):
     image = models.ImageField(upload_to='gallery/')
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Backs the cursor pagination of the gallery
+            models.Index(fields=['uploaded_at', 'id']),
+        ]
 
-class Service(models.Model):
+
+class Service(ResponsiveImageModel):
     title = models.CharField(max_length=255)
     description = models.TextField()
     duration = models.PositiveIntegerField()  # Duration in minutes
@@ -108,7 +252,7 @@ class Service(models.Model):
         return self.title
 
 
-class Appointment(models.Model):
+class AppointmentFields(models.Model):
     STATUS_CHOICES = [
         ('Pending', 'Pending'),
         ('Approved', 'Approved'),
@@ -126,29 +270,178 @@ class Appointment(models.Model):
     missed_counted = models.BooleanField(default=False)
 
     class Meta:
-        indexes = [
-            models.Index(fields=['date', 'start_time', 'status', 'reminder_sent']),
-        ]
+        abstract = True
 
     def __str__(self):
         return f"{self.user.first_name} {self.user.last_name} - {self.service.title} on {self.date} at {self.start_time}"
 
 
+class Appointment(AppointmentFields):
+    is_archived = False
+
+    class Meta:
+        indexes = [
+            # Appointments that are still going ahead, in slot order: the availability lookup
+            # (covered on PostgreSQL) and the screening report
+            models.Index(fields=['date', 'start_time'], include=['end_time'],
+                         condition=models.Q(status__in=['Pending', 'Approved']), name='appointment_active_slot_idx'),
+            # Approved appointments by date: the dashboard charts and the unattended cron
+            models.Index(fields=['date', 'attended'], condition=models.Q(status='Approved'),
+                         name='appointment_approved_date_idx'),
+            # A patient's past appointments still waiting to be counted as missed
+            models.Index(fields=['user', 'date'],
+                         condition=models.Q(status='Approved', attended=False, missed_counted=False),
+                         name='appointment_missed_check_idx'),
+        ]
+
+
+class ArchivedAppointment(AppointmentFields):
+    """
+    An appointment moved out of Appointment by backend.archive, under its original id.
+    Read-only history; its counts live on in AppointmentRollup.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    is_archived = True
+
+
+class AppointmentRollup(models.Model):
+    """
+    Number of archived appointments per day, status and attendance, so the dashboard
+    totals and charts still count them.
+    """
+    date = models.DateField()
+    status = models.CharField(max_length=20, choices=AppointmentFields.STATUS_CHOICES)
+    attended = models.BooleanField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'status', 'attended'], name='appointment_rollup_unique'),
+        ]
+
+
+# Yes/no questions of the medical questionnaire in the order they are asked: (key, text, is a risk).
+# Answers are packed by position, so new questions must only ever be appended.
+MEDICAL_QUESTIONS = (
+    ('physician_care', "Are you under physician's care?", True),
+    ('high_blood_pressure', 'Do you have high blood pressure?', True),
+    ('heart_disease', 'Do you have heart disease?', True),
+    ('allergic', 'Are you allergic to any drugs, medicine, foods, anesthetics?', True),
+    ('diabetes', 'Do you have diabetes?', True),
+    ('blood_disease', 'Do you have any blood disease?', True),
+    ('bleeder', 'Are you a bleeder?', True),
+    ('excessive_bleeding', 'Have you experienced excessive bleeding after tooth extraction?', True),
+    ('recent_infection', 'Have you or have you recently had evidence of infection such as boils, infected wounds?', True),
+    ('anesthetic_reactions', 'Have you ever had any reactions from local anesthetics?', True),
+    ('previous_dental_surgery', 'Have you had any dental surgery before?', False),
+)
+HEALTH_IMPRESSION_QUESTION = 'What is your impression of your present health?'
+
+# Each question takes two bits of MedicalQuestionnaire.answers: answered, then yes
+MEDICAL_QUESTION_BITS = {key: 2 * position for position, (key, _, _) in enumerate(MEDICAL_QUESTIONS)}
+MEDICAL_RISK_MASK = sum(1 << (MEDICAL_QUESTION_BITS[key] + 1) for key, _, is_risk in MEDICAL_QUESTIONS if is_risk)
+
+# Yes answers to risk questions; indexed, so screening for risks does not scan every questionnaire
+MEDICAL_RISK_FLAGS = models.F('answers').bitand(MEDICAL_RISK_MASK)
+
+
+def medical_yes_mask(keys):
+    """
+    Returns the bits of MedicalQuestionnaire.answers set by answering yes to any of the given questions.
+    """
+    return sum(1 << (MEDICAL_QUESTION_BITS[key] + 1) for key in set(keys))
+
+
+class MedicalQuestionnaireQuerySet(models.QuerySet):
+    def with_risk_flags(self):
+        """
+        Questionnaires that answered yes to at least one risk question.
+        """
+        return self.filter(GreaterThan(MEDICAL_RISK_FLAGS, 0))
+
+    def answered_yes(self, key):
+        return self.answered_yes_to_any([key])
+
+    def answered_yes_to_any(self, keys):
+        return self.filter(GreaterThan(models.F('answers').bitand(medical_yes_mask(keys)), 0))
+
+
 class MedicalQuestionnaire(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
-    physician_care = models.BooleanField(null=True, blank=True)
-    high_blood_pressure = models.BooleanField(null=True, blank=True)
-    heart_disease = models.BooleanField(null=True, blank=True)
-    allergic = models.BooleanField(null=True, blank=True)
-    diabetes = models.BooleanField(null=True, blank=True)
-    blood_disease = models.BooleanField(null=True, blank=True)
-    bleeder = models.BooleanField(null=True, blank=True)
-    excessive_bleeding = models.BooleanField(null=True, blank=True)
-    recent_infection = models.BooleanField(null=True, blank=True)
-    anesthetic_reactions = models.BooleanField(null=True, blank=True)
-    previous_dental_surgery = models.BooleanField(null=True, blank=True)
+    # Tri-state yes/no answers to MEDICAL_QUESTIONS, packed two bits per question
+    answers = models.PositiveIntegerField(default=0)
     health_impression = models.CharField(max_length=5, choices=[('Good', 'Good'), ('Fair', 'Fair'), ('Poor', 'Poor')],
                                          null=True, blank=True)
 
+    objects = MedicalQuestionnaireQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(MEDICAL_RISK_FLAGS, name='questionnaire_risk_flags_idx'),
+            # Only patients with a risk flag, for joining upcoming appointments in the screening report
+            models.Index(fields=['user'], condition=models.Q(GreaterThan(MEDICAL_RISK_FLAGS, 0)),
+                         name='questionnaire_flagged_user_idx'),
+        ]
+
     def __str__(self):
-        return f"Medical Questionnaire for {self.first_name} {self.last_name}"
+        return f"Medical Questionnaire for {self.user.first_name} {self.user.last_name}"
+
+    def get_answer(self, key):
+        """
+        Returns True or False, or None if the question has not been answered.
+        """
+        bit = MEDICAL_QUESTION_BITS[key]
+        if not self.answers >> bit & 1:
+            return None
+        return bool(self.answers >> (bit + 1) & 1)
+
+    def set_answer(self, key, answer):
+        bit = MEDICAL_QUESTION_BITS[key]
+        self.answers &= ~(0b11 << bit)
+        if answer is not None:
+            self.answers |= (0b01 | int(answer) << 1) << bit
+
+    def set_answers_from(self, data):
+        """
+        Reads every answer from submitted form data: 'Yes' or 'No' per question key, plus health_impression.
+        """
+        for key, _, _ in MEDICAL_QUESTIONS:
+            self.set_answer(key, {'Yes': True, 'No': False}.get(data.get(key)))
+        self.health_impression = data.get('health_impression') or None
+
+    def get_questions(self):
+        """
+        Returns every question with its key, text, type ('yes_no' or 'health_status') and answer.
+        """
+        questions = [{'key': key, 'text': text, 'type': 'yes_no', 'answer': self.get_answer(key)}
+                     for key, text, _ in MEDICAL_QUESTIONS]
+        questions.append({'key': 'health_impression', 'text': HEALTH_IMPRESSION_QUESTION, 'type': 'health_status',
+                          'answer': self.health_impression})
+        return questions
+
+    @property
+    def risk_flags(self):
+        """
+        Keys of the risk questions answered yes.
+        """
+        return [key for key, _, is_risk in MEDICAL_QUESTIONS if is_risk and self.get_answer(key)]
+
+
+class MetricSeries(models.Model):
+    """
+    Running total of one metric series, shared by every worker process (see backend.metrics).
+    Counters keep their total in value; histograms keep the sum of observations in value,
+    their number in count and the non-cumulative count per bucket in buckets.
+    """
+    name = models.CharField(max_length=100)
+    labels = models.CharField(max_length=255, blank=True)
+    value = models.FloatField(default=0)
+    count = models.BigIntegerField(default=0)
+    buckets = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'labels'], name='metric_series_unique'),
+        ]
@@ -0,0 +1,159 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import add_never_cache_headers
+
+from backend.query_inspector import QueryRecorder
+
+# Ask for a profile with ?_profile=json or ?_profile=folded, or the same values in this header
+PROFILE_PARAM = '_profile'
+PROFILE_HEADER = 'X-Profile'
+PROFILE_FORMATS = ('json', 'folded')
+
+
+class StackSampler:
+    """
+    Samples the Python stacks of the given threads (all but its own when None) every
+    `interval` seconds from a background thread, and counts each distinct stack.
+    Costs nothing until started.
+    """
+
+    def __init__(self, thread_ids=None, interval=0.001):
+        self.thread_ids = thread_ids
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                if self.thread_ids is None:
+                    stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def folded(self):
+        """
+        The samples in the folded stack format read by flamegraph.pl and speedscope.
+        """
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class QueryTimeline(QueryRecorder):
+    """
+    QueryRecorder that also keeps when each query started, relative to entering the block.
+    """
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self.timeline = []
+        return super().__enter__()
+
+    def record(self, sql, duration):
+        super().record(sql, duration)
+        start = time.perf_counter() - duration - self.started
+        self.timeline.append({'start_ms': round(start * 1000, 3), 'duration_ms': round(duration * 1000, 3),
+                              'sql': sql})
+
+
+def requested_profile_format(request):
+    value = request.GET.get(PROFILE_PARAM) or request.headers.get(PROFILE_HEADER)
+    if value is None:
+        return None
+    return value if value in PROFILE_FORMATS else 'json'
+
+
+class ProfilingMiddleware:
+    """
+    Profiles a single request when a superuser asks for it with ?_profile= or the X-Profile
+    header, and answers with the profile instead of the page: folded stacks for a flame
+    graph, or JSON holding the folded stacks and the SQL timeline. Other requests only pay
+    for a look at the query string and headers. Put it after AuthenticationMiddleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profile_format = requested_profile_format(request)
+        if profile_format is None or not request.user.is_superuser:
+            return self.get_response(request)
+
+        start = time.perf_counter()
+        with StackSampler({threading.get_ident()}, settings.PROFILING_INTERVAL) as sampler, \
+                QueryTimeline() as queries:
+            response = self.get_response(request)
+        return self._profile_response(request, response, profile_format, sampler, queries, start)
+
+    async def __acall__(self, request):
+        profile_format = requested_profile_format(request)
+        # Loading request.user may query the database, which async code must not do directly
+        if profile_format is None or not await sync_to_async(lambda: request.user.is_superuser)():
+            return await self.get_response(request)
+
+        # Sync views run in executor threads, so sample every thread
+        start = time.perf_counter()
+        with StackSampler(None, settings.PROFILING_INTERVAL) as sampler, QueryTimeline() as queries:
+            response = await self.get_response(request)
+        return self._profile_response(request, response, profile_format, sampler, queries, start)
+
+    def _profile_response(self, request, response, profile_format, sampler, queries, start):
+        if profile_format == 'folded':
+            profile = HttpResponse(sampler.folded(), content_type='text/plain; charset=utf-8')
+        else:
+            profile = JsonResponse(self._profile_document(request, response, sampler, queries, start))
+        add_never_cache_headers(profile)
+        return profile
+
+    @staticmethod
+    def _profile_document(request, response, sampler, queries, start):
+        return {
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'duration_ms': round((time.perf_counter() - start) * 1000, 3),
+            'interval_ms': settings.PROFILING_INTERVAL * 1000,
+            'samples': sampler.samples,
+            'folded': sampler.folded(),
+            'query_count': queries.count,
+            'query_time_ms': round(queries.duration * 1000, 3),
+            'queries': queries.timeline,
+        }
@@ -0,0 +1,153 @@
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+logger = logging.getLogger(__name__)
+
+# Recorders active in the current context; copied into sync_to_async threads with it
+_active_recorders = ContextVar('active_query_recorders', default=())
+
+_IN_LIST = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """
+    Raised when a view or block runs more queries than its budget allows (in strict mode).
+    """
+
+
+def fingerprint(sql):
+    """
+    Returns the SQL with literals and IN lists collapsed, so repeats of one query compare equal.
+    """
+    sql = _IN_LIST.sub('(...)', sql)
+    sql = _STRING.sub('?', sql)
+    return _NUMBER.sub('?', sql)
+
+
+class QueryRecorder:
+    """
+    Records the count, total time and fingerprints of every query run while it is active,
+    on any connection. With a budget, leaving the block raises QueryBudgetExceeded if the
+    budget was exceeded, which makes it usable as a test assertion.
+    """
+
+    def __init__(self, budget=None):
+        self.budget = budget
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def __enter__(self):
+        self._token = _active_recorders.set(_active_recorders.get() + (self,))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _active_recorders.reset(self._token)
+        if exc_type is None and self.over_budget(self.budget):
+            raise QueryBudgetExceeded(f'{self.count} queries run, budget is {self.budget}.')
+
+    def record(self, sql, duration):
+        self.count += 1
+        self.duration += duration
+        self.fingerprints[fingerprint(sql)] += 1
+
+    def over_budget(self, budget):
+        return budget is not None and self.count > budget
+
+    def repeated_queries(self, threshold):
+        """
+        Returns (fingerprint, count) for queries run at least `threshold` times, the usual sign of N+1.
+        """
+        return [(sql, count) for sql, count in self.fingerprints.most_common() if count >= threshold]
+
+
+def _record_query(execute, sql, params, many, context):
+    recorders = _active_recorders.get()
+    if not recorders:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        for recorder in recorders:
+            recorder.record(sql, duration)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """
+    connection_created receiver that lets active QueryRecorders see the connection's queries.
+    """
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def query_budget(max_queries):
+    """
+    Sets the most queries a view may run per request. Apply it closest to the view function.
+    """
+    def decorator(view_func):
+        view_func.query_budget = max_queries
+        return view_func
+    return decorator
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Records the queries of every request, logs suspected N+1 patterns and views over their
+    query_budget, and with QUERY_INSTRUMENTATION_HEADERS adds the figures as response headers.
+    With QUERY_BUDGET_STRICT, a view over budget raises QueryBudgetExceeded instead.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.QUERY_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+        self._report(request, response, recorder)
+        return response
+
+    async def __acall__(self, request):
+        with QueryRecorder() as recorder:
+            response = await self.get_response(request)
+        self._report(request, response, recorder)
+        return response
+
+    def _report(self, request, response, recorder):
+        match = request.resolver_match
+        view_name = match.view_name if match else request.path
+
+        repeated = recorder.repeated_queries(settings.N_PLUS_ONE_THRESHOLD)
+        for sql, count in repeated:
+            logger.warning('Possible N+1 in %s: query run %d times: %s', view_name, count, sql)
+
+        budget = getattr(match.func, 'query_budget', None) if match else None
+        if recorder.over_budget(budget):
+            message = f'{view_name} ran {recorder.count} queries, budget is {budget}.'
+            if settings.QUERY_BUDGET_STRICT:
+                raise QueryBudgetExceeded(message)
+            logger.error(message)
+
+        if settings.QUERY_INSTRUMENTATION_HEADERS:
+            response['X-DB-Query-Count'] = str(recorder.count)
+            response['X-DB-Time-Ms'] = f'{recorder.duration * 1000:.1f}'
+            response['X-DB-Repeated-Queries'] = str(sum(count for _, count in repeated))
@@ -0,0 +1,134 @@
+import hashlib
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from backend.metrics import record_external_call
+
+logger = logging.getLogger(__name__)
+
+
+class RecaptchaUnavailable(Exception):
+    """
+    Raised when the verifier cannot be reached or the circuit breaker is open.
+    """
+
+
+class RecaptchaClient:
+    """
+    Verifies reCAPTCHA tokens over a pooled session with strict timeouts.
+
+    After `failure_threshold` consecutive transport failures the circuit opens and
+    verifications fail fast for `reset_timeout` seconds, then a single trial request
+    is let through. Rejected tokens are cached for `cache_timeout` seconds so a
+    resubmitted form fails without another round trip. Verified tokens are never
+    cached: a token is good for one verification, and the verifier turns a reused
+    one down.
+    """
+
+    def __init__(self, secret, verify_url, timeout=3, failure_threshold=5, reset_timeout=30, cache_timeout=120):
+        self.secret = secret
+        self.verify_url = verify_url
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.cache_timeout = cache_timeout
+
+        # Imported here: only bookings verify tokens, so requests stays off the cold start path
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=10, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._opened_at = None
+
+        # Verification latency in milliseconds, for requests that reached the verifier
+        self.stats = {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'failures': 0}
+
+    def verify(self, token, remote_ip=None):
+        """
+        Returns True if the token is valid. Raises RecaptchaUnavailable if the verifier is down.
+        """
+        if not token:
+            return False
+
+        cache_key = 'recaptcha:rejected:' + hashlib.sha256(token.encode()).hexdigest()
+        if cache.get(cache_key):
+            return False
+
+        self._before_request()
+
+        values = {'secret': self.secret, 'response': token}
+        if remote_ip:
+            values['remoteip'] = remote_ip
+
+        import requests
+
+        start = time.perf_counter()
+        try:
+            response = self.session.post(self.verify_url, data=values, timeout=self.timeout)
+            response.raise_for_status()
+            result = response.json()
+        except (requests.RequestException, ValueError) as e:
+            self._record(start, failed=True)
+            raise RecaptchaUnavailable(str(e)) from e
+        self._record(start, failed=False)
+
+        success = bool(result.get('success'))
+        if not success:
+            cache.set(cache_key, True, self.cache_timeout)
+        return success
+
+    def _before_request(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                raise RecaptchaUnavailable('reCAPTCHA circuit breaker is open.')
+            # Half-open: let this request through, re-open immediately if it fails
+            self._opened_at = None
+            self._consecutive_failures = self.failure_threshold - 1
+
+    def _record(self, start, failed):
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        record_external_call('recaptcha', elapsed_ms / 1000, failed)
+        with self._lock:
+            self.stats['count'] += 1
+            self.stats['total_ms'] += elapsed_ms
+            self.stats['max_ms'] = max(self.stats['max_ms'], elapsed_ms)
+            if failed:
+                self.stats['failures'] += 1
+                self._consecutive_failures += 1
+                if self._consecutive_failures >= self.failure_threshold:
+                    self._opened_at = time.monotonic()
+            else:
+                self._consecutive_failures = 0
+        logger.info('reCAPTCHA verification took %.1f ms (failed=%s)', elapsed_ms, failed)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_recaptcha_client():
+    """
+    Returns the process-wide client, so every request shares one connection pool and breaker.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = RecaptchaClient(
+                    secret=settings.RECAPTCHA_PRIVATE_KEY,
+                    verify_url=settings.RECAPTCHA_VERIFY_URL,
+                    timeout=settings.RECAPTCHA_TIMEOUT,
+                )
+    return _client
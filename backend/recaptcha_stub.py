@@ -0,0 +1,54 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+def make_stub_server(port=8765, delay=0):
+    """
+    Returns an HTTP server standing in for the reCAPTCHA siteverify endpoint.
+    Every token verifies once, like the real one, except "invalid"; "error" answers
+    with HTTP 500.
+    """
+    seen = set()
+    seen_lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            values = parse_qs(self.rfile.read(length).decode())
+            token = values.get('response', [''])[0]
+
+            time.sleep(delay)
+            if token == 'error':
+                self.send_response(500)
+                self.end_headers()
+                return
+
+            with seen_lock:
+                duplicate = token in seen
+                seen.add(token)
+            result = {'success': bool(token) and token != 'invalid' and not duplicate}
+            if duplicate:
+                result['error-codes'] = ['timeout-or-duplicate']
+            body = json.dumps(result).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def handle_one_request(self):
+            try:
+                super().handle_one_request()
+            except (BrokenPipeError, ConnectionResetError):
+                # The client timed out and hung up before the answer
+                self.close_connection = True
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    server.daemon_threads = True
+    return server
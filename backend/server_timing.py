@@ -0,0 +1,178 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import MiddlewareNotUsed
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+from backend.query_inspector import QueryRecorder
+
+# Phases in header order, with their descriptions
+PHASES = {
+    'db': 'Database',
+    'tpl': 'Template rendering',
+    'cache': 'Cache',
+    'smtp': 'SMTP',
+    'recaptcha': 'reCAPTCHA',
+    'storage': 'Media storage',
+}
+
+_timings = ContextVar('server_timings', default=None)
+
+
+class _Timings:
+    # Mutated in place, so time recorded in a copied context (e.g. sync_to_async) is still seen
+    def __init__(self):
+        self.durations = {}
+        self.depth = {}
+
+    def add(self, phase, duration):
+        self.durations[phase] = self.durations.get(phase, 0.0) + duration
+
+
+def record(phase, duration):
+    """
+    Adds `duration` seconds to a phase of the current request's Server-Timing header.
+    """
+    timings = _timings.get()
+    if timings is not None:
+        timings.add(phase, duration)
+
+
+@contextmanager
+def phase(name):
+    """
+    Times the block as part of a phase. Nested blocks of the same phase are counted once.
+    """
+    timings = _timings.get()
+    if timings is None or timings.depth.get(name):
+        yield
+        return
+    timings.depth[name] = 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.depth[name] = 0
+        timings.add(name, time.perf_counter() - start)
+
+
+class _DatabaseTimer(QueryRecorder):
+    # Only the totals are needed, so skip fingerprinting every query
+    def record(self, sql, duration):
+        self.count += 1
+        self.duration += duration
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        with phase('tpl'):
+            return super().render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    Django template backend whose templates add their render time to the 'tpl' phase.
+    The time includes queries run lazily from the template, which 'db' counts as well.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+class TimedCacheMixin:
+    """
+    Adds the time of every cache operation to the 'cache' phase. Mix into a cache backend.
+    """
+
+
+def _timed_cache_method(name):
+    def method(self, *args, **kwargs):
+        with phase('cache'):
+            return getattr(super(TimedCacheMixin, self), name)(*args, **kwargs)
+    method.__name__ = name
+    return method
+
+
+for _name in ('add', 'get', 'set', 'touch', 'delete', 'get_many', 'has_key', 'incr', 'decr', 'set_many',
+              'delete_many', 'clear'):
+    setattr(TimedCacheMixin, _name, _timed_cache_method(_name))
+
+
+class TimedLocMemCache(TimedCacheMixin, LocMemCache):
+    pass
+
+
+class ServerTimingMiddleware:
+    """
+    Adds a Server-Timing header breaking the response time into database, template, cache
+    and external call phases, for staff users, or for everyone with SERVER_TIMING_PUBLIC.
+    Put it near the top, so 'total' covers the other middleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.SERVER_TIMING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _timings.set(_Timings())
+        start = time.perf_counter()
+        try:
+            with _DatabaseTimer() as database:
+                response = self.get_response(request)
+            timings = _timings.get()
+        finally:
+            _timings.reset(token)
+        if settings.SERVER_TIMING_PUBLIC or self._is_staff(request):
+            self._add_header(response, timings, database, start)
+        return response
+
+    async def __acall__(self, request):
+        token = _timings.set(_Timings())
+        start = time.perf_counter()
+        try:
+            with _DatabaseTimer() as database:
+                response = await self.get_response(request)
+            timings = _timings.get()
+        finally:
+            _timings.reset(token)
+        if settings.SERVER_TIMING_PUBLIC or await sync_to_async(self._is_staff)(request):
+            self._add_header(response, timings, database, start)
+        return response
+
+    @staticmethod
+    def _is_staff(request):
+        user = getattr(request, 'user', None)
+        return user is not None and user.is_staff
+
+    @staticmethod
+    def _add_header(response, timings, database, start):
+        if database.count:
+            timings.add('db', database.duration)
+        entries = []
+        for name, description in PHASES.items():
+            if name not in timings.durations:
+                continue
+            if name == 'db':
+                description = f'{description} ({database.count} quer{"y" if database.count == 1 else "ies"})'
+            entries.append(f'{name};dur={timings.durations[name] * 1000:.1f};desc="{description}"')
+        entries.append(f'total;dur={(time.perf_counter() - start) * 1000:.1f}')
+        response['Server-Timing'] = ', '.join(entries)
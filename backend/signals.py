@@ -0,0 +1,47 @@
+import logging
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from backend.archive import remove_from_rollups
+from backend.caching import GALLERY, SERVICES, bump_content_version
+from backend.images import delete_image_variants
+from backend.models import ArchivedAppointment, GalleryImage, Service, User
+
+logger = logging.getLogger(__name__)
+
+
+@receiver([post_save, post_delete], sender=Service)
+def invalidate_services(sender, **kwargs):
+    bump_content_version(SERVICES)
+
+
+@receiver([post_save, post_delete], sender=GalleryImage)
+def invalidate_gallery(sender, **kwargs):
+    bump_content_version(GALLERY)
+
+
+@receiver(pre_delete, sender=User)
+@receiver(pre_delete, sender=Service)
+def remove_archived_appointments_from_rollups(sender, instance, **kwargs):
+    # Their archived appointments are deleted with them; runs inside the delete's transaction
+    remove_from_rollups(ArchivedAppointment.objects.filter(**{sender._meta.model_name: instance}))
+
+
+@receiver(post_delete, sender=Service)
+@receiver(post_delete, sender=GalleryImage)
+def delete_variant_files(sender, instance, **kwargs):
+    # Derivatives belong to their row alone, so they go with it. Content-addressed local
+    # storage ignores the delete; collect_media_garbage removes them once unreferenced
+    storage = instance.image.storage
+    variants = instance.image_variants
+
+    def delete():
+        try:
+            delete_image_variants(variants, storage)
+        except Exception:
+            logger.exception('Could not delete the image variants of %s %s.', sender.__name__, instance.pk)
+
+    # After commit, so a rolled back delete keeps its files
+    transaction.on_commit(delete)
@@ -0,0 +1,248 @@
+// Appointment charts, drawn only on pages that have them
+if (document.getElementById('monthlyAppointmentsChart')) {
+    function readJson(id) {
+        return JSON.parse(document.getElementById(id).textContent);
+    }
+
+    // Responsive font size calculation
+    function calculateFontSize() {
+        return window.innerWidth < 768 ? 10 : 12;
+    }
+
+    // Common chart options
+    const commonOptions = {
+        responsive: true,
+        maintainAspectRatio: false,
+        plugins: {
+            legend: {
+                display: false
+            },
+            tooltip: {
+                backgroundColor: 'rgba(0, 0, 0, 0.8)',
+                titleFont: {
+                    size: 14,
+                    weight: 'bold'
+                },
+                bodyFont: {
+                    size: 12
+                },
+                padding: 10,
+                cornerRadius: 4,
+                displayColors: false
+            }
+        },
+        scales: {
+            x: {
+                grid: {
+                    display: false
+                },
+                ticks: {
+                    font: {
+                        size: calculateFontSize()
+                    },
+                    color: '#666'
+                }
+            },
+            y: {
+                beginAtZero: true,
+                grid: {
+                    color: 'rgba(0, 0, 0, 0.1)',
+                    drawBorder: false
+                },
+                ticks: {
+                    font: {
+                        size: calculateFontSize()
+                    },
+                    color: '#666',
+                    padding: 10
+                },
+                title: {
+                    display: true,
+                    text: 'Number of Appointments',
+                    color: '#333',
+                    font: {
+                        size: calculateFontSize() + 2,
+                        weight: 'bold'
+                    }
+                }
+            }
+        }
+    };
+
+    // Monthly Appointments Chart
+    const ctxMonthly = document.getElementById('monthlyAppointmentsChart').getContext('2d');
+    const gradientFill = ctxMonthly.createLinearGradient(0, 0, 0, 400);
+    gradientFill.addColorStop(0, 'rgba(75, 192, 192, 0.6)');
+    gradientFill.addColorStop(1, 'rgba(75, 192, 192, 0.1)');
+
+    const monthlyAppointmentsChart = new Chart(ctxMonthly, {
+        type: 'line',
+        data: {
+            labels: readJson('monthlyChartLabels'),
+            datasets: [{
+                label: 'Monthly Appointments',
+                data: readJson('monthlyChartTotals'),
+                backgroundColor: gradientFill,
+                borderColor: 'rgba(75, 192, 192, 1)',
+                borderWidth: 2,
+                pointBackgroundColor: 'rgba(75, 192, 192, 1)',
+                pointBorderColor: '#fff',
+                pointBorderWidth: 2,
+                pointRadius: 4,
+                pointHoverRadius: 6,
+                fill: true,
+                tension: 0.4
+            }]
+        },
+        options: {
+            ...commonOptions,
+            plugins: {
+                ...commonOptions.plugins,
+                title: {
+                    display: true,
+                    text: 'Monthly Appointment Analysis',
+                    font: {
+                        size: calculateFontSize() + 4,
+                        weight: 'bold'
+                    },
+                    padding: {
+                        top: 10,
+                        bottom: 30
+                    }
+                }
+            }
+        }
+    });
+
+    // Daily Appointments Chart
+    const ctxDaily = document.getElementById('dailyAppointmentsChart').getContext('2d');
+    const dailyGradient = ctxDaily.createLinearGradient(0, 0, 0, 400);
+    dailyGradient.addColorStop(0, 'rgba(54, 162, 235, 0.8)');
+    dailyGradient.addColorStop(1, 'rgba(54, 162, 235, 0.2)');
+
+    const dailyAppointmentsChart = new Chart(ctxDaily, {
+        type: 'bar',
+        data: {
+            labels: readJson('dailyChartLabels'),
+            datasets: [{
+                label: 'Daily Appointments',
+                data: readJson('dailyChartTotals'),
+                backgroundColor: dailyGradient,
+                borderColor: 'rgba(54, 162, 235, 1)',
+                borderWidth: 1,
+                borderRadius: 4,
+                barThickness: 'flex',
+                maxBarThickness: 30
+            }]
+        },
+        options: {
+            ...commonOptions,
+            plugins: {
+                ...commonOptions.plugins,
+                title: {
+                    display: true,
+                    text: 'Daily Appointment Analysis',
+                    font: {
+                        size: calculateFontSize() + 4,
+                        weight: 'bold'
+                    },
+                    padding: {
+                        top: 10,
+                        bottom: 30
+                    }
+                }
+            }
+        }
+    });
+
+    // Resize listener for responsiveness
+    window.addEventListener('resize', () => {
+        const newFontSize = calculateFontSize();
+        [monthlyAppointmentsChart, dailyAppointmentsChart].forEach(chart => {
+            chart.options.scales.x.ticks.font.size = newFontSize;
+            chart.options.scales.y.ticks.font.size = newFontSize;
+            chart.options.scales.y.title.font.size = newFontSize + 2;
+            chart.options.plugins.title.font.size = newFontSize + 4;
+            chart.update();
+        });
+    });
+}
+
+// Toastr configuration
+toastr.options = {
+  "closeButton": true,
+  "debug": false,
+  "newestOnTop": true,
+  "progressBar": true,
+  "positionClass": "toast-top-right",
+  "preventDuplicates": false,
+  "onclick": null,
+  "showDuration": "300",
+  "hideDuration": "1000",
+  "timeOut": "5000",
+  "extendedTimeOut": "1000",
+  "showEasing": "swing",
+  "hideEasing": "linear",
+  "showMethod": "fadeIn",
+  "hideMethod": "fadeOut"
+};
+
+// Available time slots for the appointment form
+$(document).ready(function() {
+    function updateTimeSlots(data) {
+        var timeSlotSelect = $('#timeSlotSelect');
+        timeSlotSelect.empty();
+        timeSlotSelect.append($('<option></option>').attr('value', '').text('--Select Time--'));
+        if (data.available_slots && data.available_slots.length > 0) {
+            $.each(data.available_slots, function(index, slot) {
+                var optionText = slot.start + ' - ' + slot.end;
+                console.log('Adding option:', optionText);
+                timeSlotSelect.append($('<option></option>').attr('value', optionText).text(optionText));
+            });
+        } else {
+            console.log('No available slots');
+            timeSlotSelect.append($('<option></option>').attr('value', '').text('No available slots'));
+        }
+
+        // Try to refresh the enhanced select plugin
+        try {
+            timeSlotSelect.selectpicker('refresh');
+        } catch (e) {
+            console.log('SelectPicker not available, falling back to native select');
+            // If the plugin is not available or throws an error, show the native select
+            timeSlotSelect.show();
+        }
+
+        console.log('Time slot options:', timeSlotSelect.html());
+    }
+
+    $('#serviceSelect, #dateInput').change(function() {
+        var serviceId = $('#serviceSelect').val();
+        var date = $('#dateInput').val();
+
+        console.log('Service ID:', serviceId);
+        console.log('Date:', date);
+
+        if (serviceId && date) {
+            $.ajax({
+                url: $('#serviceSelect').data('slotsUrl'),
+                data: {
+                    'service_id': serviceId,
+                    'date': date
+                },
+                dataType: 'json',
+                success: function(data) {
+                    console.log('Received data:', data);
+                    updateTimeSlots(data);
+                },
+                error: function(jqXHR, textStatus, errorThrown) {
+                    console.error('AJAX error:', textStatus, errorThrown);
+                    alert('Error fetching time slots. Please try again.');
+                }
+            });
+        } else {
+            console.log('Service ID or Date not selected');
+            updateTimeSlots({available_slots: []});
+        }
+    });
+});
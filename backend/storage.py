@@ -0,0 +1,114 @@
+import hashlib
+import os
+import tempfile
+
+import rcssmin
+import rjsmin
+from django.core.files.base import ContentFile
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Local media storage that names every file after the SHA-256 of its content, so identical
+    uploads are stored once. Uploads are hashed and written in chunks, never held in memory.
+
+    Files can be shared between rows, so delete() leaves them in place; run
+    `manage.py collect_media_garbage` to remove files no row references any more.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # The final name comes from the content, so the requested name never needs a suffix
+        return name
+
+    def _save(self, name, content):
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        digest = hashlib.sha256()
+
+        if hasattr(content, 'temporary_file_path'):
+            # Already on disk: hash it, then move it into place without copying
+            for chunk in content.chunks():
+                digest.update(chunk)
+            source_path = content.temporary_file_path()
+            is_temporary_copy = False
+        else:
+            temp_directory = self.path('.incoming')
+            os.makedirs(temp_directory, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=temp_directory, delete=False) as temp_file:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    temp_file.write(chunk)
+            source_path = temp_file.name
+            is_temporary_copy = True
+
+        hexdigest = digest.hexdigest()
+        hashed_name = os.path.join(directory, hexdigest[:2], hexdigest + extension).replace('\\', '/')
+        full_path = self.path(hashed_name)
+
+        if os.path.exists(full_path):
+            # Duplicate upload: keep the existing file
+            if is_temporary_copy:
+                os.remove(source_path)
+        else:
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            try:
+                file_move_safe(source_path, full_path)
+            except FileExistsError:
+                # An identical upload finished first
+                if is_temporary_copy:
+                    os.remove(source_path)
+            else:
+                if self.file_permissions_mode is not None:
+                    os.chmod(full_path, self.file_permissions_mode)
+
+        return hashed_name
+
+    def delete(self, name):
+        pass
+
+    def purge(self, name):
+        """
+        Removes a file for real; only call this once no row references it.
+        """
+        super().delete(name)
+
+
+class MinifiedStaticFilesStorage(CompressedManifestStaticFilesStorage):
+    """
+    Minifies the project's own stylesheets and scripts during collectstatic, before WhiteNoise
+    fingerprints and compresses them. Vendored plugins and *.min.* files are copied as they are.
+    """
+
+    # Vendored plugins reference source maps that are not shipped, so leave those comments alone
+    patterns = tuple(
+        (extension, tuple(pattern for pattern in extension_patterns
+                          if 'sourceMappingURL' not in (pattern[0] if isinstance(pattern, tuple) else pattern)))
+        for extension, extension_patterns in CompressedManifestStaticFilesStorage.patterns
+    )
+
+    minifiers = {
+        '.css': rcssmin.cssmin,
+        '.js': rjsmin.jsmin,
+    }
+
+    def should_minify(self, path):
+        return not path.startswith('plugins/') and '.min.' not in os.path.basename(path)
+
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run:
+            paths = dict(paths)
+            for path in paths:
+                minify = self.minifiers.get(os.path.splitext(path)[1])
+                if minify and self.should_minify(path):
+                    with self.open(path) as file:
+                        content = minify(file.read().decode())
+                    self.delete(path)
+                    self.save(path, ContentFile(content.encode()))
+                    # Hash and compress the minified copy rather than the source
+                    paths[path] = (self, path)
+        yield from super().post_process(paths, dry_run, **options)
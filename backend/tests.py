@@ -1,3 +1,815 @@
-from django.test import TestCase
+"""
+Run with a local database and media storage, and the replica stand-in for the routing tests:
 
-# Create your tests here.
+    DATABASE_SQLITE_PATH=db.sqlite3 DATABASE_REPLICA_SQLITE_PATH=db.sqlite3 MEDIA_STORAGE=local \
+        python manage.py test
+"""
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.db.models.functions import TruncMonth
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from backend import cold_start, metrics, views
+from backend.archive import archive_appointments, archive_cutoff, approved_totals, archived_totals
+from backend.catalogue import ServiceCatalogue, service_catalogue
+from backend.db_routers import REPLICA
+from backend.models import (MEDICAL_QUESTIONS, TOKEN_LIFETIME, Appointment, AppointmentRollup, ArchivedAppointment,
+                            GalleryImage, MedicalQuestionnaire, MetricSeries, Service, User, hash_token)
+from backend.query_inspector import QueryBudgetExceeded
+from backend.recaptcha import RecaptchaClient, RecaptchaUnavailable
+from backend.recaptcha_stub import make_stub_server
+from backend.storage import ContentAddressedStorage
+from frontend.views import view_client_dashboard
+
+
+# Tests run with DEBUG off, where the manifest storage needs a collectstatic run first
+plain_static_files = override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+
+
+def create_service(**fields):
+    return Service.objects.create(**{'title': 'Cleaning', 'description': 'Cleaning', 'duration': 30,
+                                     'image': 'services/cleaning.jpg', **fields})
+
+
+def create_patient(email='patient@example.com', **fields):
+    return User.objects.create_user(email=email, password='password',
+                                    **{'email_verified': True, 'has_agreed_privacy_policy': True, **fields})
+
+
+def image_upload(name='smile.png', width=2000, height=1000):
+    # Imported here, like the app itself does
+    from PIL import Image
+
+    buffer = BytesIO()
+    Image.new('RGB', (width, height), 'teal').save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+def use_temporary_media_root(test):
+    media_root = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, media_root)
+    media = override_settings(MEDIA_ROOT=media_root)
+    media.enable()
+    test.addCleanup(media.disable)
+
+
+@plain_static_files
+@skipUnless(REPLICA in settings.DATABASES, 'Set DATABASE_REPLICA_SQLITE_PATH or DATABASE_REPLICA_HOST.')
+class ReplicaRoutingTests(TransactionTestCase):
+    # Transactional: the replica is a second connection, which must see committed rows. The
+    # runner collects the databases of skipped tests too, so only name the replica if it exists
+    databases = {'default', REPLICA} if REPLICA in settings.DATABASES else {'default'}
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser(email='admin@example.com', password='password')
+        self.patient = create_patient()
+        self.service = create_service()
+        self.client.force_login(self.admin)
+
+    def get_dashboard(self):
+        # The chart data is cached; drop it so every request runs the reporting queries
+        cache.delete_many(['monthly_chart_data', 'daily_chart_data'])
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections[REPLICA]) as replica:
+            response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+        return primary, replica
+
+    def test_dashboard_reports_read_from_the_replica(self):
+        primary, replica = self.get_dashboard()
+        self.assertTrue(any('COUNT' in query['sql'] for query in replica.captured_queries))
+        self.assertFalse(any('COUNT' in query['sql'] for query in primary.captured_queries))
+
+    def test_reports_read_from_the_primary_after_a_write(self):
+        response = self.client.post(reverse('dashboard'), {
+            'user': self.patient.pk, 'service': self.service.pk, 'status': 'Approved',
+            'date': timezone.localdate().isoformat(), 'time_slot': '09:00 AM - 09:30 AM',
+        })
+        self.assertEqual(response.status_code, 302)
+
+        primary, replica = self.get_dashboard()
+        self.assertEqual(len(replica.captured_queries), 0)
+        self.assertTrue(any('COUNT' in query['sql'] for query in primary.captured_queries))
+        self.assertEqual(Appointment.objects.count(), 1)
+
+
+# Budgets assume signed-cookie sessions, used when SECRET_KEY is set; server-side sessions also
+# count the write that stores the replica pin after a request that wrote
+@plain_static_files
+@override_settings(QUERY_INSTRUMENTATION=True, QUERY_INSTRUMENTATION_HEADERS=True, QUERY_BUDGET_STRICT=True,
+                   SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+class QueryBudgetTests(TransactionTestCase):
+    # Transactional for the same reason as ReplicaRoutingTests, when a replica is configured
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser(email='admin@example.com', password='password')
+        self.services = [create_service(title=f'Service {i}') for i in range(5)]
+        today = timezone.localdate()
+        # Enough patients and appointments that a query per row would blow every budget
+        for i in range(5):
+            patient = create_patient(email=f'patient{i}@example.com')
+            for day in range(3):
+                Appointment.objects.create(user=patient, service=self.services[i], date=today + timedelta(days=day),
+                                           start_time='09:00', end_time='09:30', status='Approved')
+        self.patient = User.objects.get(email='patient0@example.com')
+        # A missed appointment, so the landing page also counts it against the patient
+        Appointment.objects.create(user=self.patient, service=self.services[0], date=today - timedelta(days=1),
+                                   start_time='09:00', end_time='09:30', status='Approved')
+
+    def assertWithinBudget(self, url, budget):
+        # Strict mode raises QueryBudgetExceeded out of the request; the count is checked as well
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(int(response['X-DB-Query-Count']), budget)
+        return response
+
+    def test_landing_page_for_visitors(self):
+        self.assertWithinBudget(reverse('client_dashboard'), 8)
+        # Served from the page cache the second time
+        self.assertWithinBudget(reverse('client_dashboard'), 0)
+
+    def test_landing_page_for_patients(self):
+        self.client.force_login(self.patient)
+        self.assertWithinBudget(reverse('client_dashboard'), 8)
+
+    def test_dashboard(self):
+        self.client.force_login(self.admin)
+        self.assertWithinBudget(reverse('dashboard'), 12)
+
+    def test_available_time_slots(self):
+        date = timezone.localdate().isoformat()
+        self.assertWithinBudget(f'{reverse("client_get_available_time_slots")}?service_id={self.services[0].pk}'
+                                f'&date={date}', 3)
+
+    def test_view_over_budget_raises(self):
+        self.client.force_login(self.patient)
+        with mock.patch.object(view_client_dashboard, 'query_budget', 1), \
+                self.assertRaisesMessage(QueryBudgetExceeded, 'budget is 1'):
+            self.client.get(reverse('client_dashboard'))
+
+
+@plain_static_files
+class ProfilingTests(TransactionTestCase):
+    # Transactional for the same reason as ReplicaRoutingTests, when a replica is configured
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser(email='admin@example.com', password='password')
+        create_service()
+
+    def assertProfile(self, response, path):
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertIn('no-cache', response['Cache-Control'])
+        profile = response.json()
+        self.assertEqual(profile['path'], path)
+        self.assertEqual(profile['status'], 200)
+        self.assertGreater(profile['query_count'], 0)
+        self.assertEqual(len(profile['queries']), profile['query_count'])
+        self.assertEqual(set(profile['queries'][0]), {'start_ms', 'duration_ms', 'sql'})
+        self.assertIn('folded', profile)
+
+    def assertPage(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/html'))
+
+    def test_superuser_gets_the_profile(self):
+        self.client.force_login(self.admin)
+        path = f'{reverse("services")}?_profile=json'
+        self.assertProfile(self.client.get(path), path)
+
+    def test_folded_stacks_on_request(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('services'), HTTP_X_PROFILE='folded')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+
+    def test_ignored_for_visitors_and_patients(self):
+        self.assertPage(self.client.get(f'{reverse("client_dashboard")}?_profile=json'))
+        self.client.force_login(create_patient())
+        self.assertPage(self.client.get(f'{reverse("client_dashboard")}?_profile=json'))
+
+    async def test_superuser_gets_the_profile_over_asgi(self):
+        await sync_to_async(self.async_client.force_login)(self.admin)
+        path = f'{reverse("services")}?_profile=json'
+        self.assertProfile(await self.async_client.get(path), path)
+
+    async def test_ignored_for_visitors_over_asgi(self):
+        self.assertPage(await self.async_client.get(f'{reverse("client_dashboard")}?_profile=json'))
+
+
+@plain_static_files
+@override_settings(SERVER_TIMING_PUBLIC=False)
+class ServerTimingTests(TransactionTestCase):
+    # Transactional for the same reason as ReplicaRoutingTests, when a replica is configured
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        create_service()
+
+    def get_page(self, name='client_dashboard'):
+        response = self.client.get(reverse(name))
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_sent_to_staff(self):
+        self.client.force_login(User.objects.create_superuser(email='admin@example.com', password='password'))
+        header = self.get_page('services')['Server-Timing']
+        self.assertRegex(header, r'^db;dur=[\d.]+;desc="Database \(\d+ queries\)"')
+        self.assertIn('tpl;dur=', header)
+        self.assertRegex(header, r'total;dur=[\d.]+$')
+
+    def test_left_out_for_visitors_and_patients(self):
+        self.assertNotIn('Server-Timing', self.get_page())
+        self.client.force_login(create_patient())
+        self.assertNotIn('Server-Timing', self.get_page())
+
+    async def test_left_out_for_visitors_over_asgi(self):
+        response = await self.async_client.get(reverse('client_dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Server-Timing', response)
+
+    def test_sent_to_everyone_when_public(self):
+        with override_settings(SERVER_TIMING_PUBLIC=True):
+            self.assertIn('total;dur=', self.get_page()['Server-Timing'])
+
+
+class RecaptchaClientTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def make_client(self, delay=0, **options):
+        # Port 0 picks a free port
+        server = make_stub_server(0, delay)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return RecaptchaClient('secret', f'http://127.0.0.1:{server.server_address[1]}/', **options)
+
+    def test_verified_token_cannot_be_reused(self):
+        client = self.make_client()
+        self.assertIs(client.verify('token'), True)
+        self.assertIs(client.verify('token'), False)
+        self.assertEqual(client.stats['count'], 2)
+
+    def test_rejected_token_is_cached(self):
+        client = self.make_client()
+        self.assertIs(client.verify('invalid'), False)
+        self.assertIs(client.verify('invalid'), False)
+        self.assertEqual(client.stats['count'], 1)
+
+    def test_timeout(self):
+        client = self.make_client(delay=0.5, timeout=0.1)
+        with self.assertRaises(RecaptchaUnavailable):
+            client.verify('token')
+        self.assertEqual(client.stats['failures'], 1)
+
+    def test_breaker_opens_after_consecutive_failures(self):
+        client = self.make_client(failure_threshold=5, reset_timeout=30)
+        for _ in range(5):
+            with self.assertRaises(RecaptchaUnavailable):
+                client.verify('error')
+        # Open: fails fast without reaching the verifier
+        with self.assertRaisesMessage(RecaptchaUnavailable, 'circuit breaker is open'):
+            client.verify('token')
+        self.assertEqual(client.stats['count'], 5)
+
+    def test_breaker_half_opens_after_reset_timeout(self):
+        client = self.make_client(failure_threshold=5, reset_timeout=30)
+        for _ in range(5):
+            with self.assertRaises(RecaptchaUnavailable):
+                client.verify('error')
+        later = client._opened_at + 31
+
+        with mock.patch('backend.recaptcha.time.monotonic', return_value=later):
+            # The trial request fails, which opens the breaker again at once
+            with self.assertRaises(RecaptchaUnavailable):
+                client.verify('error')
+            with self.assertRaisesMessage(RecaptchaUnavailable, 'circuit breaker is open'):
+                client.verify('token')
+
+        with mock.patch('backend.recaptcha.time.monotonic', return_value=later + 31):
+            # The trial request succeeds, which closes it
+            self.assertIs(client.verify('token'), True)
+            self.assertIs(client.verify('another-token'), True)
+        self.assertEqual(client.stats['count'], 8)
+
+
+@plain_static_files
+@override_settings(METRICS_FLUSH_INTERVAL=3600, METRICS_FLUSH_MAX_PENDING=1000)
+class MetricsMiddlewareTests(TransactionTestCase):
+    def setUp(self):
+        metrics.flush()
+        MetricSeries.objects.all().delete()
+        self.addCleanup(metrics.flush)
+
+    def requests_counted(self, method):
+        key = ('http_requests_total', f'view="login",method="{method}",status="200"')
+        return metrics._pending.get(key, 0)
+
+    def test_unknown_methods_share_one_label(self):
+        self.client.generic('PROPFIND', reverse('login'))
+        self.client.generic('BREW', reverse('login'))
+        self.client.get(reverse('login'))
+        self.assertEqual(self.requests_counted('GET'), 1)
+        self.assertEqual(self.requests_counted('other'), 2)
+
+    def test_flushes_after_the_response_once_enough_is_pending(self):
+        self.client.get(reverse('login'))
+        self.assertEqual(self.requests_counted('GET'), 1)
+        self.assertFalse(MetricSeries.objects.exists())
+
+        # Two observations per request: the count and the duration
+        with override_settings(METRICS_FLUSH_MAX_PENDING=4):
+            self.client.get(reverse('login'))
+        self.assertEqual(metrics._pending, {})
+        series = MetricSeries.objects.get(name='http_requests_total', labels__contains='view="login"')
+        self.assertEqual(series.value, 2)
+
+    def test_flushes_after_the_response_once_the_interval_passed(self):
+        self.client.get(reverse('login'))
+        with override_settings(METRICS_FLUSH_INTERVAL=0):
+            self.client.get(reverse('login'))
+        self.assertEqual(metrics._pending, {})
+        self.assertTrue(MetricSeries.objects.filter(name='http_request_duration_seconds').exists())
+
+
+@plain_static_files
+class GalleryImagesTests(TransactionTestCase):
+    def setUp(self):
+        self.image = GalleryImage.objects.create(image='gallery/smile.jpg')
+
+    def get_images(self):
+        response = self.client.get(reverse('client_gallery_images'))
+        self.assertEqual(response.status_code, 200)
+        return response.json()['images']
+
+    def test_visitors_get_no_delete_links(self):
+        [image] = self.get_images()
+        self.assertEqual(image['id'], self.image.pk)
+        self.assertNotIn('delete_url', image)
+
+    def test_patients_get_no_delete_links(self):
+        self.client.force_login(create_patient())
+        [image] = self.get_images()
+        self.assertNotIn('delete_url', image)
+
+    def test_superusers_get_delete_links(self):
+        self.client.force_login(User.objects.create_superuser(email='admin@example.com', password='password'))
+        [image] = self.get_images()
+        self.assertEqual(image['delete_url'], reverse('delete_image', args=[self.image.pk]))
+
+
+class MissedAppointmentsTests(TransactionTestCase):
+    def setUp(self):
+        self.patient = create_patient()
+
+    def test_restricts_when_crossing_thresholds(self):
+        self.patient.increment_missed_appointments(2)
+        self.assertFalse(self.patient.is_restricted)
+
+        self.patient.increment_missed_appointments()
+        self.assertEqual(self.patient.consecutive_missed_appointments, 3)
+        twelve_hours = self.patient.restriction_end_time - timezone.now()
+        self.assertAlmostEqual(twelve_hours.total_seconds(), 12 * 3600, delta=60)
+
+        self.patient.increment_missed_appointments(2)
+        self.assertEqual(self.patient.consecutive_missed_appointments, 5)
+        twenty_four_hours = self.patient.restriction_end_time - timezone.now()
+        self.assertAlmostEqual(twenty_four_hours.total_seconds(), 24 * 3600, delta=60)
+
+    def test_stale_instances_do_not_lose_counts(self):
+        # Two requests, each holding the user as loaded before either incremented
+        first, second = User.objects.get(pk=self.patient.pk), User.objects.get(pk=self.patient.pk)
+        first.increment_missed_appointments(2)
+        second.increment_missed_appointments()
+        self.patient.refresh_from_db()
+        self.assertEqual(self.patient.consecutive_missed_appointments, 3)
+        self.assertTrue(self.patient.is_restricted)
+
+    def test_lapsed_restriction_starts_the_count_over(self):
+        User.objects.filter(pk=self.patient.pk).update(consecutive_missed_appointments=4,
+                                                       restriction_end_time=timezone.now() - timedelta(minutes=1))
+        self.patient.increment_missed_appointments()
+        self.assertEqual(self.patient.consecutive_missed_appointments, 1)
+        self.assertIsNone(self.patient.restriction_end_time)
+
+
+class WarmUpTests(SimpleTestCase):
+    databases = {'default'}
+
+    def test_failed_step_is_logged_and_skipped(self):
+        with mock.patch.object(cold_start, '_connect', side_effect=Exception('Database down')), \
+                self.assertLogs('backend.cold_start', 'ERROR') as logs:
+            timings = cold_start.warm_up()
+        self.assertEqual(list(timings), ['urls', 'templates', 'database', 'catalogue'])
+        self.assertIn("Warm-up step 'database' failed.", logs.output[0])
+
+    def test_never_raises(self):
+        with mock.patch.object(cold_start, 'time', **{'perf_counter.side_effect': RuntimeError}), \
+                self.assertLogs('backend.cold_start', 'ERROR') as logs:
+            cold_start.warm_up()
+        self.assertIn('Warm-up failed.', logs.output[0])
+
+
+@skipUnless(isinstance(default_storage, ContentAddressedStorage), 'Set MEDIA_STORAGE=local.')
+class ImageVariantTests(TransactionTestCase):
+    def setUp(self):
+        use_temporary_media_root(self)
+
+    def upload(self, width=2000, height=1000):
+        return GalleryImage.objects.create(image=image_upload(width=width, height=height))
+
+    def test_upload_stores_webp_variants(self):
+        from PIL import Image
+
+        image = self.upload()
+        image.refresh_from_db()
+        self.assertEqual((image.image_width, image.image_height), (2000, 1000))
+        self.assertEqual([(variant['width'], variant['height']) for variant in image.image_variants],
+                         [(320, 160), (640, 320), (1280, 640)])
+        for variant in image.image_variants:
+            with default_storage.open(variant['name']) as file, Image.open(file) as stored:
+                self.assertEqual(stored.format, 'WEBP')
+                self.assertEqual(stored.size, (variant['width'], variant['height']))
+
+        urls = [variant['url'] for variant in image.image_variants]
+        self.assertEqual(image.image_srcset, f'{urls[0]} 320w, {urls[1]} 640w, {urls[2]} 1280w')
+        self.assertEqual(image.image_src, urls[2])
+
+    def test_narrow_image_gets_one_variant_at_its_own_width(self):
+        image = self.upload(width=200, height=100)
+        self.assertEqual([variant['width'] for variant in image.image_variants], [200])
+
+    def test_deleting_an_image_deletes_its_variants(self):
+        image = self.upload()
+        names = [variant['name'] for variant in image.image_variants]
+        with mock.patch.object(ContentAddressedStorage, 'delete') as delete:
+            image.delete()
+        self.assertEqual([call.args[0] for call in delete.call_args_list], names)
+
+        # Content-addressed storage keeps the files until they are collected
+        call_command('collect_media_garbage', stdout=StringIO())
+        for name in [image.image.name, *names]:
+            self.assertFalse(default_storage.exists(name))
+
+
+@plain_static_files
+@skipUnless(isinstance(default_storage, ContentAddressedStorage), 'Set MEDIA_STORAGE=local.')
+class GalleryUploadTests(TransactionTestCase):
+    def setUp(self):
+        use_temporary_media_root(self)
+        self.client.force_login(User.objects.create_superuser(email='admin@example.com', password='password'))
+
+    def test_one_bad_file_does_not_lose_the_batch(self):
+        real_process = views.process_image_upload
+
+        def process(upload, field):
+            if upload.name == 'unreachable.png':
+                raise OSError('Storage unreachable')
+            return real_process(upload, field)
+
+        files = [image_upload('one.png'), SimpleUploadedFile('notes.txt', b'not an image'),
+                 image_upload('unreachable.png'), image_upload('two.png', width=800, height=600)]
+        with mock.patch.object(views, 'process_image_upload', side_effect=process), \
+                self.assertLogs('backend.views', 'ERROR') as logs:
+            response = self.client.post(reverse('gallery'), {'image': files}, follow=True)
+
+        self.assertEqual(GalleryImage.objects.count(), 2)
+        self.assertEqual(sorted(GalleryImage.objects.values_list('image_width', flat=True)), [800, 2000])
+        self.assertIn('unreachable.png', logs.output[0])
+        errors = [str(message) for message in response.context['messages'] if message.level_tag == 'error']
+        self.assertEqual(len(errors), 2)
+        self.assertTrue(errors[0].startswith('notes.txt: '))
+        self.assertTrue(errors[1].startswith('unreachable.png: '))
+
+
+class MedicalQuestionnaireTests(TestCase):
+    def questionnaire(self, email='patient@example.com', **answers):
+        questionnaire = MedicalQuestionnaire(user=create_patient(email))
+        for key, answer in answers.items():
+            questionnaire.set_answer(key, answer)
+        questionnaire.save()
+        return questionnaire
+
+    def test_every_answer_round_trips_without_touching_the_others(self):
+        keys = [key for key, _, _ in MEDICAL_QUESTIONS]
+        # Every other question answered, so a bit leaking into a neighbour shows up
+        others = {key: [True, False, None][i % 3] for i, key in enumerate(keys)}
+        for i, key in enumerate(keys):
+            for answer in (True, False, None):
+                with self.subTest(key=key, answer=answer):
+                    questionnaire = self.questionnaire(f'patient{i}-{answer}@example.com', **{**others, key: answer})
+                    questionnaire.refresh_from_db()
+                    self.assertEqual({key: questionnaire.get_answer(key) for key in keys},
+                                     {**others, key: answer})
+
+    def test_changing_an_answer_clears_the_old_one(self):
+        questionnaire = self.questionnaire(diabetes=True)
+        questionnaire.set_answer('diabetes', False)
+        self.assertIs(questionnaire.get_answer('diabetes'), False)
+        questionnaire.set_answer('diabetes', None)
+        self.assertIsNone(questionnaire.get_answer('diabetes'))
+        self.assertEqual(questionnaire.answers, 0)
+
+    def test_answered_yes(self):
+        yes = self.questionnaire('yes@example.com', heart_disease=True)
+        self.questionnaire('no@example.com', heart_disease=False, diabetes=True)
+        self.questionnaire('unanswered@example.com')
+        self.assertQuerysetEqual(MedicalQuestionnaire.objects.answered_yes('heart_disease'), [yes])
+
+    def test_risk_flags(self):
+        questionnaire = self.questionnaire(bleeder=True, allergic=False, previous_dental_surgery=True)
+        # Previous dental surgery is asked, but is not a risk
+        self.assertEqual(questionnaire.risk_flags, ['bleeder'])
+        self.assertQuerysetEqual(MedicalQuestionnaire.objects.with_risk_flags(), [questionnaire])
+
+
+@plain_static_files
+class MedicalScreeningTests(TransactionTestCase):
+    # Transactional for the same reason as ReplicaRoutingTests, when a replica is configured
+    databases = '__all__'
+
+    def setUp(self):
+        self.today = timezone.localdate()
+        service = create_service()
+        self.appointments = {}
+        for name, answers in [('heart', {'heart_disease': True}),
+                              ('bleeder', {'bleeder': True, 'diabetes': False}),
+                              ('both', {'heart_disease': True, 'bleeder': True}),
+                              ('healthy', {'heart_disease': False, 'previous_dental_surgery': True}),
+                              ('unanswered', {})]:
+            patient = create_patient(f'{name}@example.com')
+            questionnaire = MedicalQuestionnaire(user=patient)
+            for key, answer in answers.items():
+                questionnaire.set_answer(key, answer)
+            questionnaire.save()
+            self.appointments[name] = Appointment.objects.create(
+                user=patient, service=service, date=self.today, start_time='09:00', end_time='09:30',
+                status='Approved')
+
+    def screened(self, flags):
+        appointments = views.get_screening_appointments(self.today, self.today, flags)
+        return {appointment.user.email.split('@')[0] for appointment in appointments}
+
+    def test_flag_filter(self):
+        self.assertEqual(self.screened(['heart_disease']), {'heart', 'both'})
+        self.assertEqual(self.screened(['bleeder', 'diabetes']), {'bleeder', 'both'})
+
+    def test_all_flags_match_any_risk(self):
+        all_flags = [key for key, _, _ in views.SCREENING_FLAGS]
+        self.assertEqual(self.screened(all_flags), {'heart', 'bleeder', 'both'})
+
+    def test_page_defaults_to_any_risk(self):
+        self.client.force_login(User.objects.create_superuser(email='admin@example.com', password='password'))
+        response = self.client.get(reverse('medical_screening'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['selected_flags'], [key for key, _, _ in views.SCREENING_FLAGS])
+        flags = {appointment.user.email: appointment.screening_flags
+                 for appointment in response.context['appointments']}
+        self.assertEqual(flags, {'heart@example.com': ['Heart disease'], 'bleeder@example.com': ['Bleeder'],
+                                 'both@example.com': ['Heart disease', 'Bleeder']})
+
+    def test_page_shows_only_the_selected_flags(self):
+        self.client.force_login(User.objects.create_superuser(email='admin@example.com', password='password'))
+        response = self.client.get(reverse('medical_screening'), {'flag': ['bleeder', 'not_a_question']})
+        self.assertEqual(response.context['selected_flags'], ['bleeder'])
+        flags = {appointment.user.email: appointment.screening_flags
+                 for appointment in response.context['appointments']}
+        self.assertEqual(flags, {'bleeder@example.com': ['Bleeder'], 'both@example.com': ['Bleeder']})
+
+
+class PackQuestionnaireAnswersMigrationTests(TransactionTestCase):
+    before = [('backend', '0026_galleryimage_uploaded_at_index')]
+    after = [('backend', '0027_pack_questionnaire_answers')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_old_columns_are_packed(self):
+        apps = self.migrate(self.before)
+        OldUser = apps.get_model('backend', 'User')
+        OldQuestionnaire = apps.get_model('backend', 'MedicalQuestionnaire')
+        mixed = OldQuestionnaire.objects.create(
+            user=OldUser.objects.create(email='mixed@example.com'),
+            physician_care=True, heart_disease=False, previous_dental_surgery=True, health_impression='Fair')
+        blank = OldQuestionnaire.objects.create(user=OldUser.objects.create(email='blank@example.com'))
+
+        self.migrate(self.after)
+        mixed, blank = MedicalQuestionnaire.objects.get(pk=mixed.pk), MedicalQuestionnaire.objects.get(pk=blank.pk)
+        for key, _, _ in MEDICAL_QUESTIONS:
+            expected = {'physician_care': True, 'heart_disease': False, 'previous_dental_surgery': True}.get(key)
+            self.assertIs(mixed.get_answer(key), expected, key)
+            self.assertIsNone(blank.get_answer(key), key)
+        self.assertEqual(mixed.health_impression, 'Fair')
+        self.assertEqual(mixed.risk_flags, ['physician_care'])
+
+
+@plain_static_files
+class TokenTests(TestCase):
+    def setUp(self):
+        self.patient = create_patient()
+
+    def age_tokens(self, user, age):
+        # Backdates the tokens the user has
+        user.refresh_from_db()
+        fields = [field for field in ('verification_token_created', 'password_reset_token_created')
+                  if getattr(user, field)]
+        User.objects.filter(pk=user.pk).update(**{field: timezone.now() - age for field in fields})
+
+    def test_only_the_hash_is_stored(self):
+        token = self.patient.generate_password_reset_token()
+        self.patient.refresh_from_db()
+        self.assertEqual(self.patient.password_reset_token_hash, hash_token(token))
+        self.assertNotEqual(self.patient.password_reset_token_hash, token)
+        self.assertEqual(User.objects.get_by_password_reset_token(token), self.patient)
+        # The stored hash is not itself a token
+        with self.assertRaises(User.DoesNotExist):
+            User.objects.get_by_password_reset_token(self.patient.password_reset_token_hash)
+
+    def test_expired_tokens_are_rejected(self):
+        verification_token = self.patient.generate_verification_token()
+        reset_token = self.patient.generate_password_reset_token()
+        self.age_tokens(self.patient, TOKEN_LIFETIME + timedelta(minutes=1))
+        with self.assertRaises(User.DoesNotExist):
+            User.objects.get_by_verification_token(verification_token)
+        with self.assertRaises(User.DoesNotExist):
+            User.objects.get_by_password_reset_token(reset_token)
+
+    def test_reset_link_works_once(self):
+        url = reverse('client_reset_password', args=[self.patient.generate_password_reset_token()])
+        data = {'new_password': 'first-new-password', 'confirm_password': 'first-new-password'}
+        self.assertRedirects(self.client.post(url, data), reverse('client_login'))
+
+        data = {'new_password': 'second-new-password', 'confirm_password': 'second-new-password'}
+        response = self.client.post(url, data, follow=True)
+        self.assertContains(response, 'Invalid or expired password reset token.')
+        self.patient.refresh_from_db()
+        self.assertTrue(self.patient.check_password('first-new-password'))
+
+    def test_purge(self):
+        expired = TOKEN_LIFETIME + timedelta(minutes=1)
+        verified_expired = self.patient
+        verified_expired.generate_password_reset_token()
+        self.age_tokens(verified_expired, expired)
+
+        stale = create_patient('stale@example.com', email_verified=False)
+        stale.generate_verification_token()
+        self.age_tokens(stale, expired)
+        never_sent = create_patient('never-sent@example.com', email_verified=False)
+        User.objects.filter(pk=never_sent.pk).update(date_joined=timezone.now() - expired)
+        recent = create_patient('recent@example.com', email_verified=False)
+        recent.generate_verification_token()
+        # Superusers are created without verifying their email, and are never purged
+        admin = User.objects.create_superuser(email='admin@example.com', password='password')
+        User.objects.filter(pk=admin.pk).update(date_joined=timezone.now() - expired)
+
+        self.assertEqual(User.objects.purge_expired_tokens(), (1, 2))
+
+        self.assertCountEqual(User.objects.values_list('email', flat=True),
+                              [verified_expired.email, recent.email, admin.email])
+        verified_expired.refresh_from_db()
+        self.assertIsNone(verified_expired.password_reset_token_hash)
+        self.assertIsNone(verified_expired.password_reset_token_created)
+        recent.refresh_from_db()
+        self.assertIsNotNone(recent.verification_token_hash)
+
+
+@plain_static_files
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.patient = create_patient()
+        self.service = create_service()
+        self.old_date = archive_cutoff() - timedelta(days=30)
+
+    def appointment(self, date=None, status='Approved', attended=False, user=None):
+        return Appointment.objects.create(user=user or self.patient, service=self.service, date=date or self.old_date,
+                                          start_time='09:00', end_time='09:30', status=status, attended=attended)
+
+    def rollups(self):
+        return {(rollup.date, rollup.status, rollup.attended): rollup.count
+                for rollup in AppointmentRollup.objects.all()}
+
+    def test_archives_in_batches(self):
+        old = [self.appointment() for _ in range(5)]
+        recent = self.appointment(date=timezone.localdate())
+
+        self.assertEqual(archive_appointments(batch_size=2, max_batches=2), 4)
+        self.assertEqual(Appointment.objects.filter(date__lt=archive_cutoff()).count(), 1)
+        self.assertEqual(archive_appointments(batch_size=2), 1)
+
+        self.assertCountEqual(ArchivedAppointment.objects.values_list('pk', flat=True), [a.pk for a in old])
+        self.assertEqual(list(Appointment.objects.values_list('pk', flat=True)), [recent.pk])
+        # Batches of one day add to the same rollup
+        self.assertEqual(self.rollups(), {(self.old_date, 'Approved', False): 5})
+
+    def test_rollup_counts(self):
+        other_date = self.old_date - timedelta(days=1)
+        self.appointment(attended=True)
+        self.appointment(attended=True)
+        self.appointment()
+        self.appointment(date=other_date, status='Cancelled')
+        self.appointment(date=timezone.localdate())
+
+        archive_appointments()
+        self.assertEqual(self.rollups(), {
+            (self.old_date, 'Approved', True): 2,
+            (self.old_date, 'Approved', False): 1,
+            (other_date, 'Cancelled', False): 1,
+        })
+        self.assertEqual(archived_totals(), {
+            'all_appointments': 4, 'pending_appointments': 0, 'approved_appointments': 3,
+            'cancelled_appointments': 1, 'done_appointments': 2,
+        })
+
+    def test_approved_totals_count_live_and_archived_appointments(self):
+        self.appointment()
+        self.appointment(status='Cancelled')
+        archive_appointments()
+        self.appointment()
+        self.appointment(date=self.old_date + timedelta(days=400))
+
+        totals = approved_totals(TruncMonth, self.old_date.replace(day=1), self.old_date + timedelta(days=365))
+        self.assertEqual([total for _, total in totals], [2])
+
+    def test_deleting_a_user_takes_their_archive_out_of_the_rollups(self):
+        other = create_patient('other@example.com')
+        self.appointment()
+        self.appointment(user=other)
+        self.appointment(user=other, status='Cancelled')
+        archive_appointments()
+
+        other.delete()
+        self.assertEqual(ArchivedAppointment.objects.count(), 1)
+        self.assertEqual(self.rollups(), {(self.old_date, 'Approved', False): 1})
+        self.assertEqual(archived_totals()['all_appointments'], ArchivedAppointment.objects.count())
+
+    def test_user_details_lists_archived_appointments_on_request(self):
+        self.appointment(status='Cancelled')
+        archive_appointments()
+        self.appointment(date=timezone.localdate())
+        self.client.force_login(User.objects.create_superuser(email='admin@example.com', password='password'))
+        url = reverse('user_details', args=[self.patient.pk])
+
+        response = self.client.get(url)
+        self.assertEqual([a.is_archived for a in response.context['appointments']], [False])
+
+        response = self.client.get(url, {'archived': '1'})
+        self.assertEqual([a.is_archived for a in response.context['appointments']], [True, False])
+        self.assertContains(response, '<td>Archived</td>', html=True)
+
+
+@plain_static_files
+class ServiceCatalogueTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.service = create_service()
+        self.client.force_login(User.objects.create_superuser(email='admin@example.com', password='password'))
+
+    def test_reads_are_served_from_the_process(self):
+        catalogue = ServiceCatalogue()
+        catalogue.all()
+        with self.assertNumQueries(0):
+            self.assertEqual(catalogue.get(self.service.pk).title, 'Cleaning')
+
+    def test_editing_a_service_reloads_it(self):
+        self.assertEqual(service_catalogue.get(self.service.pk).title, 'Cleaning')
+        self.client.post(reverse('services'), {'service_id': self.service.pk, 'title': 'Whitening',
+                                               'description': 'Whitening', 'duration': 60})
+        service = service_catalogue.get(self.service.pk)
+        self.assertEqual((service.title, service.duration), ('Whitening', 60))
+
+    def test_deleting_a_service_removes_it(self):
+        other = create_service(title='Extraction')
+        self.assertEqual(len(service_catalogue.all()), 2)
+        self.client.get(reverse('delete_service', args=[self.service.pk]))
+        self.assertEqual(service_catalogue.all(), [other])
+        with self.assertRaises(Service.DoesNotExist):
+            service_catalogue.get(self.service.pk)
@@ -14,6 +14,7 @@ urlpatterns = [
     path('accounts/', view_accounts, name='accounts'),
     path('delete-user/<int:user_id>/', delete_user, name='delete_user'),
     path('user/<int:user_id>/', user_details, name='user_details'),
+    path('screening/', medical_screening, name='medical_screening'),
 
     path('delete-appointment/<int:appointment_id>/', delete_appointment, name='delete_appointment'),
     path('update-appointment-status/<int:appointment_id>/', update_appointment_status,
@@ -1,22 +1,38 @@
-from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
-from django.core.mail import send_mail
 from django.db.models.functions import TruncMonth, TruncDay
-from django.http import HttpResponseRedirect, JsonResponse
+from django.http import HttpResponseNotAllowed, HttpResponseRedirect, JsonResponse
 from django.shortcuts import render, redirect
-from django.template.loader import render_to_string
 from django.urls import reverse
 from django.utils import timezone
-from django.utils.crypto import get_random_string
-from django.utils.html import strip_tags
-from django.views.decorators.http import require_GET
 from datetime import datetime, timedelta
 from django.core.cache import cache
-from django.db.models import Count, Q, Max
+from django.db.models import Count, F, Q, Max
+from django.db.models.lookups import GreaterThan
+from django.views.decorators.http import require_GET
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from concurrent.futures import ThreadPoolExecutor
+import logging
+
+from backend.archive import appointment_history, approved_totals, archived_totals
+from backend.caching import GALLERY, bump_content_version
+from backend.catalogue import service_catalogue
+from backend.db_routers import replica_reads
+from backend.emails import send_email
+from backend.images import process_image_upload
+from backend.metrics import SLOT_COMPUTATION_SECONDS
+from backend.models import (GalleryImage, Service, User, Appointment, MedicalQuestionnaire, MEDICAL_QUESTIONS,
+                            MEDICAL_RISK_MASK, medical_yes_mask)
+from backend.query_inspector import query_budget
+
+logger = logging.getLogger(__name__)
+
+# Gallery images rendered with the page; the rest are fetched as the visitor scrolls
+GALLERY_PAGE_SIZE = 12
 
-from backend.models import GalleryImage, Service, User, Appointment, MedicalQuestionnaire
+# Threads used to decode, resize and store a batch of gallery uploads
+GALLERY_UPLOAD_WORKERS = 4
 
 
 def user_login(request):
@@ -80,30 +96,17 @@ def forgot_password(request):
         try:
             user = User.objects.get(email=email, is_superuser=True)
             # Generate a random token
-            token = get_random_string(length=32)
-            user.password_reset_token = token
-            user.password_reset_token_created = datetime.now()
-            user.save()
+            token = user.generate_password_reset_token()
 
             # Send password reset email
             reset_link = request.build_absolute_uri(
                 reverse('reset_password', args=[token])
             )
 
-            html_message = render_to_string('admin_password_reset_email_template.html', {
+            send_email('admin_password_reset', {
                 'user': user,
                 'reset_link': reset_link,
-            })
-            plain_message = strip_tags(html_message)
-
-            send_mail(
-                subject='Reset Your Password - Jaylon Dental Clinic',
-                message=plain_message,
-                from_email=settings.EMAIL_HOST_USER,
-                recipient_list=[user.email],
-                html_message=html_message,
-                fail_silently=False,
-            )
+            }, [user.email])
 
             messages.success(request, 'Password reset instructions have been sent to your email.')
             return redirect('login')
@@ -115,14 +118,14 @@ def forgot_password(request):
 
 def reset_password(request, token):
     try:
-        user = User.objects.get(password_reset_token=token, is_superuser=True)
+        user = User.objects.get_by_password_reset_token(token, is_superuser=True)
         if request.method == 'POST':
             new_password = request.POST.get('new_password')
             confirm_password = request.POST.get('confirm_password')
 
             if new_password == confirm_password:
                 user.set_password(new_password)
-                user.password_reset_token = None
+                user.password_reset_token_hash = None
                 user.password_reset_token_created = None
                 user.save()
                 messages.success(request,
@@ -132,7 +135,7 @@ def reset_password(request, token):
                 messages.error(request, 'Passwords do not match.')
         return render(request, 'reset_password.html')
     except User.DoesNotExist:
-        messages.error(request, 'Invalid password reset token.')
+        messages.error(request, 'Invalid or expired password reset token.')
         return redirect('login')
 
 
@@ -154,14 +157,11 @@ def get_operating_hours(date):
                datetime.combine(date, datetime.min.time().replace(hour=16, minute=0))
 
 
-@require_GET
-def get_available_time_slots(request):
-    service_id = request.GET.get('service_id')
-    date = request.GET.get('date')
-
-    service = Service.objects.get(pk=service_id)
-    selected_date = datetime.strptime(date, '%Y-%m-%d').date()
-
+def compute_available_slots(selected_date, duration, booked_times):
+    """
+    Returns the free slots of `duration` minutes on a date, given the (start_time, end_time)
+    pairs that are already booked.
+    """
     # Get operating hours for the selected date
     start_time, end_time = get_operating_hours(selected_date)
 
@@ -169,22 +169,18 @@ def get_available_time_slots(request):
     lunch_start = datetime.combine(selected_date, datetime.min.time().replace(hour=12, minute=0))
     lunch_end = datetime.combine(selected_date, datetime.min.time().replace(hour=13, minute=0))
 
-    # Get all non-cancelled appointments for the selected date
-    appointments = Appointment.objects.filter(date=selected_date, status__in=['Pending', 'Approved']).order_by(
-        'start_time')
-
     # Create a list of busy time slots, including lunch break
-    busy_slots = [(datetime.combine(selected_date, apt.start_time),
-                   datetime.combine(selected_date, apt.end_time))
-                  for apt in appointments]
+    busy_slots = [(datetime.combine(selected_date, booked_start),
+                   datetime.combine(selected_date, booked_end))
+                  for booked_start, booked_end in booked_times]
     busy_slots.append((lunch_start, lunch_end))  # Add lunch break to busy slots
     busy_slots.sort(key=lambda x: x[0])  # Sort busy slots
 
     available_slots = []
     current_time = start_time
 
-    while current_time + timedelta(minutes=service.duration) <= end_time:
-        slot_end = current_time + timedelta(minutes=service.duration)
+    while current_time + timedelta(minutes=duration) <= end_time:
+        slot_end = current_time + timedelta(minutes=duration)
         is_available = True
 
         for busy_start, busy_end in busy_slots:
@@ -198,81 +194,46 @@ def get_available_time_slots(request):
                 'start': current_time.strftime('%I:%M %p'),
                 'end': slot_end.strftime('%I:%M %p')
             })
-            current_time += timedelta(minutes=service.duration)
+            current_time += timedelta(minutes=duration)
         elif not is_available and current_time == busy_end:
             # If we've jumped to the end of a busy slot, don't increment further
             continue
         else:
             # If not available and not at the end of a busy slot, increment by the service duration
-            current_time += timedelta(minutes=service.duration)
+            current_time += timedelta(minutes=duration)
 
+    return available_slots
+
+
+@query_budget(3)
+async def get_available_time_slots(request):
+    # Async view; Django 4.2's require_GET cannot wrap coroutines, so check the method here
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+
+    service_id = request.GET.get('service_id')
+    date = request.GET.get('date')
+
+    service = await service_catalogue.aget(service_id)
+    selected_date = datetime.strptime(date, '%Y-%m-%d').date()
+
+    # Get all non-cancelled appointments for the selected date
+    booked_times = [times async for times in Appointment.objects
+                    .filter(date=selected_date, status__in=['Pending', 'Approved'])
+                    .order_by('start_time')
+                    .values_list('start_time', 'end_time')]
+
+    with SLOT_COMPUTATION_SECONDS.time():
+        available_slots = compute_available_slots(selected_date, service.duration, booked_times)
     return JsonResponse({'available_slots': available_slots})
 
 
 @login_required(login_url='login')
+@query_budget(12)
 def view_dashboard(request):
     if not request.user.is_superuser:
         return redirect('login')
 
-    # Get current date
-    today = timezone.localtime(timezone.now()).date()
-
-    # Use select_related to reduce database queries
-    appointments = Appointment.objects.select_related('user', 'service').all()
-
-    # Use database aggregation for appointment counts
-    appointment_stats = Appointment.objects.aggregate(
-        all_appointments=Count('id'),
-        todays_appointments=Count('id', filter=Q(date=today)),
-        pending_appointments=Count('id', filter=Q(status='Pending')),
-        approved_appointments=Count('id', filter=Q(status='Approved')),
-        cancelled_appointments=Count('id', filter=Q(status='Cancelled')),
-        done_appointments=Count('id', filter=Q(status='Approved', attended=True))
-    )
-
-    # Optimize monthly data query and caching
-    monthly_chart_data = cache.get('monthly_chart_data')
-    if not monthly_chart_data:
-        latest_date = Appointment.objects.aggregate(latest=Max('date'))['latest'] or today
-        start_date = latest_date - timedelta(days=365)
-
-        monthly_data = (Appointment.objects
-                        .filter(date__gte=start_date, status='Approved')
-                        .annotate(month=TruncMonth('date'))
-                        .values('month')
-                        .annotate(total=Count('id'))
-                        .order_by('month'))
-
-        months = [data['month'].strftime('%B %Y') for data in monthly_data]
-        monthly_totals = [data['total'] for data in monthly_data]
-        monthly_chart_data = {'months': months, 'monthly_totals': monthly_totals}
-        cache.set('monthly_chart_data', monthly_chart_data, 3600)  # Cache for 1 hour
-
-    # Optimize daily data query and caching
-    daily_chart_data = cache.get('daily_chart_data')
-    if not daily_chart_data:
-        start_date_7_days = today - timedelta(days=7)
-        daily_data = (Appointment.objects
-                      .filter(date__range=[start_date_7_days, today], status='Approved')
-                      .annotate(day=TruncDay('date'))
-                      .values('day')
-                      .annotate(total=Count('id'))
-                      .order_by('day'))
-
-        days = [data['day'].strftime('%A') for data in daily_data]
-        daily_totals = [data['total'] for data in daily_data]
-        daily_chart_data = {'days': days, 'daily_totals': daily_totals}
-        cache.set('daily_chart_data', daily_chart_data, 3600)  # Cache for 1 hour
-
-    context = {
-        'users': User.objects.filter(is_superuser=False, email_verified=True),
-        'services': Service.objects.all(),
-        'appointments': appointments,
-        **appointment_stats,
-        **monthly_chart_data,
-        **daily_chart_data,
-    }
-
     if request.method == 'POST':
         # Handle form submission (appointment creation)
         user_id = request.POST.get('user')
@@ -282,7 +243,7 @@ def view_dashboard(request):
         status = request.POST.get('status')
 
         user = User.objects.get(pk=user_id)
-        service = Service.objects.get(pk=service_id)
+        service = service_catalogue.get(service_id)
 
         start_time, end_time = time_slot.split(' - ')
         start_time = datetime.strptime(start_time, '%I:%M %p').time()
@@ -301,7 +262,61 @@ def view_dashboard(request):
         messages.success(request, 'Appointment added successfully.')
         return redirect('dashboard')
 
-    return render(request, 'dashboard.html', context)
+    # Reporting reads only; served by the replica when one is configured
+    with replica_reads():
+        # Get current date
+        today = timezone.localtime(timezone.now()).date()
+
+        # Use select_related to reduce database queries
+        appointments = Appointment.objects.select_related('user', 'service').all()
+
+        # Use database aggregation for appointment counts
+        appointment_stats = Appointment.objects.aggregate(
+            all_appointments=Count('id'),
+            todays_appointments=Count('id', filter=Q(date=today)),
+            pending_appointments=Count('id', filter=Q(status='Pending')),
+            approved_appointments=Count('id', filter=Q(status='Approved')),
+            cancelled_appointments=Count('id', filter=Q(status='Cancelled')),
+            done_appointments=Count('id', filter=Q(status='Approved', attended=True))
+        )
+        # Archived appointments still count towards the totals
+        for key, total in archived_totals().items():
+            appointment_stats[key] += total
+
+        # Optimize monthly data query and caching
+        monthly_chart_data = cache.get('monthly_chart_data')
+        if not monthly_chart_data:
+            latest_date = Appointment.objects.aggregate(latest=Max('date'))['latest'] or today
+            start_date = latest_date - timedelta(days=365)
+
+            monthly_data = approved_totals(TruncMonth, start_date, latest_date)
+
+            months = [month.strftime('%B %Y') for month, _ in monthly_data]
+            monthly_totals = [total for _, total in monthly_data]
+            monthly_chart_data = {'months': months, 'monthly_totals': monthly_totals}
+            cache.set('monthly_chart_data', monthly_chart_data, 3600)  # Cache for 1 hour
+
+        # Optimize daily data query and caching
+        daily_chart_data = cache.get('daily_chart_data')
+        if not daily_chart_data:
+            start_date_7_days = today - timedelta(days=7)
+            daily_data = approved_totals(TruncDay, start_date_7_days, today)
+
+            days = [day.strftime('%A') for day, _ in daily_data]
+            daily_totals = [total for _, total in daily_data]
+            daily_chart_data = {'days': days, 'daily_totals': daily_totals}
+            cache.set('daily_chart_data', daily_chart_data, 3600)  # Cache for 1 hour
+
+        context = {
+            'users': User.objects.filter(is_superuser=False, email_verified=True),
+            'services': service_catalogue.all(),
+            'appointments': appointments,
+            **appointment_stats,
+            **monthly_chart_data,
+            **daily_chart_data,
+        }
+
+        return render(request, 'dashboard.html', context)
 
 
 @login_required(login_url='login')
@@ -311,14 +326,90 @@ def upload_image(request):
         return redirect('login')
 
     if request.method == 'POST':
-        image = request.FILES.get('image')
-        gallery_image = GalleryImage(image=image)
-        gallery_image.save()
-        messages.success(request, 'Image uploaded successfully.')
+        uploads = request.FILES.getlist('image')
+        field = GalleryImage._meta.get_field('image')
+
+        def process(upload):
+            try:
+                return upload.name, process_image_upload(upload, field), None
+            except ValueError as e:
+                return upload.name, None, str(e)
+            except Exception:
+                # Storage, network or decoding trouble with one file must not lose the rest of the batch
+                logger.exception('Could not process the gallery upload %r.', upload.name)
+                return upload.name, None, 'The image could not be saved. Please try again.'
+
+        # Decode, resize and store the files in parallel, then insert every row at once
+        with ThreadPoolExecutor(max_workers=max(1, min(GALLERY_UPLOAD_WORKERS, len(uploads)))) as pool:
+            results = list(pool.map(process, uploads))
+
+        # bulk_create sends no post_save, so invalidate the cached gallery here
+        if GalleryImage.objects.bulk_create([GalleryImage(**values) for _, values, _ in results if values]):
+            bump_content_version(GALLERY)
+
+        uploaded_count = sum(1 for _, values, _ in results if values)
+        if uploaded_count:
+            messages.success(request, f'{uploaded_count} image(s) uploaded successfully.')
+        for name, _, error in results:
+            if error:
+                messages.error(request, f'{name}: {error}')
         return redirect('gallery')
 
-    images = GalleryImage.objects.all()
-    return render(request, 'gallery.html', {'images': images})
+    images, next_cursor = get_gallery_page()
+    return render(request, 'gallery.html', {'images': images, 'gallery_next_cursor': next_cursor})
+
+
+def encode_gallery_cursor(image):
+    value = f'{image.uploaded_at.isoformat()}|{image.pk}'
+    return urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_gallery_cursor(cursor):
+    uploaded_at, image_id = urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.fromisoformat(uploaded_at), int(image_id)
+
+
+def get_gallery_page(cursor=None, limit=GALLERY_PAGE_SIZE):
+    """
+    Returns one page of gallery images in upload order, plus the cursor of the next page
+    (None on the last page). Raises ValueError for a malformed cursor.
+    """
+    images = GalleryImage.objects.order_by('uploaded_at', 'id')
+    if cursor:
+        uploaded_at, image_id = decode_gallery_cursor(cursor)
+        images = images.filter(Q(uploaded_at__gt=uploaded_at) | Q(uploaded_at=uploaded_at, id__gt=image_id))
+
+    # Fetch one extra row to learn whether another page exists
+    page = list(images[:limit + 1])
+    next_cursor = encode_gallery_cursor(page[limit - 1]) if len(page) > limit else None
+    return page[:limit], next_cursor
+
+
+@require_GET
+@query_budget(3)
+def gallery_images(request):
+    try:
+        limit = min(int(request.GET.get('limit', GALLERY_PAGE_SIZE)), GALLERY_PAGE_SIZE * 4)
+        images, next_cursor = get_gallery_page(request.GET.get('cursor'), max(limit, 1))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid cursor or limit.'}, status=400)
+
+    # Public endpoint; only the admin gallery page gets links to delete
+    can_delete = request.user.is_superuser
+    items = []
+    for image in images:
+        item = {
+            'id': image.pk,
+            'url': image.image.url,
+            'src': image.image_src,
+            'srcset': image.image_srcset,
+            'width': image.image_width,
+            'height': image.image_height,
+        }
+        if can_delete:
+            item['delete_url'] = reverse('delete_image', args=[image.pk])
+        items.append(item)
+    return JsonResponse({'images': items, 'next_cursor': next_cursor})
 
 
 @login_required(login_url='login')
@@ -385,7 +476,7 @@ def service_operations(request):
 
         return redirect('services')  # Redirect to the services page
 
-    services = Service.objects.all()
+    services = service_catalogue.all()
     return render(request, 'services.html', {'services': services})
 
 
@@ -464,14 +555,16 @@ def delete_user(request, user_id):
 
 
 @login_required(login_url='login')
+@query_budget(10)
 def user_details(request, user_id):
     # Check if the user is not admin
     if not request.user.is_superuser:
         return redirect('login')
 
     user = User.objects.get(pk=user_id)
-    appointments = Appointment.objects.filter(user_id=user_id)
-    services = Service.objects.all()  # Assuming you have a Service model
+    show_archived = request.GET.get('archived') == '1'
+    appointments = appointment_history(user, include_archived=show_archived)
+    services = service_catalogue.all()
 
     if request.method == 'POST':
         if 'service' in request.POST:
@@ -481,7 +574,7 @@ def user_details(request, user_id):
             appointment_time_slot = request.POST.get('time_slot')
             appointment_status = request.POST.get('status')
 
-            service = Service.objects.get(pk=service_id)
+            service = service_catalogue.get(service_id)
 
             # Parse the time slot
             start_time, end_time = appointment_time_slot.split(' - ')
@@ -543,20 +636,7 @@ def user_details(request, user_id):
 
     try:
         medical_questionnaire = MedicalQuestionnaire.objects.get(user=user)
-        medical_questionnaire_data = [
-            ("Are you under physician's care?", medical_questionnaire.physician_care),
-            ("Do you have high blood pressure?", medical_questionnaire.high_blood_pressure),
-            ("Do you have heart disease?", medical_questionnaire.heart_disease),
-            ("Are you allergic to any drugs, medicine, foods, anesthetics?", medical_questionnaire.allergic),
-            ("Do you have diabetes?", medical_questionnaire.diabetes),
-            ("Do you have any blood disease?", medical_questionnaire.blood_disease),
-            ("Are you a bleeder?", medical_questionnaire.bleeder),
-            ("Have you experienced excessive bleeding after tooth extraction?", medical_questionnaire.excessive_bleeding),
-            ("Have you or have you recently had evidence of infection such as boils, infected wounds?", medical_questionnaire.recent_infection),
-            ("Have you ever had any reactions from local anesthetics?", medical_questionnaire.anesthetic_reactions),
-            ("Have you had any dental surgery before?", medical_questionnaire.previous_dental_surgery),
-            ("What is your impression of your present health?", medical_questionnaire.health_impression),
-        ]
+        medical_questionnaire_data = medical_questionnaire.get_questions()
     except MedicalQuestionnaire.DoesNotExist:
         medical_questionnaire = None
         medical_questionnaire_data = []
@@ -564,6 +644,7 @@ def user_details(request, user_id):
     context = {
         'user': user,
         'appointments': appointments,
+        'show_archived': show_archived,
         'services': services,
         'medical_questionnaire': medical_questionnaire,
         'medical_questionnaire_data': medical_questionnaire_data,
@@ -571,6 +652,67 @@ def user_details(request, user_id):
     return render(request, 'user_details.html', context)
 
 
+# Risk questions staff can screen for, with a short label for each
+SCREENING_FLAGS = [(key, key.replace('_', ' ').capitalize(), text)
+                   for key, text, is_risk in MEDICAL_QUESTIONS if is_risk]
+
+
+def get_screening_appointments(start_date, end_date, flags):
+    """
+    Returns the active appointments between the two dates of patients who answered yes to any
+    of the given risk questions, with patient, questionnaire and service loaded in one query.
+    """
+    answers = F('user__medicalquestionnaire__answers')
+    appointments = (Appointment.objects
+                    .filter(date__range=(start_date, end_date), status__in=['Pending', 'Approved'])
+                    # Spelled exactly like the partial index conditions so the planner can use them
+                    .filter(GreaterThan(answers.bitand(MEDICAL_RISK_MASK), 0))
+                    .select_related('user', 'user__medicalquestionnaire', 'service')
+                    .order_by('date', 'start_time'))
+
+    flag_mask = medical_yes_mask(flags)
+    if flag_mask != MEDICAL_RISK_MASK:
+        appointments = appointments.filter(GreaterThan(answers.bitand(flag_mask), 0))
+    return appointments
+
+
+@login_required(login_url='login')
+@query_budget(4)
+def medical_screening(request):
+    # Check if the user is not admin
+    if not request.user.is_superuser:
+        return redirect('login')
+
+    # Default to the coming week
+    start_date = timezone.localdate()
+    end_date = start_date + timedelta(days=6)
+    try:
+        if request.GET.get('start'):
+            start_date = datetime.strptime(request.GET['start'], '%Y-%m-%d').date()
+        if request.GET.get('end'):
+            end_date = datetime.strptime(request.GET['end'], '%Y-%m-%d').date()
+    except ValueError:
+        messages.error(request, 'Invalid date range.')
+
+    labels = {key: label for key, label, _ in SCREENING_FLAGS}
+    flags = [flag for flag in request.GET.getlist('flag') if flag in labels] or list(labels)
+
+    with replica_reads():
+        appointments = list(get_screening_appointments(start_date, end_date, flags))
+    for appointment in appointments:
+        appointment.screening_flags = [labels[flag] for flag in appointment.user.medicalquestionnaire.risk_flags
+                                       if flag in flags]
+
+    context = {
+        'appointments': appointments,
+        'screening_flags': SCREENING_FLAGS,
+        'selected_flags': flags,
+        'start_date': start_date,
+        'end_date': end_date,
+    }
+    return render(request, 'screening.html', context)
+
+
 @login_required(login_url='login')
 def delete_appointment(request, appointment_id):
     # Check if the user is not admin
@@ -605,38 +747,15 @@ def update_appointment_status(request, appointment_id):
                 reverse('client_dashboard')
             )
 
-            # Render the HTML template
-            html_message = render_to_string('appointment_approval_email_template.html', {
+            send_email('appointment_approval', {
                 'appointment': appointment,
                 'appointment_details_link': appointment_details_link
-            })
-            plain_message = strip_tags(html_message)
-
-            send_mail(
-                subject='Your Appointment is Approved - Jaylon Dental Clinic',
-                message=plain_message,
-                from_email=settings.EMAIL_HOST_USER,
-                recipient_list=[appointment.user.email],
-                html_message=html_message,
-                fail_silently=False,
-            )
+            }, [appointment.user.email])
 
         elif appointment.status == 'Cancelled':
-
-            # Render the HTML template
-            html_message = render_to_string('appointment_cancellation_email_template.html', {
+            send_email('appointment_cancellation', {
                 'appointment': appointment
-            })
-            plain_message = strip_tags(html_message)
-
-            send_mail(
-                subject='Appointment Cancellation - Jaylon Dental Clinic',
-                message=plain_message,
-                from_email=settings.EMAIL_HOST_USER,
-                recipient_list=[appointment.user.email],
-                html_message=html_message,
-                fail_silently=False,
-            )
+            }, [appointment.user.email])
         messages.success(request, 'Appointment status updated successfully.')
 
     # Get the URL of the referring page
@@ -0,0 +1,223 @@
+// Appointment history table
+$(document).ready(function() {
+    $('#appointmentHistoryTable').DataTable({
+        "order": [[1, "desc"]], // Sort by date column (index 1) in descending order
+        "pageLength": 5, // Show 5 entries per page
+        "lengthChange": false, // Remove the "Show X entries" dropdown
+        "language": {
+            "info": "Showing _START_ to _END_ of _TOTAL_ appointments",
+            "infoEmpty": "Showing 0 to 0 of 0 appointments",
+            "infoFiltered": "(filtered from _MAX_ total appointments)"
+        }
+    });
+});
+
+// Scroll animations
+AOS.init({
+    duration: 1000,
+    offset: 100,
+});
+
+// Toastr configuration
+toastr.options = {
+  "closeButton": true,
+  "debug": false,
+  "newestOnTop": true,
+  "progressBar": true,
+  "positionClass": "toast-top-right",
+  "preventDuplicates": false,
+  "onclick": null,
+  "showDuration": "300",
+  "hideDuration": "1000",
+  "timeOut": "5000",
+  "extendedTimeOut": "1000",
+  "showEasing": "swing",
+  "hideEasing": "linear",
+  "showMethod": "fadeIn",
+  "hideMethod": "fadeOut"
+};
+
+// Available time slots for the booking form
+$(document).ready(function() {
+    function updateTimeSlots(data) {
+        var timeSlotSelect = $('#timeSlotSelect');
+        timeSlotSelect.empty();
+        timeSlotSelect.append($('<option></option>').attr('value', '').text('--Select Time--'));
+        if (data.available_slots && data.available_slots.length > 0) {
+            $.each(data.available_slots, function(index, slot) {
+                var optionText = slot.start + ' - ' + slot.end;
+                console.log('Adding option:', optionText);
+                timeSlotSelect.append($('<option></option>').attr('value', optionText).text(optionText));
+            });
+        } else {
+            console.log('No available slots');
+            timeSlotSelect.append($('<option></option>').attr('value', '').text('No available slots'));
+        }
+
+        // Try to refresh the enhanced select plugin
+        try {
+            timeSlotSelect.selectpicker('refresh');
+        } catch (e) {
+            console.log('SelectPicker not available, falling back to native select');
+            // If the plugin is not available or throws an error, show the native select
+            timeSlotSelect.show();
+        }
+
+        console.log('Time slot options:', timeSlotSelect.html());
+    }
+
+    $('#serviceSelect, #dateInput').change(function() {
+        var serviceId = $('#serviceSelect').val();
+        var date = $('#dateInput').val();
+
+        console.log('Service ID:', serviceId);
+        console.log('Date:', date);
+
+        if (serviceId && date) {
+            $.ajax({
+                url: $('#serviceSelect').data('slotsUrl'),
+                data: {
+                    'service_id': serviceId,
+                    'date': date
+                },
+                dataType: 'json',
+                success: function(data) {
+                    console.log('Received data:', data);
+                    updateTimeSlots(data);
+                },
+                error: function(jqXHR, textStatus, errorThrown) {
+                    console.error('AJAX error:', textStatus, errorThrown);
+                    alert('Error fetching time slots. Please try again.');
+                }
+            });
+        } else {
+            console.log('Service ID or Date not selected');
+            updateTimeSlots({available_slots: []});
+        }
+    });
+});
+
+// Privacy policy agreement
+document.addEventListener('DOMContentLoaded', function() {
+    var showPrivacyModal = document.getElementById('privacyModal').dataset.showOnLoad === 'true';
+    var privacyModal = new bootstrap.Modal(document.getElementById('privacyModal'), {
+        backdrop: 'static',
+        keyboard: false
+    });
+    var agreeCheckbox = document.getElementById('agreeCheckbox');
+    var agreeButton = document.getElementById('agreeButton');
+
+    if (showPrivacyModal) {
+        privacyModal.show();
+    }
+
+    agreeCheckbox.addEventListener('change', function() {
+        agreeButton.disabled = !this.checked;
+    });
+
+    agreeButton.addEventListener('click', function() {
+        if (agreeCheckbox.checked) {
+            // You might want to send an AJAX request here to update the user's agreement status
+            privacyModal.hide();
+        }
+    });
+});
+
+// Open the gallery carousel at the clicked image
+document.addEventListener('DOMContentLoaded', function() {
+  var galleryModal = document.getElementById('galleryModal');
+  var carousel = document.getElementById('galleryCarousel');
+
+  galleryModal.addEventListener('show.bs.modal', function(event) {
+    var button = event.relatedTarget;
+    var slideIndex = button.getAttribute('data-bs-slide-to');
+    var carouselInstance = bootstrap.Carousel.getInstance(carousel);
+    carouselInstance.to(parseInt(slideIndex));
+  });
+});
+
+// Load further gallery pages as the visitor scrolls towards the end of the gallery
+document.addEventListener('DOMContentLoaded', function() {
+  var grid = document.getElementById('galleryGrid');
+  var carouselInner = document.getElementById('galleryCarouselInner');
+  var sentinel = document.getElementById('gallerySentinel');
+  var loading = false;
+
+  function createImage(image, className, sizes) {
+    var img = document.createElement('img');
+    img.src = image.src;
+    img.srcset = image.srcset;
+    img.sizes = sizes;
+    if (image.width) {
+      img.width = image.width;
+      img.height = image.height;
+    }
+    img.loading = 'lazy';
+    img.className = className;
+    return img;
+  }
+
+  function addImage(image) {
+    var index = grid.children.length;
+
+    var column = document.createElement('div');
+    column.className = 'col-md-4 col-lg-3 mb-4';
+    var card = document.createElement('div');
+    card.className = 'card';
+    var thumbnail = createImage(image, 'img-thumbnail gallery-image',
+                                '(min-width: 992px) 25vw, (min-width: 768px) 33vw, 100vw');
+    thumbnail.alt = 'Clinic Image ' + (index + 1);
+    thumbnail.style.height = '300px';
+    thumbnail.style.objectFit = 'cover';
+    thumbnail.setAttribute('data-bs-toggle', 'modal');
+    thumbnail.setAttribute('data-bs-target', '#galleryModal');
+    thumbnail.setAttribute('data-bs-slide-to', index);
+    card.appendChild(thumbnail);
+    column.appendChild(card);
+    grid.appendChild(column);
+
+    var item = document.createElement('div');
+    item.className = 'carousel-item' + (index === 0 ? ' active' : '');
+    var slide = createImage(image, 'd-block w-100', '100vw');
+    slide.alt = 'Clinic Image ' + (index + 1);
+    item.appendChild(slide);
+    carouselInner.appendChild(item);
+  }
+
+  var observer = new IntersectionObserver(function(entries) {
+    if (!entries[0].isIntersecting || loading || !grid.dataset.nextCursor) {
+      return;
+    }
+    loading = true;
+    fetch(grid.dataset.url + '?cursor=' + encodeURIComponent(grid.dataset.nextCursor))
+      .then(function(response) { return response.json(); })
+      .then(function(data) {
+        data.images.forEach(addImage);
+        grid.dataset.nextCursor = data.next_cursor || '';
+        loading = false;
+        // Re-observe so a sentinel that is still visible triggers the next page
+        observer.unobserve(sentinel);
+        if (grid.dataset.nextCursor) {
+          observer.observe(sentinel);
+        }
+      })
+      .catch(function() { loading = false; });
+  }, {rootMargin: '400px'});
+
+  if (grid.dataset.nextCursor) {
+    observer.observe(sentinel);
+  }
+});
+
+// Open the services carousel at the clicked service
+document.addEventListener('DOMContentLoaded', function() {
+  var servicesModal = document.getElementById('servicesModal');
+  var carousel = document.getElementById('servicesCarousel');
+
+  servicesModal.addEventListener('show.bs.modal', function(event) {
+    var button = event.relatedTarget;
+    var slideIndex = button.getAttribute('data-bs-slide-to');
+    var carouselInstance = bootstrap.Carousel.getInstance(carousel);
+    carouselInstance.to(parseInt(slideIndex));
+  });
+});
@@ -1,3 +1,57 @@
-from django.test import TestCase
+import re
 
-# Create your tests here.
+from django.core import mail
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from backend.caching import CSRF_PLACEHOLDER, landing_page_cache_key
+
+CSRF_INPUT = re.compile(r'name="csrfmiddlewaretoken" value="([^"]*)"')
+
+
+# Tests run with DEBUG off, where the manifest storage needs a collectstatic run first
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class LandingPageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def get_landing_page(self, client):
+        response = client.get(reverse('client_dashboard'))
+        self.assertEqual(response.status_code, 200)
+        html = response.content.decode()
+        self.assertNotIn(CSRF_PLACEHOLDER, html)
+        tokens = set(CSRF_INPUT.findall(html))
+        self.assertEqual(len(tokens), 1)
+        return tokens.pop()
+
+    def send_contact_message(self, client, token):
+        return client.post(reverse('client_contact'), {
+            'name': 'Visitor', 'email': 'visitor@example.com', 'message': 'Hello',
+            'csrfmiddlewaretoken': token,
+        })
+
+    def test_cached_page_gets_a_token_for_each_visitor(self):
+        first_visitor = Client(enforce_csrf_checks=True)
+        first_token = self.get_landing_page(first_visitor)
+        self.assertIn(CSRF_PLACEHOLDER, cache.get(landing_page_cache_key()))
+
+        second_visitor = Client(enforce_csrf_checks=True)
+        with self.assertNumQueries(0):
+            second_token = self.get_landing_page(second_visitor)
+        self.assertNotEqual(second_token, first_token)
+        self.assertIn('csrftoken', second_visitor.cookies)
+
+        response = self.send_contact_message(second_visitor, second_token)
+        self.assertRedirects(response, reverse('client_dashboard'), fetch_redirect_response=False)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_token_from_another_visitors_page_is_rejected(self):
+        first_token = self.get_landing_page(Client(enforce_csrf_checks=True))
+        second_visitor = Client(enforce_csrf_checks=True)
+        self.get_landing_page(second_visitor)
+
+        response = self.send_contact_message(second_visitor, first_token)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(len(mail.outbox), 0)
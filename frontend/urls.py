@@ -1,10 +1,12 @@
 from django.urls import path
 
-from backend.views import get_available_time_slots
+from backend.views import gallery_images, get_available_time_slots
 from .views import *
 
 urlpatterns = [
     path('', view_client_dashboard, name='client_dashboard'),
+    path('book-appointment/', book_appointment, name='client_book_appointment'),
+    path('contact/', send_contact_message, name='client_contact'),
     path('profile/', view_client_profile, name='client_profile'),
     path('login/', client_login, name='client_login'),
     path('register/', client_register, name='client_register'),
@@ -14,4 +16,5 @@ urlpatterns = [
     path('logout/', client_logout, name='client_logout'),
 
     path('get-available-time-slots/', get_available_time_slots, name='client_get_available_time_slots'),
+    path('gallery-images/', gallery_images, name='client_gallery_images'),
     ]
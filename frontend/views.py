@@ -1,24 +1,44 @@
+from asgiref.sync import sync_to_async
 from django.contrib import messages
-from django.contrib.auth import logout, authenticate, login
+from django.contrib.auth import logout, authenticate, login, get_user
 from django.contrib.auth.decorators import login_required
 from django.db.models import Q
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotAllowed
 from django.shortcuts import render, redirect
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
-
-from backend.models import *
-from django.core.mail import send_mail
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+
+from backend.archive import appointment_history
+from backend.caching import (CONTENT_CACHE_TIMEOUT, GALLERY, SERVICES, get_content_versions, insert_csrf_token,
+                             landing_page_cache_key, strip_csrf_tokens)
+from backend.catalogue import service_catalogue
+from backend.emails import send_email
+from backend.models import Appointment, MedicalQuestionnaire, User
+from backend.query_inspector import query_budget
+from backend.recaptcha import RecaptchaUnavailable, get_recaptcha_client
+from backend.views import get_gallery_page
 from django.conf import settings
 from django.urls import reverse
-from datetime import datetime, timedelta, date
-import requests
+from datetime import datetime
 
 
+@query_budget(8)
 def view_client_dashboard(request):
     # Check if the user is admin
     if request.user.is_superuser:
         return redirect('client_login')
 
+    # Anonymous visitors all see the same page, so serve it whole from the cache
+    # unless there are messages to show
+    cache_key = None
+    if not request.user.is_authenticated and not len(messages.get_messages(request)):
+        cache_key = landing_page_cache_key()
+        html = cache.get(cache_key)
+        if html is not None:
+            return landing_page_response(request, HttpResponse(insert_csrf_token(request, html)))
+
     if request.user.is_authenticated:
         # Check previous unattended appointments
         now = timezone.localtime(timezone.now())
@@ -32,94 +52,19 @@ def view_client_dashboard(request):
         )
 
         # Mark appointments as missed and increment counter
-        for unattended_appointment in unattended_appointments:
-            unattended_appointment.missed_counted = True
-            unattended_appointment.save()
-            request.user.increment_missed_appointments()
-
-        # Check if the user's account is restricted
-        request.user.update_restriction_status()
+        missed_count = unattended_appointments.update(missed_counted=True)
+        if missed_count:
+            request.user.increment_missed_appointments(missed_count)
 
-    if request.method == 'POST':
-        service_id = request.POST.get('service')
-
-        if service_id:
-            date_str = request.POST.get('date')
-            time_slot = request.POST.get('time_slot')
-            recaptcha_response = request.POST.get('g-recaptcha-response')
-
-            # Verify reCAPTCHA
-            verify_url = 'https://www.google.com/recaptcha/api/siteverify'
-            values = {
-                'secret': settings.RECAPTCHA_PRIVATE_KEY,
-                'response': recaptcha_response
-            }
-            response = requests.post(verify_url, data=values)
-            result = response.json()
-
-            if result['success']:
-
-                # Assuming that user_id and service_id refers to the User and Service model's primary key
-                user = User.objects.get(pk=request.user.id)
-                service = Service.objects.get(pk=service_id)
-
-                # Parse the time slot
-                start_time, end_time = time_slot.split(' - ')
-                start_time = datetime.strptime(start_time, '%I:%M %p').time()
-                end_time = datetime.strptime(end_time, '%I:%M %p').time()
-
-                if request.user.is_restricted:
-                    messages.error(request,
-                                   f'Account restricted until {request.user.restriction_end_time.strftime("%m/%d/%Y %I:%M %p")}')
-                else:
-                    # Create the appointment
-                    appointment = Appointment(
-                        user=user,
-                        service=service,
-                        date=date_str,
-                        start_time=start_time,
-                        end_time=end_time,
-                    )
-                    appointment.save()
-                    messages.success(request, 'Appointment added successfully.')
-            else:
-                messages.error(request, 'Invalid reCAPTCHA. Please try again.')
-
-            return redirect('client_dashboard')
-        else:
-            name = request.POST.get('name')
-            email = request.POST.get('email')
-            message = request.POST.get('message')
-
-            html_message = render_to_string('contact_form_email_template.html', {
-                'name': name,
-                'email': email,
-                'message': message,
-            })
-            plain_message = strip_tags(html_message)
-
-            subject = f"New Contact Form Submission from {name}"
-
-            # Send email
-            try:
-                send_mail(
-                    subject=subject,
-                    message=plain_message,
-                    from_email=settings.EMAIL_HOST_USER,
-                    recipient_list=[settings.EMAIL_HOST_USER],
-                    html_message=html_message,
-                    fail_silently=False,
-                )
-                messages.success(request, 'Your message has been sent successfully. We will get back to you soon.')
-            except Exception as e:
-                messages.error(request, 'An error occurred while sending your message. Please try again later.')
-
-    services = Service.objects.all()
-    images = GalleryImage.objects.all()
+    # The gallery is lazy, so nothing is queried when the template's cached fragment is used
+    services = service_catalogue.all()
+    gallery_page = SimpleLazyObject(get_gallery_page)
+    images = SimpleLazyObject(lambda: gallery_page[0])
+    gallery_next_cursor = SimpleLazyObject(lambda: gallery_page[1])
 
     # Check if the user is authenticated before filtering appointments
     if request.user.is_authenticated:
-        appointments = Appointment.objects.filter(user=request.user)
+        appointments = appointment_history(request.user, include_archived=request.GET.get('history') == 'all')
     else:
         appointments = None
 
@@ -128,19 +73,108 @@ def view_client_dashboard(request):
     if request.user.is_authenticated and not request.user.has_agreed_privacy_policy:
         show_privacy_modal = True
         request.user.has_agreed_privacy_policy = True
-        request.user.save()
+        request.user.save(update_fields=['has_agreed_privacy_policy'])
 
     context = {
         'services': services,
         'images': images,
+        'gallery_next_cursor': gallery_next_cursor,
         'appointments': appointments,
         'recaptcha_site_key': settings.RECAPTCHA_PUBLIC_KEY,
         'show_privacy_modal': show_privacy_modal,
+        'content_versions': get_content_versions(SERVICES, GALLERY),
+        'content_cache_timeout': CONTENT_CACHE_TIMEOUT,
     }
-    return render(request, 'client_dashboard.html', context)
+    response = render(request, 'client_dashboard.html', context)
+
+    if cache_key:
+        cache.set(cache_key, strip_csrf_tokens(response.content.decode()), CONTENT_CACHE_TIMEOUT)
+    return landing_page_response(request, response)
+
+
+def landing_page_response(request, response):
+    # The page embeds a per-visitor CSRF token and, once logged in, the visitor's own
+    # appointments, so browsers must revalidate it and shared caches must not keep it
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Cookie'])
+    return response
+
+
+async def book_appointment(request):
+    # Async so the reCAPTCHA round trip does not hold a worker thread
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    # request.user loads lazily from the database, so resolve it off the event loop
+    user = await sync_to_async(get_user)(request)
+    if not user.is_authenticated or user.is_superuser:
+        return redirect('client_login')
+
+    service_id = request.POST.get('service')
+    date_str = request.POST.get('date')
+    time_slot = request.POST.get('time_slot')
+    recaptcha_response = request.POST.get('g-recaptcha-response')
+
+    # Verify reCAPTCHA
+    try:
+        recaptcha_verified = await sync_to_async(get_recaptcha_client().verify, thread_sensitive=False)(
+            recaptcha_response, remote_ip=request.META.get('REMOTE_ADDR'))
+    except RecaptchaUnavailable:
+        messages.error(request, 'We could not verify the reCAPTCHA right now. Please try again later.')
+        return redirect('client_dashboard')
+
+    if recaptcha_verified:
+        service = await service_catalogue.aget(service_id)
+
+        # Parse the time slot
+        start_time, end_time = time_slot.split(' - ')
+        start_time = datetime.strptime(start_time, '%I:%M %p').time()
+        end_time = datetime.strptime(end_time, '%I:%M %p').time()
+
+        if user.is_restricted:
+            messages.error(request,
+                           f'Account restricted until {user.restriction_end_time.strftime("%m/%d/%Y %I:%M %p")}')
+        else:
+            # Create the appointment
+            await Appointment.objects.acreate(
+                user=user,
+                service=service,
+                date=date_str,
+                start_time=start_time,
+                end_time=end_time,
+            )
+            messages.success(request, 'Appointment added successfully.')
+    else:
+        messages.error(request, 'Invalid reCAPTCHA. Please try again.')
+
+    return redirect('client_dashboard')
+
+
+async def send_contact_message(request):
+    # Async so the SMTP send does not hold a worker thread
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    name = request.POST.get('name')
+    email = request.POST.get('email')
+    message = request.POST.get('message')
+
+    # Send email
+    try:
+        await sync_to_async(send_email, thread_sensitive=False)('contact_form', {
+            'name': name,
+            'email': email,
+            'message': message,
+        }, [settings.EMAIL_HOST_USER])
+        messages.success(request, 'Your message has been sent successfully. We will get back to you soon.')
+    except Exception:
+        messages.error(request, 'An error occurred while sending your message. Please try again later.')
+
+    return redirect('client_dashboard')
 
 
 @login_required(login_url='client_login')
+@query_budget(8)
 def view_client_profile(request):
     # Check if the user is admin
     if request.user.is_superuser:
@@ -187,63 +221,17 @@ def view_client_profile(request):
 
         else:
             # Update medical questionnaire
-            medical_questionnaire.physician_care = request.POST.get('q1') == 'Yes'
-            medical_questionnaire.high_blood_pressure = request.POST.get('q2') == 'Yes'
-            medical_questionnaire.heart_disease = request.POST.get('q3') == 'Yes'
-            medical_questionnaire.allergic = request.POST.get('q4') == 'Yes'
-            medical_questionnaire.diabetes = request.POST.get('q5') == 'Yes'
-            medical_questionnaire.blood_disease = request.POST.get('q6') == 'Yes'
-            medical_questionnaire.bleeder = request.POST.get('q7') == 'Yes'
-            medical_questionnaire.excessive_bleeding = request.POST.get('q8') == 'Yes'
-            medical_questionnaire.recent_infection = request.POST.get('q9') == 'Yes'
-            medical_questionnaire.anesthetic_reactions = request.POST.get('q10') == 'Yes'
-            medical_questionnaire.previous_dental_surgery = request.POST.get('q11') == 'Yes'
-            medical_questionnaire.health_impression = request.POST.get('q12')
-
+            medical_questionnaire.set_answers_from(request.POST)
             medical_questionnaire.save()
 
             messages.success(request, 'Your medical information have been updated successfully.')
             return redirect('client_profile')
 
     # Prepare medical questions for the template
-    medical_questions = [
-        {'text': 'Are you under physician\'s care?', 'type': 'yes_no',
-         'answer': 'Yes' if medical_questionnaire.physician_care else (
-             'No' if medical_questionnaire.physician_care is not None else '')},
-        {'text': 'Do you have high blood pressure?', 'type': 'yes_no',
-         'answer': 'Yes' if medical_questionnaire.high_blood_pressure else (
-             'No' if medical_questionnaire.high_blood_pressure is not None else '')},
-        {'text': 'Do you have heart disease?', 'type': 'yes_no',
-         'answer': 'Yes' if medical_questionnaire.heart_disease else (
-             'No' if medical_questionnaire.heart_disease is not None else '')},
-        {'text': 'Are you allergic to any drugs, medicine, foods, anesthetics?', 'type': 'yes_no',
-         'answer': 'Yes' if medical_questionnaire.allergic else (
-             'No' if medical_questionnaire.allergic is not None else '')},
-        {'text': 'Do you have diabetes?', 'type': 'yes_no', 'answer': 'Yes' if medical_questionnaire.diabetes else (
-            'No' if medical_questionnaire.diabetes is not None else '')},
-        {'text': 'Do you have any blood disease?', 'type': 'yes_no',
-         'answer': 'Yes' if medical_questionnaire.blood_disease else (
-             'No' if medical_questionnaire.blood_disease is not None else '')},
-        {'text': 'Are you a bleeder?', 'type': 'yes_no', 'answer': 'Yes' if medical_questionnaire.bleeder else (
-            'No' if medical_questionnaire.bleeder is not None else '')},
-        {'text': 'Have you experienced excessive bleeding after tooth extraction?', 'type': 'yes_no',
-         'answer': 'Yes' if medical_questionnaire.excessive_bleeding else (
-             'No' if medical_questionnaire.excessive_bleeding is not None else '')},
-        {'text': 'Have you or have you recently had evidence of infection such as boils, infected wounds?',
-         'type': 'yes_no', 'answer': 'Yes' if medical_questionnaire.recent_infection else (
-            'No' if medical_questionnaire.recent_infection is not None else '')},
-        {'text': 'Have you ever had any reactions from local anesthetics?', 'type': 'yes_no',
-         'answer': 'Yes' if medical_questionnaire.anesthetic_reactions else (
-             'No' if medical_questionnaire.anesthetic_reactions is not None else '')},
-        {'text': 'Have you had any dental surgery before?', 'type': 'yes_no',
-         'answer': 'Yes' if medical_questionnaire.previous_dental_surgery else (
-             'No' if medical_questionnaire.previous_dental_surgery is not None else '')},
-        {'text': 'What is your impression of your present health?', 'type': 'health_status',
-         'answer': medical_questionnaire.health_impression or ''},
-    ]
+    medical_questions = medical_questionnaire.get_questions()
 
     context = {
-        'user': request.user,
+        'user': user,
         'medical_questions': medical_questions,
     }
     return render(request, 'client_profile.html', context)
@@ -312,32 +300,19 @@ def client_register(request):
             age=age,
         )
         user.set_password(password)
-        user.generate_verification_token()
         user.save()
+        token = user.generate_verification_token()
 
         # Send verification email
         verification_link = request.build_absolute_uri(
-            reverse('client_verify_email', args=[user.verification_token])
+            reverse('client_verify_email', args=[token])
         )
 
-        # Render the HTML template
-        html_message = render_to_string('email_verification_template.html', {
+        # Send the email
+        send_email('email_verification', {
             'user': user,
             'verification_link': verification_link,
-        })
-
-        # Create a plain text version of the HTML email
-        plain_message = strip_tags(html_message)
-
-        # Send the email
-        send_mail(
-            subject='Verify Your Email - Jaylon Dental Clinic',
-            message=plain_message,
-            from_email=settings.EMAIL_HOST_USER,
-            recipient_list=[user.email],
-            html_message=html_message,
-            fail_silently=False,
-        )
+        }, [user.email])
 
         messages.success(request, 'Registration successful. Please check your email to verify your account.')
         return redirect('client_login')
@@ -347,28 +322,18 @@ def client_register(request):
 
 def verify_email(request, token):
     try:
-        user = User.objects.get(verification_token=token)
-
-        # Check if the verification token has a creation time
-        if user.verification_token_created:
-            token_age = timezone.localtime(timezone.now()) - user.verification_token_created
-            if token_age > timedelta(hours=24):
-                messages.error(request, 'Verification link has expired. Please request a new one.')
-                return redirect('client_register')
-        else:
-            # If there's no creation time, we can't verify the token age
-            messages.error(request, 'Invalid verification token. Please request a new one.')
-            return redirect('client_register')
+        # The lookup only matches tokens younger than TOKEN_LIFETIME
+        user = User.objects.get_by_verification_token(token)
 
         # If we get here, the token is valid
         user.email_verified = True
-        user.verification_token = None
+        user.verification_token_hash = None
         user.verification_token_created = None
         user.save()
         messages.success(request, 'Your email has been verified. You can now log in.')
         return redirect('client_login')
     except User.DoesNotExist:
-        messages.error(request, 'Invalid verification token.')
+        messages.error(request, 'Invalid or expired verification link.')
         return redirect('client_login')
 
 
@@ -378,30 +343,17 @@ def client_forgot_password(request):
         try:
             user = User.objects.get(email=email, is_superuser=False)
             # Generate a random token
-            token = get_random_string(length=32)
-            user.password_reset_token = token
-            user.password_reset_token_created = datetime.now()
-            user.save()
+            token = user.generate_password_reset_token()
 
             # Send password reset email
             reset_link = request.build_absolute_uri(
                 reverse('client_reset_password', args=[token])
             )
 
-            html_message = render_to_string('password_reset_email_template.html', {
+            send_email('password_reset', {
                 'user': user,
                 'reset_link': reset_link,
-            })
-            plain_message = strip_tags(html_message)
-
-            send_mail(
-                subject='Reset Your Password - Jaylon Dental Clinic',
-                message=plain_message,
-                from_email=settings.EMAIL_HOST_USER,
-                recipient_list=[user.email],
-                html_message=html_message,
-                fail_silently=False,
-            )
+            }, [user.email])
 
             messages.success(request, 'Password reset instructions have been sent to your email.')
             return redirect('client_login')
@@ -413,14 +365,14 @@ def client_forgot_password(request):
 
 def client_reset_password(request, token):
     try:
-        user = User.objects.get(password_reset_token=token, is_superuser=False)
+        user = User.objects.get_by_password_reset_token(token, is_superuser=False)
         if request.method == 'POST':
             new_password = request.POST.get('new_password')
             confirm_password = request.POST.get('confirm_password')
 
             if new_password == confirm_password:
                 user.set_password(new_password)
-                user.password_reset_token = None
+                user.password_reset_token_hash = None
                 user.password_reset_token_created = None
                 user.save()
                 messages.success(request,
@@ -430,7 +382,7 @@ def client_reset_password(request, token):
                 messages.error(request, 'Passwords do not match.')
         return render(request, 'client_reset_password.html')
     except User.DoesNotExist:
-        messages.error(request, 'Invalid password reset token.')
+        messages.error(request, 'Invalid or expired password reset token.')
         return redirect('client_login')
 
 
@@ -9,8 +9,15 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'main_system.settings')
 
 application = get_asgi_application()
+
+# Add the metrics still pending when the process exits
+if settings.METRICS_ENABLED:
+    from backend.metrics import flush_at_exit
+
+    flush_at_exit()
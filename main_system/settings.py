@@ -19,7 +19,8 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # See https://docs.djangoproject.com/en/4.2/howto/deployment/checklist/
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure--vq!j-qjnq#_1*wn8e(^&q-vd=bn=%ar43gz1gjul2fvhlaflq'
+# Set the SECRET_KEY variable in production; the committed key is public and only fit for local development
+SECRET_KEY = os.environ.get('SECRET_KEY', 'django-insecure--vq!j-qjnq#_1*wn8e(^&q-vd=bn=%ar43gz1gjul2fvhlaflq')
 
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
@@ -37,19 +38,25 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'backend',
     'frontend',
+    # Only the storage backend is used; the 'cloudinary' app's model fields, forms and template
+    # tags are not, and would add the SDK's uploader and forms to every cold start
     'cloudinary_storage',
-    'cloudinary',
     'captcha',
     'django_crontab',
 ]
 
 MIDDLEWARE = [
+    'backend.metrics.MetricsMiddleware',
+    'backend.server_timing.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'backend.query_inspector.QueryInstrumentationMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'backend.db_routers.ReplicaPinningMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'backend.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -58,7 +65,7 @@ ROOT_URLCONF = 'main_system.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'backend.server_timing.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -77,23 +84,98 @@ WSGI_APPLICATION = 'main_system.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# The DATABASE_* variables point a local or CI run at another Postgres, e.g. for load tests
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'verceldb',
-        'USER': 'default',
-        'PASSWORD': 'lbCEqn5KGXD4',
-        'HOST': 'ep-quiet-sound-a1wv4pst-pooler.ap-southeast-1.aws.neon.tech',
-        'PORT': '5432',
+        'NAME': os.environ.get('DATABASE_NAME', 'verceldb'),
+        'USER': os.environ.get('DATABASE_USER', 'default'),
+        'PASSWORD': os.environ.get('DATABASE_PASSWORD', 'lbCEqn5KGXD4'),
+        'HOST': os.environ.get('DATABASE_HOST', 'ep-quiet-sound-a1wv4pst-pooler.ap-southeast-1.aws.neon.tech'),
+        'PORT': os.environ.get('DATABASE_PORT', '5432'),
+        # Keep the connection between requests, so a warm instance (and the first request after
+        # the warm-up) skips the TLS handshake to the pooler; checked before reuse
+        'CONN_MAX_AGE': int(os.environ.get('DATABASE_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
-# DATABASES = {
-#     'default': {
-#         'ENGINE': 'django.db.backends.sqlite3',
-#         'NAME': BASE_DIR / 'db.sqlite3',
-#     }
-# }
+# Set DATABASE_SQLITE_PATH to use a SQLite file instead, e.g. for tests and offline runs
+if os.environ.get('DATABASE_SQLITE_PATH'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ['DATABASE_SQLITE_PATH'],
+        }
+    }
+
+# Optional read replica for reporting views (dashboard stats, charts and exports, screening).
+# Set DATABASE_REPLICA_HOST to a read replica endpoint to enable it. Locally, set
+# DATABASE_REPLICA_SQLITE_PATH to a copy of the SQLite database to stand in for one.
+# Tests read the replica through the test database either way.
+if os.environ.get('DATABASE_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.environ['DATABASE_REPLICA_HOST'],
+        'TEST': {'MIRROR': 'default'},
+    }
+elif os.environ.get('DATABASE_REPLICA_SQLITE_PATH'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['DATABASE_REPLICA_SQLITE_PATH'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['backend.db_routers.PrimaryReplicaRouter']
+
+# Seconds a visitor's reports keep reading from the primary after they write
+REPLICA_LAG_WINDOW = 10
+
+# Per-request query counts, N+1 warnings and query budgets (backend.query_inspector)
+QUERY_INSTRUMENTATION = DEBUG
+# Add X-DB-Query-Count, X-DB-Time-Ms and X-DB-Repeated-Queries to every response
+QUERY_INSTRUMENTATION_HEADERS = False
+# Raise instead of logging when a view goes over its query budget; turn on when testing
+QUERY_BUDGET_STRICT = False
+# Runs of one query that count as a possible N+1
+N_PLUS_ONE_THRESHOLD = 3
+
+# Request, external call and slot computation metrics, served at /metrics (backend.metrics)
+METRICS_ENABLED = True
+# Add a process's observations to the totals shared in the database after a response
+# once they are this many seconds old, or this many observations have built up. A serverless
+# instance can be frozen and dropped without warning, so keep both small
+METRICS_FLUSH_INTERVAL = 10
+METRICS_FLUSH_MAX_PENDING = 200
+# Bearer token for scrapers; superusers can always read the endpoint
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Server-Timing header with database, template, cache and external call time (backend.server_timing)
+SERVER_TIMING_ENABLED = True
+# Send the header to every visitor instead of only to staff. It shows how long the database and
+# external calls took, so only turn it on deliberately, e.g. SERVER_TIMING_PUBLIC=true for a local profile
+SERVER_TIMING_PUBLIC = os.environ.get('SERVER_TIMING_PUBLIC') == 'true'
+
+# Load the URLconf and templates, connect to the database and load the service catalogue when
+# main_system.wsgi is imported, rather than during a new process's first request (backend.cold_start).
+# On by default only on Vercel (which sets VERCEL), so runserver and other tooling that imports the
+# WSGI module do not connect to the database up front; set WARM_UP_ON_START=true or false to choose
+WARM_UP_ON_START = os.environ.get('WARM_UP_ON_START', 'true' if os.environ.get('VERCEL') else 'false') == 'true'
+
+# Superusers can profile a single request with ?_profile=json|folded (backend.profiling)
+PROFILING_ENABLED = True
+# Seconds between stack samples while a request is profiled
+PROFILING_INTERVAL = 0.001
+
+# Vercel sends this as `Authorization: Bearer <CRON_SECRET>` with every cron request; the cron
+# endpoints refuse requests without it, and refuse everything while it is unset
+CRON_SECRET = os.environ.get('CRON_SECRET')
+
+# Appointments older than this many days are moved to the archive table (backend.archive)
+APPOINTMENT_ARCHIVE_AFTER_DAYS = 365 * 2
+# Appointments moved per transaction, and batches per run of the daily cron
+APPOINTMENT_ARCHIVE_BATCH_SIZE = 1000
+APPOINTMENT_ARCHIVE_CRON_BATCHES = 20
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -135,7 +217,9 @@ STATICFILES_DIRS = [
 STATIC_URL = 'static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+# Minified, fingerprinted and compressed at collectstatic time; WhiteNoise serves the
+# fingerprinted files with far-future cache headers
+STATICFILES_STORAGE = 'backend.storage.MinifiedStaticFilesStorage'
 
 # Path where media is stored
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
@@ -148,9 +232,19 @@ CLOUDINARY_STORAGE = {
     'API_SECRET': 'IKhwkkE6aiUdHZkICLig0UfGTn0',
 }
 
-DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
+# Set MEDIA_STORAGE=local for tests and offline runs; media is then kept under MEDIA_ROOT,
+# deduplicated by content, and served from MEDIA_URL while DEBUG is on
+MEDIA_STORAGES = {
+    'cloudinary': 'cloudinary_storage.storage.MediaCloudinaryStorage',
+    'local': 'backend.storage.ContentAddressedStorage',
+}
+DEFAULT_FILE_STORAGE = MEDIA_STORAGES[os.environ.get('MEDIA_STORAGE', 'cloudinary')]
+
+# Stream uploads to a temporary file instead of buffering them in memory
+FILE_UPLOAD_HANDLERS = ['django.core.files.uploadhandler.TemporaryFileUploadHandler']
 
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# Set EMAIL_BACKEND=django.core.mail.backends.console.EmailBackend for local and load test runs
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
@@ -164,6 +258,30 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'backend.User'
 
+# Load only the columns request.user needs on every request
+AUTHENTICATION_BACKENDS = ['backend.auth_backends.DeferredUserBackend']
+
+# Per-process cache for landing page content, reCAPTCHA results and other short-lived data.
+# Point this at a shared backend (e.g. Redis) to share entries and invalidations across instances;
+# mix backend.server_timing.TimedCacheMixin into it to keep its time in the Server-Timing header.
+CACHES = {
+    'default': {
+        'BACKEND': 'backend.server_timing.TimedLocMemCache',
+        'LOCATION': 'jaylon-dental',
+    }
+}
+
+# Keep sessions in a signed cookie so no request needs a session table lookup. Anyone holding
+# SECRET_KEY can forge such a cookie, so only do it with a key set in the environment; with the
+# committed key, keep sessions server-side behind the cache instead.
+if os.environ.get('SECRET_KEY'):
+    SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
+else:
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
 RECAPTCHA_PUBLIC_KEY = '6Leo2DoqAAAAACUR34lbpAwji0nYFC5dMET-ldUL'
 RECAPTCHA_PRIVATE_KEY = '6Leo2DoqAAAAAKBzO3UwBwB8KvahQN4s2DcIWF98'
 RECAPTCHA_REQUIRED_SCORE = 0.85
+# Set the RECAPTCHA_VERIFY_URL variable to `manage.py recaptcha_stub_server`'s address for local and load test runs
+RECAPTCHA_VERIFY_URL = os.environ.get('RECAPTCHA_VERIFY_URL', 'https://www.google.com/recaptcha/api/siteverify')
+RECAPTCHA_TIMEOUT = 3  # Seconds
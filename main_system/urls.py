@@ -3,13 +3,16 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
-from backend.cron_views import cancel_unattended_appointments
+from backend.cron_views import cancel_unattended_appointments, purge_expired_tokens
+from backend.metrics import metrics
 
 urlpatterns = [
     path('main-admin/', admin.site.urls),
     path('admin/', include('backend.urls')),
     path('', include('frontend.urls')),
     path('api/cron/cancel_appointments', cancel_unattended_appointments),
+    path('api/cron/purge_expired_tokens', purge_expired_tokens),
+    path('metrics', metrics, name='metrics'),
 ]
 
 if settings.DEBUG:
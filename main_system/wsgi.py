@@ -9,10 +9,23 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'main_system.settings')
 
 application = get_wsgi_application()
 
+# Add the metrics still pending when the process exits
+if settings.METRICS_ENABLED:
+    from backend.metrics import flush_at_exit
+
+    flush_at_exit()
+
+# Do a new process's one-off work now rather than during its first request
+if settings.WARM_UP_ON_START:
+    from backend.cold_start import warm_up
+
+    warm_up()
+
 app = application